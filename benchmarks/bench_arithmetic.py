@@ -0,0 +1,57 @@
+# Anthony Krivonos
+# benchmarks/bench_arithmetic.py
+
+# Imports
+import sys
+import timeit
+sys.path.append('src')
+
+# NumPy
+import numpy as np
+
+# Math
+from mathematics import *
+
+# Abstract: Micro-benchmark of the per-operation cost of each Math arithmetic backend.
+#           Run from the project root with `python3 benchmarks/bench_arithmetic.py`.
+
+# Number of operations timed per measurement
+OPERATIONS = 20000
+
+# legacy_mul:Float
+# NOTE: The previous p_mul implementation, timed for comparison when mpmath and sympy are installed.
+def legacy_mul():
+    try:
+        from mpmath import mp, fmul, mpmathify
+        from sympy import Float
+    except ImportError:
+        return None
+    mp.dps = EPSILON
+    return lambda a, b: float(Float(str(fmul(mpmathify(a), mpmathify(b))), EPSILON))
+
+# per_op:Float
+# param fn:Function() => Function performing `count` operations.
+# param count:Integer => Number of operations performed by each call of fn.
+# returns The best observed time per operation, in microseconds.
+def per_op(fn, count):
+    return min(timeit.repeat(fn, number=1, repeat=5)) / count * 1e6
+
+def main():
+    a = np.random.uniform(1, 500, OPERATIONS)
+    b = np.random.uniform(0.5, 2, OPERATIONS)
+    scalars = list(zip(a.tolist(), b.tolist()))
+
+    rows = []
+    legacy = legacy_mul()
+    if legacy is not None:
+        rows.append(('mpmath/sympy scalar', per_op(lambda: [ legacy(x, y) for x, y in scalars[:2000] ], 2000)))
+    for name, backend in [ ('decimal', DecimalArithmetic()), ('float', FloatArithmetic()) ]:
+        rows.append((name + ' scalar', per_op(lambda: [ backend.mul(x, y) for x, y in scalars ], OPERATIONS)))
+        rows.append((name + ' array', per_op(lambda: backend.mul(a, b), OPERATIONS)))
+
+    print('%-22s %12s' % ('p_mul backend', 'us/op'))
+    for name, cost in rows:
+        print('%-22s %12.4f' % (name, cost))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Anthony Krivonos
+# benchmarks/fixtures.py
+
+# Imports
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# NumPy
+import numpy as np
+
+# Local Imports
+from query import *
+from enums import *
+from metrics import *
+from models import *
+from algorithms import *
+from backtest import *
+from synthetic import *
+
+# Abstract: Offline synthetic market and algorithm used by the benchmark suite, so it runs without credentials or network.
+
+# Number of 5-minute bars in a regular trading day
+BARS_PER_DAY = SyntheticMarket.bars_per_session(Span.FIVE_MINUTE)
+
+# Number of trading days in a year
+DAYS_PER_YEAR = SESSIONS_PER_YEAR
+
+class Market(SyntheticMarket):
+
+    # __init__:Void
+    # param symbol_count:Integer => Number of symbols, named 'S0000', 'S0001', ...
+    # param bar_count:Integer => Number of 5-minute bars per symbol, rounded up to whole sessions.
+    # param seed:Integer => Seed of the generated bars, so every run sees the same data.
+    # NOTE: Acts as a Robinhood client for Query (see its trader parameter). Bars are generated on first use.
+    def __init__(self, symbol_count, bar_count, seed = 0):
+        SyntheticMarket.__init__(self, symbol_count, -(-bar_count // BARS_PER_DAY), Span.FIVE_MINUTE, seed)
+
+    # series_map:{String:PriceSeries}
+    # returns Map of every symbol to its price series.
+    def series_map(self):
+        return { symbol: PriceSeries.from_columns(self.columns(symbol)) for symbol in self.symbols }
+
+    # query:Query
+    # param interval:Span => Interval the bars are resampled to and cached under. (default: FIVE_MINUTE)
+    # param span:Span => Span the bars are cached under. (default: YEAR)
+    # returns A Query on this market with every symbol's bars already in its in-memory history cache and no rate limits.
+    def query(self, interval = Span.FIVE_MINUTE, span = Span.YEAR):
+        query = Query(None, None, history_dir=None, instruments_file=None, metrics=Metrics(), trader=self)
+        query.fundamentals_limiter = RateLimiter(sys.maxsize)
+        for symbol in self.symbols:
+            query.history.put(symbol, interval, span, Bounds.REGULAR, self.columns(symbol, interval))
+        return query
+
+class BenchmarkAlgorithm(Algorithm):
+
+    # Number of symbols traded each tick
+    TRADED = 10
+
+    # __init__:Void
+    # NOTE: Buys a share of each of the first TRADED symbols whenever it rises, and sells it whenever it falls.
+    def __init__(self, query, portfolio, symbols, cash = 100000.00):
+        self.traded = symbols[:BenchmarkAlgorithm.TRADED]
+        self.last = {}
+        Algorithm.__init__(self, query, portfolio, name = "Benchmark", test = True, cash = cash)
+
+    def while_market_open(self, cash = None, prices = None):
+        Algorithm.while_market_open(self, cash, prices)
+        for symbol in self.traded:
+            price = self.price(symbol)
+            last = self.last.get(symbol)
+            if last is not None and price > last:
+                Algorithm.buy(self, symbol, 1, None, price)
+            elif last is not None and price < last and self.portfolio.is_symbol_in_portfolio(symbol):
+                Algorithm.sell(self, symbol, 1, None, price)
+            self.last[symbol] = price
@@ -0,0 +1,58 @@
+# Anthony Krivonos
+# benchmarks/startup.py
+
+# Imports
+import os
+import sys
+import subprocess
+
+# Abstract: Startup benchmark that imports the live-trading modules in a fresh interpreter with `python -X importtime`
+#           and reports the total import time and the slowest top-level imports.
+#           Run from the project root with `python3 benchmarks/startup.py [module ...]`.
+
+# Modules imported by driver/run.py and driver/server.py before logging in
+MODULES = ['query', 'utility', 'enums', 'algorithms', 'models']
+
+# Modules that must not be imported at startup
+HEAVY_MODULES = ['matplotlib', 'mpl_finance', 'pandas', 'pandas_market_calendars', 'scipy', 'sympy', 'mpmath', 'textblob']
+
+# Number of slowest imports shown
+TOP = 15
+
+# import_times:[(String, Integer, Integer)]
+# param modules:[String] => Modules to import.
+# returns (module, self_us, cumulative_us) for every module imported, in import order.
+def import_times(modules):
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    code = 'import sys; sys.path.append(%r)\n' % src + '\n'.join('from %s import *' % module for module in modules)
+    process = subprocess.run([ sys.executable, '-X', 'importtime', '-c', code ], stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        sys.exit(process.stderr)
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return times
+
+def main():
+    modules = sys.argv[1:] or MODULES
+    times = import_times(modules)
+
+    # Top-level imports have no indentation after the leading space
+    top_level = [ t for t in times if not t[0].startswith('  ') ]
+    total = sum(t[2] for t in top_level)
+    loaded = set(t[0].strip() for t in times)
+
+    print('Imported %s in %.1f ms' % (', '.join(modules), total / 1000))
+    print('%-40s %12s' % ('module', 'cumul. ms'))
+    for name, self_us, cumulative_us in sorted(top_level, key=lambda t: -t[2])[:TOP]:
+        print('%-40s %12.1f' % (name.strip(), cumulative_us / 1000))
+
+    heavy = [ module for module in HEAVY_MODULES if module in loaded ]
+    if len(heavy) > 0:
+        print('Heavy modules loaded at startup: ' + ', '.join(heavy))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# Anthony Krivonos
+# benchmarks/suite.py
+
+# Imports
+import os
+import sys
+import gc
+import io
+import json
+from time import perf_counter
+import argparse
+import platform
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Fixtures
+from fixtures import *
+
+# Abstract: Benchmark suite for the hot paths (backtesting, portfolio math, trend fitting and candidate screening),
+#           parameterized over symbol count and history length and run offline against a deterministic Market.
+#           Records the best wall time and the peak traced memory of each case, and compares them against a baseline.
+#           Run from the project root with `python3 benchmarks/suite.py [--profile quick|standard|full] [--save FILE]`.
+
+# Default baseline compared against, if it exists
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# History lengths, as numbers of 5-minute bars
+HISTORIES = {
+    '1d': BARS_PER_DAY,
+    '1w': 5 * BARS_PER_DAY,
+    '1m': 21 * BARS_PER_DAY,
+    '1y': DAYS_PER_YEAR * BARS_PER_DAY,
+    '5y': 5 * DAYS_PER_YEAR * BARS_PER_DAY
+}
+
+# Symbol counts and history lengths run by each profile
+PROFILES = {
+    'quick': ([ 10, 100 ], [ '1d', '1m' ]),
+    'standard': ([ 10, 100, 500 ], [ '1d', '1m', '1y' ]),
+    'full': ([ 10, 100, 500, 2000 ], [ '1d', '1m', '1y', '5y' ])
+}
+
+# Default largest number of bars (symbols x bars per symbol) generated for one case
+MAX_BARS = 5000000
+
+# Default fraction a case may be slower or use more memory than its baseline before it counts as a regression
+TOLERANCE = 0.25
+
+# Default seconds a case may be slower than its baseline on top of the tolerance, so timer noise on short cases is ignored
+SLACK = 0.05
+
+##
+#
+#   MARK: - BENCHMARKS
+#
+##
+
+# backtest:Function
+# param market:Market => Market to run on.
+# returns A function running a full backtest of BenchmarkAlgorithm over every bar.
+def backtest(market):
+    query = market.query()
+    data = BacktestData.from_series(market.series_map())
+    def run():
+        Backtest.shared_data = data
+        try:
+            with redirect_stdout(io.StringIO()):
+                BenchmarkAlgorithm(query, Portfolio(query, []), market.symbols)
+        finally:
+            Backtest.shared_data = None
+    return run
+
+# market_data_tuple:Function
+# param market:Market => Market to run on.
+# returns A function computing a portfolio of every symbol's returns and statistics.
+def market_data_tuple(market):
+    query = market.query()
+    portfolio = Portfolio(query, [ Quote(symbol, 10) for symbol in market.symbols ])
+    return lambda: portfolio.get_market_data_tuple(Span.FIVE_MINUTE, Span.YEAR)
+
+# sharpe_optimization:Function
+# param market:Market => Market to run on.
+# returns A function optimizing a portfolio of every symbol's weights for the Sharpe ratio.
+def sharpe_optimization(market):
+    query = market.query(Span.DAY, Span.YEAR)
+    portfolio = Portfolio(query, [ Quote(symbol, 10) for symbol in market.symbols ])
+    return lambda: portfolio.sharpe_optimization()
+
+# poly:Function
+# param market:Market => Market to run on.
+# returns A function fitting a quadratic to every symbol's closes, one symbol at a time.
+def poly(market):
+    series = [ (columns['time'] / 86400.0, columns['close']) for columns in map(market.columns, market.symbols) ]
+    def run():
+        for x, y in series:
+            polynomial = Math.poly(x, y, 2)
+            Math.eval(Math.deriv(polynomial, 1), x[-1])
+            Math.eval(Math.deriv(polynomial, 2), x[-1])
+    return run
+
+# batch_poly:Function
+# param market:Market => Market to run on.
+# returns A function fitting a quadratic to every symbol's closes in one batch.
+def batch_poly(market):
+    x = np.vstack([ market.columns(symbol)['time'] / 86400.0 for symbol in market.symbols ])
+    y = np.vstack([ market.columns(symbol)['close'] for symbol in market.symbols ])
+    return lambda: Math.batch_derivatives(x, y, 2)
+
+# generate_candidates:Function
+# param market:Market => Market to run on.
+# returns A function screening every symbol's fundamentals for NoDayTradesAlgorithm, with a cold response cache.
+def generate_candidates(market):
+    query = market.query()
+    Backtest.shared_data = BacktestData([], [], np.zeros((0, 0, BacktestData.FIELD_COUNT)))
+    try:
+        with redirect_stdout(io.StringIO()):
+            algorithm = NoDayTradesAlgorithm(query, Portfolio(query, []), test=True, cash=100000.00)
+    finally:
+        Backtest.shared_data = None
+    def run():
+        query.responses.clear()
+        return algorithm.generate_candidates()
+    return run
+
+# Benchmarks by name, with the largest number of symbols and bars per symbol each is run on
+BENCHMARKS = {
+    'backtest': (backtest, sys.maxsize, sys.maxsize),
+    'market_data_tuple': (market_data_tuple, sys.maxsize, sys.maxsize),
+    'sharpe_optimization': (sharpe_optimization, 10, HISTORIES['1y']),
+    'poly': (poly, sys.maxsize, sys.maxsize),
+    'batch_poly': (batch_poly, sys.maxsize, sys.maxsize),
+    'generate_candidates': (generate_candidates, sys.maxsize, HISTORIES['1d'])
+}
+
+##
+#
+#   MARK: - RUNNING
+#
+##
+
+# measure:(Float, Integer)
+# param run:Function() => Case to measure.
+# param repeat:Integer => Number of timed runs.
+# returns A tuple containing (best wall time in seconds, peak traced memory in bytes of one more run).
+def measure(run, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        run()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return (best, peak)
+
+# compare:[String]
+# param results:{String:Dict} => Results by case.
+# param baseline:{String:Dict} => Baseline results by case.
+# param tolerance:Float => Fraction a case may be worse than its baseline.
+# param slack:Float => Seconds a case may be slower than its baseline on top of the tolerance. (default: SLACK)
+# returns Descriptions of every regression.
+def compare(results, baseline, tolerance, slack = SLACK):
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for metric in [ 'seconds', 'peak_bytes' ]:
+            if result[metric] > baseline[case][metric] * (1 + tolerance) + (slack if metric == 'seconds' else 0):
+                regressions.append('%s: %s %.4g -> %.4g (+%.0f%%)' % (case, metric, baseline[case][metric], result[metric], (result[metric] / baseline[case][metric] - 1) * 100))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths on offline data.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick', help='sizes to run (default: quick)')
+    parser.add_argument('--symbols', help='comma-separated symbol counts, overriding the profile')
+    parser.add_argument('--history', help='comma-separated history lengths (' + ', '.join(HISTORIES) + '), overriding the profile')
+    parser.add_argument('--only', help='comma-separated benchmarks to run (' + ', '.join(BENCHMARKS) + ')')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case, of which the best is kept (default: 3)')
+    parser.add_argument('--max-bars', type=int, default=MAX_BARS, help='skip cases generating more bars than this (default: %d)' % MAX_BARS)
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline to compare against, if it exists')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown or memory growth over the baseline (default: %.2f)' % TOLERANCE)
+    parser.add_argument('--slack', type=float, default=SLACK, help='seconds allowed over the tolerance, for timer noise (default: %.2f)' % SLACK)
+    parser.add_argument('--save', help='file to save the results to, e.g. as a new baseline')
+    args = parser.parse_args()
+
+    symbol_counts, histories = PROFILES[args.profile]
+    symbol_counts = [ int(count) for count in args.symbols.split(',') ] if args.symbols else symbol_counts
+    histories = args.history.split(',') if args.history else histories
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+
+    results = {}
+    print('%-22s %8s %8s %12s %12s' % ('benchmark', 'symbols', 'history', 'seconds', 'peak MB'))
+    for name in names:
+        setup, max_symbols, max_bars = BENCHMARKS[name]
+        for symbol_count in symbol_counts:
+            for history in histories:
+                bar_count = HISTORIES[history]
+                if symbol_count > max_symbols or bar_count > max_bars or symbol_count * bar_count > args.max_bars:
+                    print('%-22s %8d %8s %12s' % (name, symbol_count, history, 'skipped'))
+                    continue
+                seconds, peak = measure(setup(Market(symbol_count, bar_count)), args.repeat)
+                results[name + '/' + str(symbol_count) + '/' + history] = { 'seconds': seconds, 'peak_bytes': peak }
+                print('%-22s %8d %8s %12.4f %12.1f' % (name, symbol_count, history, seconds, peak / 1e6))
+                sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({ 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'results': results }, file, indent=2, sort_keys=True)
+        print('Saved results to ' + args.save)
+
+    if args.baseline and os.path.isfile(args.baseline) and os.path.abspath(args.baseline) != os.path.abspath(args.save or ''):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance, args.slack)
+        print('Compared ' + str(len([ case for case in results if case in baseline ])) + ' cases against ' + args.baseline)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,7 @@ from dotenv import load_dotenv
 sys.path.append('src')
 
 # Flask Imports
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, abort
 from flask_httpauth import HTTPBasicAuth
 
 # Local Imports
@@ -19,6 +19,7 @@ from query import *
 from utility import *
 import algorithms
 from models import *
+from metrics import *
 
 # Abstract: Starts a REST server to perform algorithm processes.
 
@@ -68,8 +69,7 @@ def algorithm_logs():
     algo_name = algorithm.name
     if algorithm.query.email != request.authorization["username"] or algorithm.query.password != request.authorization["password"]:
         abort(401)
-    processes[request.json['process_id']] = None
-    logs = algorithm.get_logs()
+    logs = algorithm.get_logs(None)
     return jsonify({
         'algorithm_name': algo_name,
         'status': 'running',
@@ -93,13 +93,27 @@ def algorithm_stop():
     algo_name = algorithm.name
     if algorithm.query.email != request.authorization["username"] or algorithm.query.password != request.authorization["password"]:
         abort(401)
-    processes[request.json['process_id']] = None
+    algorithm.cancel_timers()
+    del processes[request.json['process_id']]
     return jsonify({
         'algorithm_name': algo_name,
         'status': 'stopped',
         'process_id': request.json['process_id']
     }), 200
 
+# /metrics
+# request format:String? => 'json' for a JSON dump. Otherwise, Prometheus text.
+# response Responds with the call counts and latency histograms of every running algorithm and its queries.
+# NOTE: Requires the credentials of a running algorithm, like the algorithm routes.
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not request.authorization or not request.authorization["username"] or not request.authorization["password"]:
+        abort(401)
+    if not any(algorithm.query.email == request.authorization["username"] and algorithm.query.password == request.authorization["password"] for algorithm in processes.values()):
+        abort(401)
+    if request.args.get('format') == 'json':
+        return Response(Metrics.shared().json(), mimetype='application/json'), 200
+    return Response(Metrics.shared().prometheus(), mimetype='text/plain; version=0.0.4'), 200
 
 if __name__ == '__main__':
      app.run()
\ No newline at end of file
@@ -11,10 +11,15 @@ import math
 from utility import *
 from enums import *
 from mathematics import *
+from indicators import *
+from metrics import *
 
 # QuoteModel
 from models.quote import *
 
+# Backtesting
+from backtest import *
+
 # Abstract: Generic/abstract algorithm parent class.
 # NOTE: All algorithms DO NOT perform day trades.
 
@@ -24,7 +29,8 @@ class Algorithm:
     # param query:Query => Query object for API access.
     # param sec_interval:Integer => Time interval in seconds for event handling.
     # param name:String => Name of the algorithm.
-    def __init__(self, query, portfolio, sec_interval = 900, name = "Algorithm", buy_range = (0.00, sys.maxsize), test = False, cash = 0.00):
+    # param params:{String:Any}? => Map of property names to values, overriding the algorithm's defaults before it initializes.
+    def __init__(self, query, portfolio, sec_interval = 900, name = "Algorithm", buy_range = (0.00, sys.maxsize), test = False, cash = 0.00, params = None):
 
         # Initialize properties
         self.name = name                        # String name of the algorithm
@@ -39,9 +45,23 @@ class Algorithm:
         self.cash = cash                        # Float buying power amount.
         self.timestamp = Utility.now_timestamp()# Updated timestamp the algorithm is running.
         self.event = Event.ON_MARKET_WILL_OPEN  # Current even the algorithm is on
+        self.timers = []                        # Scheduled tasks driving the event functions
+        self.indicators = {}                    # Map of (name, symbol) to incremental indicators
+        self.metrics = query.metrics            # Registry recording event, order and API latencies
+        self.last_order_id = None               # ID of the last order placed
 
         # Backtesting properties
         self.test = test                        # Set to True if backtesting
+        self.backtest = None                    # Backtest engine, while backtesting
+        self.backtest_interval = Span.DAY       # Time in between each bar replayed by a backtest
+        self.backtest_span = Span.YEAR          # Range of the backtest
+
+        # Override properties with the given parameters
+        for key, value in (params or {}).items():
+            setattr(self, key, value)
+
+        # Time every event function, including subclass overrides
+        self.__instrument_events()
 
         # Initialize the algorithm
         self.initialize()
@@ -56,7 +76,8 @@ class Algorithm:
         if self.test:
             # User is performing a backtest, don't schedule event functions
             self.log("Initialized algorithm \'" + self.name + "\' for backtesting...", 't')
-            self.__backtest()
+            self.backtest = Backtest(self, self.backtest_interval, self.backtest_span)
+            self.backtest.run()
         else:
             # User is live trading, schedule event functions
             self.log("Initialized algorithm \'" + self.name + "\' for live trading...")
@@ -82,23 +103,36 @@ class Algorithm:
         self.buy_list = []
         self.sell_list = []
 
-        # Update buy list and sell list with today's orders
-        todays_orders = self.query.user_orders()['results'] or []
-        todays_buys = []
-        todays_sells = []
-        for order in todays_orders:
-            if order['side'] == Side.BUY.value:
-                todays_buys.append(order)
-            else:
-                todays_sells.append(order)
-        todays_buys = [ self.query.stock_from_instrument_url(order['instrument'])['symbol'] for order in todays_buys if Utility.iso_to_datetime(order['last_transaction_at']).date() == datetime.datetime.now().date() ]
-        todays_sells = [ self.query.stock_from_instrument_url(order['instrument'])['symbol'] for order in todays_sells if Utility.iso_to_datetime(order['last_transaction_at']).date() == datetime.datetime.now().date() ]
-        self.buy_list = todays_buys
-        self.sell_list = todays_sells
+        # Update buy list and sell list with today's orders, which a backtest has none of
+        if not self.test:
+            todays_orders = self.query.user_todays_orders()
+            self.buy_list = [ order['symbol'] for order in todays_orders if order['side'] == Side.BUY.value ]
+            self.sell_list = [ order['symbol'] for order in todays_orders if order['side'] != Side.BUY.value ]
 
         self.log('Today Bought: ' + str(self.buy_list))
         self.log('Today Sold  : ' + str(self.sell_list))
 
+    # __instrument_events:Void
+    # NOTE: Replaces each event function on this instance with one recording its wall time, by event.
+    #       A while_market_open tick that takes longer than sec_interval also counts as an overrun.
+    def __instrument_events(self):
+        for event in [ 'on_market_will_open', 'on_market_open', 'while_market_open', 'on_market_close' ]:
+            setattr(self, event, self.__timed_event(event, getattr(self, event)))
+
+    # __timed_event:Function
+    # param event:String => Name of the event function.
+    # param function:Function => The bound event function.
+    # returns The event function, timed.
+    def __timed_event(self, event, function):
+        labels = (('algorithm', self.name), ('event', event))
+        def timed_event(*args, **kwargs):
+            with self.metrics.timer('algorithm_event_seconds', *labels) as timer:
+                result = function(*args, **kwargs)
+            if event == 'while_market_open' and timer.seconds > self.sec_interval:
+                self.metrics.increment('algorithm_tick_overruns_total', labels[0])
+            return result
+        return timed_event
+
     # __reset_for_next_day:Void
     # NOTE: Resets the algorithm for execution the following day.
     def __reset_for_next_day(self):
@@ -154,22 +188,35 @@ class Algorithm:
         self.event = Event.ON_MARKET_CLOSE
         self.__update_cash(cash)
         self.__update_prices(prices)
+        if not self.test:
+            self.__add_daily_bar()
         pass
 
-    # on_custom_timer:Void
+    # on_custom_timer:ScheduledTask?
     # param func:Function => Function to call on the timer.
     # param repeat_sec:Integer => Number of seconds between each repeated function call. Leave None to prevent repetition of calls.
     # param start_d64:Datetime64? => Date to start the function calls.
     # param stop_d64:Datetime64? => Date to stop the function calls.
-    # NOTE: Starts a custom timer that fires with the given parameters.
-    def on_custom_timer(self, func, repeat_sec = None, start_d64 = None, stop_d64 = None):
+    # param overrun:Overrun => What to do with repeated calls missed while func ran late. (default: SKIP)
+    # NOTE: Starts a custom timer on the shared scheduler that fires with the given parameters.
+    # returns The scheduled task, or None if func was called immediately.
+    def on_custom_timer(self, func, repeat_sec = None, start_d64 = None, stop_d64 = None, overrun = Overrun.SKIP):
         if not repeat_sec:
             if start_d64 is None:
                 func()
-            else:
-                Utility.sleep_then_execute(time=start_d64, sec=1, action=lambda: func())
+                return None
+            task = Utility.sleep_then_execute(time=start_d64, action=lambda: func())
         else:
-            Utility.execute_between_times(action=lambda: func(), start_time=start_d64, stop_time=stop_d64, sec=repeat_sec)
+            task = Utility.execute_between_times(action=lambda: func(), start_time=start_d64, stop_time=stop_d64, sec=repeat_sec, overrun=overrun)
+        self.timers.append(task)
+        return task
+
+    # cancel_timers:Void
+    # NOTE: Cancels every timer started by this algorithm.
+    def cancel_timers(self):
+        for task in self.timers:
+            task.cancel()
+        self.timers = []
 
     # log:Void
     # param message:String => The string message to log.
@@ -199,9 +246,44 @@ class Algorithm:
     # Backtesting and Live Value Functions
     #
 
+    # universe:[String]
+    # Returns the symbols this algorithm trades, used to preload backtest data.
+    # NOTE: Override to add candidate symbols beyond the portfolio.
+    def universe(self):
+        return self.portfolio.get_symbols()
+
+    # backtest_universe:[String]
+    # Returns the symbols to preload for a backtest, before it runs.
+    # NOTE: Override to screen candidates with the API once, e.g. by tag. The backtest screens these symbols instead (see screen).
+    def backtest_universe(self):
+        return self.universe()
+
+    # screen:[{String:Any}]
+    # param price_range:(Float, Float)? => Range of the day's low and high prices. (default: buy_range)
+    # param tags:Tag|[Tag]? => Tag(s) to screen. If None, screens every instrument.
+    # NOTE: While backtesting, screens the preloaded symbols by their last completed bar instead, without API calls. Tags
+    #       are applied when the symbols are preloaded (see backtest_universe).
+    # Returns fundamentals of every symbol in range, each with its 'symbol', 'low' and 'high'.
+    def screen(self, price_range = None, tags = None):
+        price_range = price_range if price_range is not None else self.buy_range
+        if self.test and self.backtest is not None and self.backtest.ledger is not None:
+            return self.backtest.screen(price_range)
+        elif self.test and Backtest.shared_data is not None:
+            return Backtest.shared_data.screen(0, price_range)
+        return self.query.get_fundamentals_by_criteria(price_range, tags)
+
+    # open_orders:[{String:Any}]
+    # Returns the user's open orders, each with its 'id', 'symbol' and 'side'. While backtesting, returns the backtest's.
+    def open_orders(self):
+        if self.test:
+            return self.backtest.open_orders() if self.backtest is not None and self.backtest.ledger is not None else []
+        return self.query.user_open_orders()
+
     # value:Float
     # Returns the value of the portfolio.
     def value(self):
+        if self.backtest is not None and self.backtest.ledger is not None:
+            return self.backtest.value()
         value = 0.00
         for quote in self.portfolio.get_quotes():
             value += (self.price(quote.symbol) * quote.count)
@@ -209,34 +291,54 @@ class Algorithm:
 
     # price:Void
     # param symbol:String => Symbol.
+    # NOTE: While backtesting, never requests a live quote. Symbols without a price in the backtest's data are priced 0.0.
     # Returns the current price of the given symbol.
     def price(self, symbol):
         if symbol in self.prices:
             return self.prices[symbol]
-        elif self.test and self.timestamp in self.portfolio.get_symbol_history_map(symbol):
-            price = self.portfolio.get_symbol_history_map(symbol)[self.timestamp]
-            if self.event == Event.WHILE_MARKET_OPEN:
-                return price.low
-            elif self.event == Event.ON_MARKET_CLOSE:
-                return price.close
-            else:
-                return price.open
+        elif self.backtest is not None:
+            price = self.backtest.price(symbol)
+            return price if price is not None else 0.00
+        self.prices[symbol] = self.query.get_current_price(symbol)
+        return self.prices[symbol]
+
+    # prefetch_prices:Void
+    # param symbols:[String] => Symbols to price.
+    # NOTE: Prices every given symbol that is not priced yet with batched quote requests. Does nothing while backtesting.
+    def prefetch_prices(self, symbols):
+        if self.test:
             return
-        return self.query.get_current_price(symbol)
+        missing = [ symbol for symbol in symbols if symbol not in self.prices ]
+        if len(missing) > 0:
+            self.prices.update(self.query.get_current_prices(missing))
+            self.__log_price_latencies()
+
+    # __log_price_latencies:Void
+    # NOTE: Logs the latency of each bulk quotes request of the last batched price update.
+    def __log_price_latencies(self):
+        for count, seconds in self.query.price_latencies:
+            self.log("Priced " + str(count) + " symbols in " + str(round(seconds * 1000, 1)) + "ms")
 
     # __update_prices:Void
     # param prices:{String:Float}? => Map of prices to update the global map to.
     # NOTE: Updates map of symbols to their current ask prices.
     def __update_prices(self, prices = None):
         if prices is None:
-            # If prices is None, update it with current market values.
-            self.prices = {}
-            for quote in self.portfolio.get_quotes():
-                self.prices[quote.symbol] = self.query.get_current_price(quote.symbol)
+            # If prices is None, update it with current market values for every symbol in the universe at once.
+            self.prices = self.query.get_current_prices(self.universe())
+            self.__log_price_latencies()
         else:
             # Otherwise, update it with given values.
             self.prices = prices
 
+    # __add_daily_bar:Void
+    # NOTE: Feeds today's closing prices into the portfolio's return statistics as a daily bar. Daily bars are stamped
+    #       with the UTC date they are for, so a bar the statistics already loaded from history is not added twice.
+    def __add_daily_bar(self):
+        day_seconds = Utility.span_to_seconds(Span.DAY)
+        closes = { symbol: self.prices[symbol] for symbol in self.portfolio.get_symbols() if self.prices.get(symbol) }
+        self.portfolio.add_bar(Utility.now_timestamp() // day_seconds * day_seconds, closes)
+
     # __update_cash:Void
     # param cash:Float => User's buying power.
     # NOTE: Updates user's buying power.
@@ -248,81 +350,32 @@ class Algorithm:
             # Otherwise, update it with given value.
             self.cash = cash
 
-    #
-    # Backtesting
-    #
-
-    # __backtest:Void
-    # NOTE: Performs a backtest on the algorithm.
-    def __backtest(self):
-        # Map each symbol to a list of historical prices.
-        historicals_map, historical_times = self.portfolio.get_history_tuple(Span.DAY, Span.YEAR, Bounds.REGULAR)
-        symbols = self.portfolio.get_symbols()
-
-        # Assure enough historicals data will be processed
-        if len(historical_times) == 0:
-            self.log("Not enough data for a backtest.", 'error', 't')
-            return
-
-        # Assure enough cash is allocated
-        if self.cash == 0.00:
-            self.log("Not enough starting cash for backtest.", 'error', 't')
-            return
-
-        previous_value = self.value()
-        self.cash += previous_value
-        start_cash = self.cash
-
-        self.log("Starting backtest from " + Utility.get_timestamp_string(historical_times[0]) + " to " + Utility.get_timestamp_string(historical_times[-1]) + " with $" + str(start_cash), 't')
-
-        # Run through timeline
-        for time in historical_times:
-
-            self.timestamp = time
-
-            self.cash -= previous_value
-            previous_value = self.value()
-            self.cash += previous_value
-
-            # Announce progress
-            percentage = (self.cash - start_cash) / start_cash * 100
-            difference = self.cash - start_cash
-            if percentage >= 0.00:
-                self.log(Utility.get_timestamp_string(time) + " (backtest): cash($" + str(self.cash) + "), gain(" + str(abs(percentage)) + "%, $" + str(abs(difference)) + ")", 't')
-            else:
-                self.log(Utility.get_timestamp_string(time) + " (backtest): cash($" + str(self.cash) + "), loss(" + str(abs(percentage)) + "%, $" + str(abs(difference)) + ")", 't')
-
-            # Store five maps of symbols to instantaneous prices
-            on_market_will_open_prices = {}
-            on_market_open_prices = {}
-            while_market_open_low_prices = {}
-            while_market_open_high_prices = {}
-            on_market_close_prices = {}
-            for symbol in symbols:
-                price = historicals_map[symbol][time]
-                on_market_will_open_prices[symbol] = price.open
-                on_market_open_prices[symbol] = price.open
-                while_market_open_low_prices[symbol] = price.low
-                while_market_open_high_prices[symbol] = price.high
-                on_market_close_prices[symbol] = price.close
-
-            # Execute events with appropriate prices
-            self.on_market_will_open(self.cash, on_market_will_open_prices)
-            self.on_market_open(self.cash, on_market_open_prices)
-            self.while_market_open(self.cash, while_market_open_low_prices)
-            self.while_market_open(self.cash, while_market_open_high_prices)
-            self.on_market_close(self.cash, on_market_close_prices)
-
-        end_cash = self.cash
-
-        # Announce final progress
-        final_percentage = (end_cash - start_cash) / start_cash * 100
-        final_difference = end_cash - start_cash
-        if final_percentage >= 0.00:
-            self.log("Final results (backtest): cash($" + str(end_cash) + "), gain(" + str(abs(final_percentage)) + "%, $" + str(abs(final_difference)) + ")", 't')
-        else:
-            self.log("Final results (backtest): cash($" + str(end_cash) + "), loss(" + str(abs(final_percentage)) + "%, $" + str(abs(final_difference)) + ")", 't')
-        pass
+    # indicator:Indicator
+    # param name:String => Name the indicator is cached under, like 'rsi'.
+    # param symbol:String => Symbol the indicator tracks.
+    # param factory:Function() => Creates the indicator the first time it is requested, e.g. `lambda: SMA(39)`.
+    # param interval:Span => Time in between each bar. (default: TEN_MINUTE)
+    # param span:Span => Range of history the indicator is advanced over. Must cover its period on first use. (default: DAY)
+    # NOTE: The indicator is kept between calls and only advanced by the bars it has not seen yet, so each call costs O(new bars).
+    # returns The indicator, up to date with the latest bar.
+    def indicator(self, name, symbol, factory, interval = Span.TEN_MINUTE, span = Span.DAY):
+        key = (name, symbol)
+        if key not in self.indicators:
+            self.indicators[key] = factory()
+        self.indicators[key].update_series(self.history(symbol, interval, span))
+        return self.indicators[key]
+
+    # history:PriceSeries
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each bar. (default: DAY)
+    # param span:Span => Range of the bars to return. (default: YEAR)
+    # param bounds:Bounds => The bounds to be included. (default: REGULAR)
+    # NOTE: While backtesting, returns the bars completed so far in the backtest, resampled from its own bars.
+    # returns The symbol's price history.
+    def history(self, symbol, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        if self.backtest is not None and self.backtest.ledger is not None:
+            return self.backtest.history(symbol, interval, span)
+        return self.portfolio.get_symbol_history(symbol, interval, span, bounds)
 
     #
     # Execution Functions
@@ -333,19 +386,33 @@ class Algorithm:
     # param quantity:Number => Number of shares to execute buy for.
     # param stop:Number? => Sets a stop price on the buy, if not None.
     # param limit:Number? => Sets a limit price on the buy, if not None.
-    # NOTE: Safely executes a buy order outside of open hours, if possible.
-    def buy(self, symbol, quantity, stop = None, limit = None):
+    # param time:GoodFor? => Defines the expiration of the buy. (default: GOOD_TIL_CANCELED)
+    # NOTE: Safely executes a buy order outside of open hours, if possible. Its wall time is recorded in metrics.
+    #       While backtesting, orders that are not marketable rest in the backtest's order book until a bar fills them.
+    def buy(self, symbol, quantity, stop = None, limit = None, time = None):
+        with self.metrics.timer('algorithm_order_seconds', ('algorithm', self.name), ('side', 'buy')):
+            return self.__buy(symbol, quantity, stop, limit, time)
+
+    # __buy:Boolean
+    # NOTE: Executes buy(...), untimed.
+    def __buy(self, symbol, quantity, stop = None, limit = None, time = None):
         try:
-            price = limit if not None else stop
+            price = limit if limit is not None else stop if stop is not None else self.price(symbol)
             if price <= self.cash and price <= self.buy_range[1] and price >= self.buy_range[0] and symbol not in self.sell_list:
                 if not self.test:
-                    self.query.exec_buy(symbol, quantity, stop, limit)
+                    order = self.query.exec_buy(symbol, quantity, stop, limit, time)
+                    self.last_order_id = order.get('id') if isinstance(order, dict) else None
                     self.log("Bought " + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
+                    self.cash -= (quantity * price)
+                    self.portfolio.add_quote(Quote(symbol, quantity))
                 else:
-                    self.log("Backtest: Bought " + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
-                self.cash -= (quantity * price)
+                    self.last_order_id, filled = self.backtest.submit(symbol, quantity, stop, limit, time)
+                    if self.last_order_id is None:
+                        self.log("Could not buy " + symbol + ": No backtest data", 'error')
+                        return False
+                    self.log("Backtest: " + ("Bought " if filled else "Placed order " + self.last_order_id + " to buy ") + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
+                    self.cash = self.backtest.buying_power()
                 self.buy_list.append(symbol)
-                self.portfolio.add_quote(Quote(symbol, quantity))
                 return True
             else:
                 if price > self.buy_range[1]:
@@ -363,19 +430,33 @@ class Algorithm:
     # param quantity:Number => Number of shares to execute sell for.
     # param stop:Number? => Sets a stop price on the sell, if not None.
     # param limit:Number? => Sets a limit price on the sell, if not None.
-    # NOTE: Safely executes a sell order outside of open hours, if possible.
-    def sell(self, symbol, quantity, stop = None, limit = None):
+    # param time:GoodFor? => Defines the expiration of the sell. (default: GOOD_TIL_CANCELED)
+    # NOTE: Safely executes a sell order outside of open hours, if possible. Its wall time is recorded in metrics.
+    #       While backtesting, orders that are not marketable rest in the backtest's order book until a bar fills them.
+    def sell(self, symbol, quantity, stop = None, limit = None, time = None):
+        with self.metrics.timer('algorithm_order_seconds', ('algorithm', self.name), ('side', 'sell')):
+            return self.__sell(symbol, quantity, stop, limit, time)
+
+    # __sell:Boolean
+    # NOTE: Executes sell(...), untimed.
+    def __sell(self, symbol, quantity, stop = None, limit = None, time = None):
         try:
-            price = limit if not None else stop
+            price = limit if limit is not None else stop if stop is not None else self.price(symbol)
             if symbol not in self.buy_list:
                 if not self.test:
-                    self.query.exec_sell(symbol, quantity, stop, limit)
+                    order = self.query.exec_sell(symbol, quantity, stop, limit, time)
+                    self.last_order_id = order.get('id') if isinstance(order, dict) else None
                     self.log("Sold " + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
+                    self.cash += (quantity * price)
+                    self.portfolio.remove_quote(Quote(symbol, quantity))
                 else:
-                    self.log("Backtest: Sold " + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
-                self.cash += (quantity * price)
+                    self.last_order_id, filled = self.backtest.submit(symbol, -quantity, stop, limit, time)
+                    if self.last_order_id is None:
+                        self.log("Could not sell " + symbol + ": No backtest data", 'error')
+                        return False
+                    self.log("Backtest: " + ("Sold " if filled else "Placed order " + self.last_order_id + " to sell ") + str(quantity) + " shares of " + symbol + " with limit " + str(limit) + " and stop " + str(stop))
+                    self.cash = self.backtest.buying_power()
                 self.sell_list.append(symbol)
-                self.portfolio.remove_quote(Quote(symbol, quantity))
                 return True
             else:
                 if symbol in self.buy_list:
@@ -384,7 +465,7 @@ class Algorithm:
             Utility.error("Could not sell " + symbol + ": " + str(e))
         return False
 
-    # cancel:Void
+    # cancel:Boolean
     # param order_id:String => ID of the order to cancel.
     # NOTE: Safely cancels an order given its ID, if possible.
     def cancel(self, order_id):
@@ -392,11 +473,15 @@ class Algorithm:
             if not self.test:
                 self.query.exec_cancel(order_id)
                 self.log("Cancelled order " + order_id)
-            else:
+            elif self.backtest.cancel(order_id):
                 self.log("Backtest: Cancelled order " + order_id)
+                self.cash = self.backtest.buying_power()
+            else:
+                self.log("Could not cancel " + order_id + ": Order is not open", 'error')
+                return False
             return True
         except:
-            Utility.error("Could not cancel " + symbol + ": A client error occurred")
+            Utility.error("Could not cancel " + str(order_id) + ": A client error occurred")
         return False
 
     # cancel_open_orders:Void
@@ -407,7 +492,9 @@ class Algorithm:
                 cancelled_order_ids = self.query.exec_cancel_open_orders()
                 Utility.log("Cancelled orders " + str(cancelled_order_ids))
             else:
-                self.log("Backtest: Cancelled open orders")
+                cancelled_order_ids = self.backtest.cancel_open()
+                self.log("Backtest: Cancelled orders " + str(cancelled_order_ids))
+                self.cash = self.backtest.buying_power()
             return True
         except:
             Utility.error("Could not cancel open orders: A client error occurred")
@@ -27,7 +27,8 @@ class SkeletonAlgorithm(Algorithm):
     # param sec_interval:Integer? => Time interval in seconds for event handling.
     # param test:Boolean? => Set to True if backtesting, false otherwise.
     # param cash:Float? => Must set this amount (user's buying power) if backtesting. Otherwise, leave alone.
-    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00):
+    # param params:{String:Any}? => Overrides custom properties by name, e.g. when running a parameter sweep.
+    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00, params = None):
 
         # Name the algorithm something creative
         algorithm_name = "Skeleton"
@@ -47,15 +48,15 @@ class SkeletonAlgorithm(Algorithm):
               - self.on_custom_timer(func, repeat_sec, start_d64, stop_d64): Calls a custom timer using datetime64 objects.
               - self.log(message, type): Logs messages both into the console and in the algorithm object.
               - self.get_logs(last): Get last # (or all, if none) of logs in the algorithm.
-              - Algorithm.buy(symbol, quantity, stop, limit): Performs a stop/limit buy.
-              - Algorithm.sell(symbol, quantity, stop, limit): Performs a stop/limit sell.
+              - Algorithm.buy(symbol, quantity, stop, limit, time): Performs a stop/limit buy, good for the day or until canceled.
+              - Algorithm.sell(symbol, quantity, stop, limit, time): Performs a stop/limit sell, good for the day or until canceled.
               - Algorithm.cancel(order_id): Cancels the order with the given ID.
               - Algorithm.cancel_open_orders(): Cancels all of the user's open orders.
             - Otherwise, access trading methods via the query property. (See query.py for all methods.)
         """
 
         # Call super.__init__
-        Algorithm.__init__(self, query, portfolio, sec_interval, name = algorithm_name, buy_range = buy_range, test = test, cash = cash)
+        Algorithm.__init__(self, query, portfolio, sec_interval, name = algorithm_name, buy_range = buy_range, test = test, cash = cash, params = params)
 
     # initialize:void
     # NOTE: Configures the algorithm to run indefinitely.
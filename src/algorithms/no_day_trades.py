@@ -5,11 +5,14 @@
 # Global Imports
 import numpy as np
 import math
+import os
+import sqlite3
 
 # Local Imports
 from utility import *
 from enums import *
 from mathematics import *
+from state import *
 
 from algorithms.__algorithm import *
 
@@ -17,12 +20,19 @@ from algorithms.__algorithm import *
 #           For more info on this algorithm, see:
 #           https://www.quantopian.com/algorithms/5bf47d593f88ef0045e55e55
 
+# Prefix of the namespaces of the position ages in the state store, scoped per algorithm (see age_namespace)
+AGE_NAMESPACE = 'no_day_trades/age'
+
 class NoDayTradesAlgorithm(Algorithm):
 
     # __init__:Void
     # param query:Query => Query object for API access.
     # param sec_interval:Integer => Time interval in seconds for event handling.
-    def __init__(self, query, portfolio, sec_interval = 900, age_file = None, test = False, cash = 0.00):
+    # param age_file:String? => Legacy file of position ages, imported into the state store once. Also scopes the ages, so
+    #                           algorithms with different files never share them. If None, the portfolio's name scopes them.
+    # param params:{String:Any}? => Map of property names to values overriding the defaults below, e.g. for parameter sweeps.
+    # param state:StateStore? => Store persisting the position ages. If None, uses the shared store, or an in-memory one when testing.
+    def __init__(self, query, portfolio, sec_interval = 900, age_file = None, test = False, cash = 0.00, params = None, state = None):
 
         # Initialize properties
 
@@ -50,23 +60,38 @@ class NoDayTradesAlgorithm(Algorithm):
         # Number of days to hold a stock until it must be sold
         self.immediate_sale_age = 6
 
+        # Percentage of the current price to submit buy orders at
+        self.buy_factor = 0.99
+
+        # Percentage of the current price to submit sell orders at
+        self.sell_factor = 1.01
+
+        # Factor at which the stock may be higher than its average price over the past day and can still be bought
+        self.gain_factor = 1.25
+
         # Over simplistic tracking of position age
         self.age = {}
 
-        # File keeping track of ages
+        # Legacy file of ages, imported into the state store
         self.age_file = age_file
 
+        # Namespace of this algorithm's ages in the state store
+        self.age_namespace = AGE_NAMESPACE + '/' + (os.path.abspath(age_file) if age_file is not None else portfolio.get_name())
+
+        # Store persisting the ages across restarts
+        self.state = state if state is not None else (StateStore(None) if test else StateStore.shared())
+
         # List of categories for stocks to be traded
         self.categories = [ Tag.TOP_MOVERS, Tag.MOST_POPULAR, Tag.INVESTMENT_OR_TRUST ]
 
         # Call super.__init__
-        Algorithm.__init__(self, query, portfolio, sec_interval, name = "No Day Trades", buy_range = self.buy_range, test = test, cash = cash)
+        Algorithm.__init__(self, query, portfolio, sec_interval, name = "No Day Trades", buy_range = self.buy_range, test = test, cash = cash, params = params)
 
     # initialize:void
     # NOTE: Configures the algorithm to run indefinitely.
     def initialize(self):
         Algorithm.initialize(self)
-        self.update_from_age_file()
+        self.load_ages()
         pass
 
     #
@@ -81,22 +106,21 @@ class NoDayTradesAlgorithm(Algorithm):
         Algorithm.on_market_will_open(self, cash, prices)
 
         self.candidates, self.candidates_to_trade, self.candidates_to_trade_weight = self.generate_candidates()
+        self.prefetch_prices(self.candidates)
 
         lowest_price = self.buy_range[0]
+        ages = {}
         for quote in self.portfolio.get_quotes():
             current_price = self.price(quote.symbol)
             if current_price < lowest_price:
                 lowest_price = current_price
-            if quote.symbol in self.age:
-                self.age[quote.symbol] += 1
-            else:
-                self.age[quote.symbol] = 1
+            ages[quote.symbol] = self.age.get(quote.symbol, 0) + 1
         for symbol in self.age:
             if not self.portfolio.is_symbol_in_portfolio(symbol):
-                self.age[quote.symbol] = 0
-            Algorithm.log(self, "stock.symbol: " + symbol + " : age: " + str(self.age[symbol]))
+                ages[symbol] = 0
+            Algorithm.log(self, "stock.symbol: " + symbol + " : age: " + str(ages.get(symbol, self.age[symbol])))
 
-        self.overwrite_age_file()
+        self.set_ages(ages)
 
         self.perform_buy_sell()
 
@@ -133,12 +157,22 @@ class NoDayTradesAlgorithm(Algorithm):
     # Algorithm
     #
 
+    # universe:[String]
+    # Returns the symbols in the portfolio along with every candidate.
+    def universe(self):
+        return list(dict.fromkeys(Algorithm.universe(self) + self.candidates))
+
+    # backtest_universe:[String]
+    # Returns the symbols in the portfolio along with every symbol in the buy range of the categories today.
+    def backtest_universe(self):
+        return list(dict.fromkeys(Algorithm.universe(self) + [ fund['symbol'] for fund in self.query.get_fundamentals_by_criteria(self.buy_range, self.categories) ]))
+
     def generate_candidates(self):
 
         Algorithm.log(self, "Generating candidates for categories: " + str([ c.value for c in self.categories ]))
 
         # Get all fundamentals within the buy range
-        unsorted_fundamentals = self.query.get_fundamentals_by_criteria(self.buy_range, self.categories)
+        unsorted_fundamentals = Algorithm.screen(self, self.buy_range, self.categories)
 
         # Sort the unsorted fundamentals by low price (close would be preferred, but is unavailable)
         candidate_fundamentals = sorted(unsorted_fundamentals, key=lambda fund: fund['low'])
@@ -179,15 +213,6 @@ class NoDayTradesAlgorithm(Algorithm):
 
         Algorithm.log(self, "Executing perform_buy_sell:")
 
-        # Percentage of the current price to submit buy orders at
-        BUY_FACTOR = 0.99
-
-        # Percentage of the current price to submit sell orders at
-        SELL_FACTOR = 1.01
-
-        # Factor at which the stock may be higher than its average price over the past day and can still be bought
-        GAIN_FACTOR = 1.25
-
         # Get the user's buying power, or cash
         cash = self.cash
 
@@ -195,13 +220,12 @@ class NoDayTradesAlgorithm(Algorithm):
         Algorithm.cancel_open_orders(self)
 
         # Track the user's open orders
-        open_orders = self.query.user_open_orders()
+        open_orders = Algorithm.open_orders(self)
         open_order_symbols = {}
         open_buy_order_count = 0
         for order in open_orders:
 
-            stock = self.query.stock_from_instrument_url(order['instrument'])
-            open_order_symbols[stock['symbol']] = True
+            open_order_symbols[order['symbol']] = True
 
             # Increment number of current buy orders
             if 'side' in order and order['side'] == 'buy':
@@ -227,10 +251,7 @@ class NoDayTradesAlgorithm(Algorithm):
                         Algorithm.sell(self, quote.symbol, stock_shares, None, current_price)
                         pass
                 else:
-                    self.age[quote.symbol] = 1
-
-        # Overwrite the age file
-        self.overwrite_age_file()
+                    self.set_age(quote.symbol, 1)
 
         # Instantiate the weight for the number of simultaneous buy orders to be made
         weight_for_buy_order = float(1.00 / self.max_simult_buy_orders)
@@ -246,27 +267,23 @@ class NoDayTradesAlgorithm(Algorithm):
             # Store the current price of the candidate stock
             current_price = self.price(symbol)
 
-            # Get the history of the stock
-            history = self.portfolio.get_symbol_history(symbol, Span.TEN_MINUTE, Span.DAY)
+            # Get the mean of the stock's 10-minute closes over the past day, however many bars it has, advanced by the new bars only
+            day_mean = Algorithm.indicator(self, 'day_mean', symbol, lambda: WindowMean(Utility.span_to_seconds(Span.DAY)), Span.TEN_MINUTE, Span.DAY)
 
             if current_price != 0.0:
 
                 # Calculate stock close price mean over the past day
-                mean = 0.00
-                for price in history:
-                    mean += price.close
-                mean /= max(len(history), 1)
-                mean = round(mean, 2)
+                mean = round(float(day_mean.value), 2) if day_mean.ready else 0.00
 
                 if mean != 0.0:
 
                     # Calculate buy price
-                    if current_price > float(GAIN_FACTOR * mean):
+                    if current_price > float(self.gain_factor * mean):
                         # Set the buy_price to the current price if the stock is at a high compared to the average
                         buy_price = current_price
                     else:
                         # Otherwise, set the buy price equal to the current price
-                        buy_price = current_price * BUY_FACTOR
+                        buy_price = current_price * self.buy_factor
                     buy_price = round(buy_price, 2)
 
                     # Number of shares to buy is the weight of the buy order divided by the buy price times the number of available cash
@@ -282,30 +299,36 @@ class NoDayTradesAlgorithm(Algorithm):
 
 
     #
-    # Event Functions
+    # Age Functions
     #
 
-    # overwrite_age_file:Void
-    def overwrite_age_file(self):
+    # set_age:Void
+    # param symbol:String => Symbol of the position.
+    # param age:Integer => Number of sessions the position has been held for.
+    # NOTE: Commits the single key to the state store.
+    def set_age(self, symbol, age):
+        self.age[symbol] = age
         try:
-            if self.age_file is not None:
-                age_str = {}
-                for key, value in self.age.items():
-                    age_str[key] = str(value)
-                Utility.set_file_from_dict(self.age_file, age_str)
-            pass
-        except:
-            Utility.error("Could not overwrite " + self.age_file + " using the age dict.")
-            pass
-
-    # update_from_age_file:Void
-    def update_from_age_file(self):
+            self.state.set(self.age_namespace, symbol, age)
+        except sqlite3.Error as e:
+            Utility.error("Could not save the age of " + symbol + ": " + str(e))
+
+    # set_ages:Void
+    # param ages:{String:Integer} => Map of symbols to their new ages.
+    # NOTE: Commits every age at once, or none of them.
+    def set_ages(self, ages):
+        self.age.update(ages)
+        try:
+            self.state.update(self.age_namespace, ages)
+        except sqlite3.Error as e:
+            Utility.error("Could not save the ages: " + str(e))
+
+    # load_ages:Void
+    # NOTE: Imports the legacy age file on first use, then loads every age from the state store.
+    def load_ages(self):
         try:
             if self.age_file is not None:
-                self.age = Utility.get_file_as_dict(self.age_file)
-                for key, value in self.age.items():
-                    self.age[key] = int(value)
-            pass
-        except:
-            Utility.error("Could not update the age dict from " + self.age_file + ".")
-            pass
+                self.state.import_file(self.age_namespace, self.age_file, int)
+            self.age = self.state.items(self.age_namespace, int)
+        except (sqlite3.Error, IOError) as e:
+            Utility.error("Could not load the ages: " + str(e))
@@ -11,9 +11,6 @@ from utility import *
 from enums import *
 from mathematics import *
 
-# PriceModel
-from models.price import *
-
 from algorithms.__algorithm import *
 
 # Abstract: Algorithm that sells rapidly when stocks perform below a threshold.
@@ -23,8 +20,8 @@ class ShortIntensiveAlgorithm(Algorithm):
     # __init__:Void
     # param query:Query => Query object for API access.
     # param sec_interval:Integer => Time interval in seconds for event handling.
-    # param
-    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00):
+    # param params:{String:Any}? => Map of property names to values overriding the defaults below, e.g. for parameter sweeps.
+    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00, params = None):
 
         # Initialize properties
 
@@ -40,8 +37,11 @@ class ShortIntensiveAlgorithm(Algorithm):
         # List of stock symbols to trade
         self.symbols = []
 
-        # Map of symbols to lists of Price models
-        self.stock_data = {}
+        # Number of most recent ticks the price trend is fitted over
+        self.fit_window = 26
+
+        # Rolling quadratic fit of every symbol's price, updated once per tick
+        self.stock_fit = None
 
         # Map of symbols to first derivatives (rate of change)
         self.stock_delta1 = {}
@@ -53,15 +53,14 @@ class ShortIntensiveAlgorithm(Algorithm):
         self.stock_delta_perc = {}
 
         # Call super.__init__
-        Algorithm.__init__(self, query, portfolio, sec_interval, name = "Short Intensive", buy_range = self.buy_range, test = test, cash = cash)
+        Algorithm.__init__(self, query, portfolio, sec_interval, name = "Short Intensive", buy_range = self.buy_range, test = test, cash = cash, params = params)
 
     # initialize:void
     # NOTE: Configures the algorithm to run indefinitely.
     def initialize(self):
-        Algorithm.initialize(self)
 
         # Get all fundamentals within the buy range
-        unsorted_fundamentals = self.query.get_fundamentals_by_criteria(self.buy_range, self.categories)
+        unsorted_fundamentals = Algorithm.screen(self, self.buy_range, self.categories)
 
         # Store the symbols of each candidate fundamental into a separate array
         self.symbols = sorted([ fund['symbol'] for fund in unsorted_fundamentals ])
@@ -69,13 +68,16 @@ class ShortIntensiveAlgorithm(Algorithm):
         # Append the user's owned symbols
         for quote in self.portfolio.get_quotes():
             self.symbols.append(quote.symbol)
+        self.symbols = list(dict.fromkeys(self.symbols))
 
+        self.stock_fit = RollingFit(len(self.symbols), 2, window=self.fit_window)
         for symbol in self.symbols:
-            self.stock_data[symbol] = []
             self.stock_delta1[symbol] = 0
             self.stock_delta2[symbol] = 0
             self.stock_delta_perc[symbol] = 0
 
+        Algorithm.initialize(self)
+
         self.update_stock_data()
 
         pass
@@ -127,35 +129,32 @@ class ShortIntensiveAlgorithm(Algorithm):
     # Algorithm
     #
 
-    # update_stock_data:Void
-    def update_stock_data(self):
-
-        for symbol in self.stock_data:
-
-            # Get current price of the stock
-            current_price = self.price(symbol)
+    # universe:[String]
+    # Returns the symbols in the portfolio along with every traded symbol.
+    def universe(self):
+        return list(dict.fromkeys(Algorithm.universe(self) + self.symbols))
 
-            # Append current price to list
-            self.stock_data[symbol].append(Price(Utility.now_timestamp(), current_price, current_price, current_price, current_price))
+    # backtest_universe:[String]
+    # Returns the symbols in the portfolio along with every symbol in the buy range of the categories today.
+    def backtest_universe(self):
+        return list(dict.fromkeys(Algorithm.universe(self) + [ fund['symbol'] for fund in self.query.get_fundamentals_by_criteria(self.buy_range, self.categories) ]))
 
-            # Turn stock data into polynomial
-            t = y = []
-            for price in self.stock_data[symbol]:
-                t.append(price.time)
-                y.append(price.open)
+    # update_stock_data:Void
+    # NOTE: Adds the current price of every symbol to the rolling fit and reads off each trend's slope and concavity.
+    def update_stock_data(self):
 
-            # Get polynomial for symbol
-            try:
-                symbol_poly = Math.poly(t, y, 2)
-            except:
-                symbol_poly = Math.poly(t, y, 1)
+        # Current price of every symbol, fetched in bulk
+        self.prefetch_prices(self.symbols)
+        prices = np.array([ self.price(symbol) or np.nan for symbol in self.symbols ], dtype=np.float64)
 
-            # First derivative
-            self.stock_delta1[symbol] = Math.eval(Math.deriv(symbol_poly, 1), t[-1])
-            self.stock_delta_perc[symbol] = Math.p_div(self.stock_delta1[symbol], y[-1])
+        # Update the fit at the backtest's time, or now
+        self.stock_fit.update(self.timestamp if self.test else Utility.now_timestamp(), prices)
+        slopes, concavities = self.stock_fit.derivatives()
 
-            # Second derivative
-            self.stock_delta2[symbol] = Math.eval(Math.deriv(symbol_poly, 2), t[-1])
+        for i, symbol in enumerate(self.symbols):
+            self.stock_delta1[symbol] = float(np.nan_to_num(slopes[i]))
+            self.stock_delta_perc[symbol] = Math.p_div(self.stock_delta1[symbol], prices[i]) if prices[i] > 0 else 0.0
+            self.stock_delta2[symbol] = float(np.nan_to_num(concavities[i]))
 
         Algorithm.log(self, "Rates of change:")
         Algorithm.log(self, self.stock_delta1)
@@ -181,15 +180,8 @@ class ShortIntensiveAlgorithm(Algorithm):
                 # Buy if it reaches above half the buy threshold
                 cash = self.cash
                 spend_amount = min(cash, Math.p_mul(Math.p_mul(cash, self.stock_delta_perc[symbol]), 10))
-                stock_shares = self.portfolio.get_quote_from_portfolio(symbol).count or 0
                 stock_shares_to_buy = round(spend_amount/current_price)
                 did_buy = Algorithm.buy(self, symbol, stock_shares_to_buy, None, current_price)
-                if did_buy:
-                    if symbol not in self.stock_data:
-                        self.stock_data[symbol] = []
-                        self.stock_delta1[symbol] = 0
-                        self.stock_delta2[symbol] = 0
-                        self.stock_delta_perc[symbol] = 0
 
             elif self.stock_delta_perc[symbol] <= -self.threshold:
                 # Sell if it reaches below the short threshold
@@ -20,13 +20,22 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
     # __init__:Void
     # param query:Query => Query object for API access.
     # param sec_interval:Integer => Time interval in seconds for event handling.
-    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00):
+    # param params:{String:Any}? => Map of property names to values overriding the defaults below, e.g. for parameter sweeps.
+    def __init__(self, query, portfolio, sec_interval = 900, test = False, cash = 0.00, params = None):
 
         # Initialize properties
         self.buy_range = (0.00, 5.00)
 
+        # The percentage of the user's total equity to use for this algorithm
+        self.user_cash_percentage = 0.6
+
+        # Weight of each round of propensity calculation
+        self.round_1_weight = 1.1
+        self.round_2_weight = 1.7
+        self.round_3_weight = 1.3
+
         # Call super.__init__
-        Algorithm.__init__(self, query, portfolio, sec_interval, name = "Top Movers, No Day Trades", buy_range = self.buy_range, test = test, cash = cash)
+        Algorithm.__init__(self, query, portfolio, sec_interval, name = "Top Movers, No Day Trades", buy_range = self.buy_range, test = test, cash = cash, params = params)
 
         self.perform_buy_sell()
 
@@ -77,6 +86,18 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
     # Algorithm
     #
 
+    # backtest_universe:[String]
+    # Returns the symbols in the portfolio along with today's top movers.
+    def backtest_universe(self):
+        return list(dict.fromkeys(Algorithm.universe(self) + (self.query.get_by_tag(Tag.TOP_MOVERS) or [])))
+
+    # top_movers:[String]
+    # Returns the symbols of the top movers. While backtesting, returns the preloaded symbols (see backtest_universe).
+    def top_movers(self):
+        if self.test:
+            return [ fund['symbol'] for fund in Algorithm.screen(self, (0.00, sys.maxsize)) ]
+        return self.query.get_by_tag(Tag.TOP_MOVERS)
+
     # perform_buy_sell:Void
     # NOTE: Algorithm works like this:
     #   - Assign "purchase propensities" depending on the following criteria:
@@ -89,18 +110,10 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
 
         Algorithm.log(self, "Executing perform_buy_sell:")
 
-        # The percentage of the user's total equity to use for this algorithm
-        USER_CASH_PERCENTAGE = 0.6
-
-        # Weight of each round of propensity calculation
-        ROUND_1_WEIGHT = 1.1
-        ROUND_2_WEIGHT = 1.7
-        ROUND_3_WEIGHT = 1.3
-
-        Algorithm.log(self, "Cash percentage: " + str(USER_CASH_PERCENTAGE))
-        Algorithm.log(self, "Round 1 weight: " + str(ROUND_1_WEIGHT))
-        Algorithm.log(self, "Round 2 weight: " + str(ROUND_2_WEIGHT))
-        Algorithm.log(self, "Round 3 weight: " + str(ROUND_3_WEIGHT))
+        Algorithm.log(self, "Cash percentage: " + str(self.user_cash_percentage))
+        Algorithm.log(self, "Round 1 weight: " + str(self.round_1_weight))
+        Algorithm.log(self, "Round 2 weight: " + str(self.round_2_weight))
+        Algorithm.log(self, "Round 3 weight: " + str(self.round_3_weight))
 
         symbols_to_analyze = []
         symbol_quantity_map = {}
@@ -109,7 +122,7 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
             symbols_to_analyze.append(quote.symbol)
             symbol_quantity_map[quote.symbol] = quote.count
 
-        for symbol in self.query.get_by_tag(Tag.TOP_MOVERS):
+        for symbol in self.top_movers():
             if symbol not in symbol_quantity_map:
                 symbols_to_analyze.append(symbol)
                 symbol_quantity_map[symbol] = 0
@@ -117,12 +130,11 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
         # Store symbol count
         symbol_count = len(symbols_to_analyze)
 
-        # Store tuples for symbols to multiple different values
-
-        # symbol: quintuple
-        symbol_quintuple_map = {}
-        # (symbol, quintuple)
-        symbol_quintuples = []
+        # Store price series for symbols
+        # symbol: PriceSeries
+        symbol_history_map = {}
+        # (symbol, PriceSeries)
+        symbol_histories = []
 
         # Store tuples for polynomial evaluation
         # (symbol, value)
@@ -133,62 +145,63 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
         # symbol: propensity
         symbol_purchase_propensity = {}
 
-        # Loop through symbols
+        # Collect every symbol's historicals over the past week
         for symbol in symbols_to_analyze:
 
             # Default purchase propensity = 0
             symbol_purchase_propensity[symbol] = 0
 
-            # Get historicals over past week
-            symbol_historical = self.query.get_history(symbol, Span.TEN_MINUTE, Span.WEEK)
-
-            # Get historical quintuples per symbol
-            quintuples = Utility.get_quintuples_from_historicals(symbol_historical)
-
-            # Store the list of quintuples in the first map
-            symbol_quintuples.append((symbol, quintuples))
-            symbol_quintuple_map[symbol] = quintuples
-
-            # Keep track of x and y values to find the polynomial of best fit
-            x = []
-            y = []
-            for quintuple in quintuples:
-                x.append(quintuple[Quintuple.TIME.value])
-                y.append(quintuple[Quintuple.CLOSE.value])
-
-            # Store the polynomial (deg 2), first derivative (deg 1), and second derivative (deg 1)
-            symbol_poly = Math.poly(x, y, 2)
-
-            # First derivative
-            symbol_first_deriv.append((symbol, Math.eval(Math.deriv(symbol_poly, 1), x[-1])))
-
-            # Second derivative
-            symbol_second_deriv.append((symbol, Math.eval(Math.deriv(symbol_poly, 2), x[-1])))
-
-        # Store quintuples by open price, ascending
-        symbol_quintuples = sorted(symbol_quintuples, key=lambda pair: pair[1][-1][Quintuple.CLOSE.value])
+            history = Algorithm.history(self, symbol, Span.TEN_MINUTE, Span.WEEK)
+            if len(history) == 0:
+                continue
+
+            # Store the price series in the first map
+            symbol_histories.append((symbol, history))
+            symbol_history_map[symbol] = history
+
+        # Fit every symbol's quadratic at once, padding shorter histories with NaN
+        # Fit over days rather than seconds to keep the polynomials well-conditioned
+        if len(symbol_histories) > 0:
+            bars = max([ len(history) for symbol, history in symbol_histories ])
+            x = np.full((len(symbol_histories), bars), np.nan)
+            y = np.full((len(symbol_histories), bars), np.nan)
+            for i, (symbol, history) in enumerate(symbol_histories):
+                x[i, :len(history)] = history.time / 86400.0
+                y[i, :len(history)] = history.close
+            slopes, concavities, deficient = Math.batch_derivatives(x, y, 2)
+
+            # Rank only the symbols whose fit is fully determined
+            for i, (symbol, history) in enumerate(symbol_histories):
+                if deficient[i]:
+                    Algorithm.log(self, "Too few distinct bars to fit " + symbol)
+                    continue
+                symbol_first_deriv.append((symbol, slopes[i]))
+                symbol_second_deriv.append((symbol, concavities[i]))
+
+        # Store histories by last close price, ascending
+        symbol_histories = sorted(symbol_histories, key=lambda pair: pair[1].close[-1])
 
         # Sort lists of derivatives, descending
         symbol_first_deriv = sorted(symbol_first_deriv, key=lambda pair: pair[1], reverse=True)
         symbol_second_deriv = sorted(symbol_second_deriv, key=lambda pair: pair[1], reverse=True)
 
         # Assign 1st round of purchase propensities, by second derivative
-        factor = ROUND_1_WEIGHT ** symbol_count
+        factor = self.round_1_weight ** symbol_count
         for pair in symbol_second_deriv:
             symbol_purchase_propensity[pair[0]] += factor
-            factor /= ROUND_1_WEIGHT
+            factor /= self.round_1_weight
 
         # Assign 2nd round of purchase propensities, by first derivative
-        factor = ROUND_2_WEIGHT ** symbol_count
+        factor = self.round_2_weight ** symbol_count
         for pair in symbol_first_deriv:
             symbol_purchase_propensity[pair[0]] += factor
-            factor /= ROUND_2_WEIGHT
+            factor /= self.round_2_weight
 
         # Assign 3rd round of purchase propensities, by open price
-        factor = ROUND_3_WEIGHT ** symbol_count
-        for pair in symbol_quintuples:
+        factor = self.round_3_weight ** symbol_count
+        for pair in symbol_histories:
             symbol_purchase_propensity[pair[0]] += factor
-            factor /= ROUND_3_WEIGHT
+            factor /= self.round_3_weight
 
         # Convert the list of propensities into an array of tuples
         symbol_propensity_list = []
@@ -212,8 +225,8 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
         for pair in bad_performer_list:
             symbol = pair[0]
             quantity = symbol_quantity_map[symbol]
-            limit = symbol_quintuple_map[symbol][-1][Quintuple.LOW.value]
-            if quantity > 0.0:
+            if quantity > 0.0 and symbol in symbol_history_map:
+                limit = symbol_history_map[symbol].low[-1]
                 did_sell = Algorithm.sell(self, symbol, quantity, limit=limit)
 
         #
@@ -226,7 +239,7 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
 
         Algorithm.log(self, "Good performers: " + str(good_performer_list))
 
-        user_cash = USER_CASH_PERCENTAGE * self.cash
+        user_cash = self.user_cash_percentage * self.cash
 
         # Determine quantity of each stock to buy
         # Add a third value to the good_performer tuple, which is the amount we're able to spend on that stock
@@ -234,15 +247,17 @@ class TopMoversNoDayTradesAlgorithm(Algorithm):
         for performer in good_performer_list:
             total_propensity += performer[1]
         for i, performer in enumerate(good_performer_list):
-            amount_to_spend = (performer[1] / total_propensity) * user_cash
+            amount_to_spend = (performer[1] / total_propensity) * user_cash if total_propensity > 0 else 0.0
             good_performer_list[i] = (performer[0], performer[1], amount_to_spend)
             pass
 
         # Buy each good performer
         for triple in good_performer_list:
             symbol = triple[0]
-            quantity = round(triple[2] / symbol_quintuple_map[symbol][-1][Quintuple.HIGH.value])
-            limit = symbol_quintuple_map[symbol][-1][Quintuple.LOW.value]
+            if symbol not in symbol_history_map:
+                continue
+            quantity = round(triple[2] / symbol_history_map[symbol].high[-1])
+            limit = symbol_history_map[symbol].low[-1]
             if quantity > 0.0:
                 did_buy = Algorithm.buy(self, symbol, quantity, limit=limit)
 
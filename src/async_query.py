@@ -0,0 +1,269 @@
+# Anthony Krivonos
+# src/async_query.py
+
+# Imports
+import sys
+import random
+import asyncio
+from urllib.parse import urlparse
+
+# aiohttp
+import aiohttp
+
+from enums import *
+from utility import *
+from cache import *
+from limiter import *
+
+# Robinhood API endpoints
+QUOTES_URL = 'https://api.robinhood.com/quotes/'
+HISTORICALS_URL = 'https://api.robinhood.com/quotes/historicals/'
+FUNDAMENTALS_URL = 'https://api.robinhood.com/fundamentals/'
+INSTRUMENTS_URL = 'https://api.robinhood.com/instruments/'
+POSITIONS_URL = 'https://api.robinhood.com/positions/'
+
+# Maximum number of symbols or IDs sent in one bulk request, by endpoint
+QUOTES_PER_REQUEST = 100
+HISTORICALS_PER_REQUEST = 75
+FUNDAMENTALS_PER_REQUEST = 100
+INSTRUMENTS_PER_REQUEST = 50
+
+# Maximum number of requests per second, and in flight at once
+REQUEST_RATE = 20
+MAX_CONNECTIONS = 20
+
+# Seconds before a single request attempt is abandoned
+REQUEST_TIMEOUT = 10
+
+# Number of attempts per request, and the base of the exponential backoff between them, in seconds
+REQUEST_ATTEMPTS = 4
+BACKOFF_BASE = 0.25
+
+# HTTP statuses worth retrying
+RETRY_STATUSES = [ 429, 500, 502, 503, 504 ]
+
+# Abstract: Asyncio counterpart of Query for fan-out reads, using one pooled keep-alive HTTP session.
+#           Shares the logged-in Query's credentials and caches, so both clients can be used side by side.
+#           From synchronous code, wrap calls in run(...), e.g. `aq.run(aq.get_current_prices(symbols))`.
+
+class AsyncQuery:
+
+    # __init__:Void
+    # param query:Query => Logged-in Query whose auth headers, history, fundamentals and instrument caches are shared.
+    # param rate:Float => Maximum number of requests per second.
+    # param connections:Integer => Maximum number of requests in flight at once.
+    # param timeout:Float => Seconds before a single request attempt is abandoned.
+    # param attempts:Integer => Number of attempts per request before its error is raised.
+    def __init__(self, query, rate = REQUEST_RATE, connections = MAX_CONNECTIONS, timeout = REQUEST_TIMEOUT, attempts = REQUEST_ATTEMPTS):
+        self.query = query
+        self.rate = rate
+        self.connections = connections
+        self.timeout = timeout
+        self.attempts = attempts
+        self.limiter = AsyncRateLimiter(rate, connections)
+        self.session = None
+        self.loop = None
+
+    # NOTE: Pickles only the configuration, since sessions and event loops cannot cross processes.
+    def __getstate__(self):
+        return { 'query': self.query, 'rate': self.rate, 'connections': self.connections, 'timeout': self.timeout, 'attempts': self.attempts }
+
+    def __setstate__(self, state):
+        self.__init__(state['query'], state['rate'], state['connections'], state['timeout'], state['attempts'])
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    ##
+    #
+    #   MARK: - SESSION
+    #
+    ##
+
+    # open:Void (async)
+    # NOTE: Opens the pooled session on the running event loop, if it is not open already.
+    async def open(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector, headers=dict(self.query.trader.headers or {}), timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    # close:Void (async)
+    # NOTE: Closes the pooled session and its connections.
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # run:Any
+    # param coroutine:Coroutine => Coroutine to run, e.g. one of this class's methods.
+    # NOTE: Runs the coroutine to completion on this client's own event loop, keeping the session open between calls.
+    # returns The coroutine's result.
+    def run(self, coroutine):
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    # shutdown:Void
+    # NOTE: Closes the session and the event loop used by run(...).
+    def shutdown(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.run_until_complete(self.close())
+            self.loop.close()
+        self.loop = None
+
+    ##
+    #
+    #   MARK: - REQUESTS
+    #
+    ##
+
+    # get:Any (async)
+    # param url:String => URL to GET.
+    # param params:{String:String}? => Query parameters.
+    # NOTE: Rate limited, retried with full-jitter exponential backoff on timeouts, connection errors and RETRY_STATUSES.
+    #       The latency of each request, retries included, is recorded in the Query's metrics by endpoint.
+    # returns The decoded JSON response.
+    async def get(self, url, params = None):
+        with self.query.metrics.timer('async_request_seconds', ('endpoint', urlparse(url).path.split('/')[1])):
+            return await self.__get(url, params)
+
+    # __get:Any (async)
+    # param url:String => URL to GET.
+    # param params:{String:String}? => Query parameters.
+    # returns The decoded JSON response, after any retries.
+    async def __get(self, url, params = None):
+        await self.open()
+        for attempt in range(self.attempts):
+            await self.limiter.acquire()
+            try:
+                async with self.session.get(url, params=params) as response:
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    error = aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt + 1 < self.attempts:
+                await asyncio.sleep(random.uniform(0, BACKOFF_BASE * 2 ** attempt))
+        raise error
+
+    # gather:[Any] (async)
+    # param coroutines:[Coroutine] => Coroutines to run concurrently.
+    # param limit:Integer? => Maximum number running at once. Defaults to the connection limit.
+    # param return_exceptions:Boolean => If True, failed coroutines give their exception instead of raising it.
+    # returns The results, in the order of the coroutines.
+    async def gather(self, coroutines, limit = None, return_exceptions = False):
+        semaphore = asyncio.Semaphore(limit or self.connections)
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+        return await asyncio.gather(*[ bounded(coroutine) for coroutine in coroutines ], return_exceptions=return_exceptions)
+
+    # __bulk:[Any] (async)
+    # param url:String => Bulk endpoint URL.
+    # param key:String => Query parameter listing the items, like 'symbols' or 'ids'.
+    # param items:[String] => Items to request.
+    # param size:Integer => Maximum number of items per request.
+    # param params:{String:String}? => Other query parameters.
+    # returns The concatenated 'results' of every chunk, with chunks requested concurrently.
+    async def __bulk(self, url, key, items, size, params = None):
+        chunks = [ items[i:i + size] for i in range(0, len(items), size) ]
+        pages = await self.gather([ self.get(url, Utility.merge_dicts(params or {}, { key: ','.join(chunk) })) for chunk in chunks ])
+        return [ result for page in pages for result in (page.get('results') or []) ]
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # get_current_prices:{String:Float} (async)
+    # param symbols:[String] => List of string symbols to price.
+    # NOTE: Serves recently cached quotes from the shared response cache and fetches the rest with bulk requests.
+    # returns Map of symbols to the float value of their current price. Symbols without a quote are left out.
+    async def get_current_prices(self, symbols):
+        prices = {}
+        for symbol in dict.fromkeys(symbols):
+            quote = self.query.responses.get('quote', symbol)
+            if quote is not MISSING and quote is not None and quote.get('last_trade_price') is not None:
+                prices[symbol] = float(quote['last_trade_price'])
+        missing = [ symbol for symbol in dict.fromkeys(symbols) if symbol not in prices ]
+        for quote in await self.__bulk(QUOTES_URL, 'symbols', missing, QUOTES_PER_REQUEST):
+            if quote is not None and quote.get('last_trade_price') is not None:
+                self.query.responses.set('quote', quote['symbol'], quote)
+                prices[quote['symbol']] = float(quote['last_trade_price'])
+        return prices
+
+    # get_history_columns:{String:{String:np.array}} (async)
+    # param symbols:[String] => List of string symbols.
+    # param interval:Span => Time in between each value. (default: DAY)
+    # param span:Span => Range for the data to be returned. (default: YEAR)
+    # param bounds:Span => The bounds to be included. (default: REGULAR)
+    # NOTE: Serves fresh entries from the shared history cache and fetches the rest with bulk requests.
+    # returns Map of symbols to maps of 'time', 'open', 'close', 'high', 'low' and 'volume' to arrays.
+    async def get_history_columns(self, symbols, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        history = self.query.history
+        columns = {}
+        for symbol in dict.fromkeys(symbols):
+            cached = history.fresh(symbol, interval, span, bounds)
+            if cached is not None:
+                columns[symbol] = cached
+        missing = [ symbol for symbol in dict.fromkeys(symbols) if symbol not in columns ]
+        params = { 'interval': interval.value, 'span': span.value, 'bounds': bounds.value }
+        fetched = { result['symbol']: result for result in await self.__bulk(HISTORICALS_URL, 'symbols', missing, HISTORICALS_PER_REQUEST, params) if result is not None }
+        for symbol in missing:
+            if symbol in fetched:
+                columns[symbol] = history.get(symbol, interval, span, bounds, lambda *args: fetched[symbol])
+        return columns
+
+    # get_fundamentals:{String:Dict} (async)
+    # param symbols:[String] => List of string symbols.
+    # NOTE: Serves entries from the shared fundamentals cache and fetches the rest with bulk requests.
+    # returns Map of symbols to fundamentals, each with its 'symbol'. Symbols without fundamentals are left out.
+    async def get_fundamentals(self, symbols):
+        fundamentals = {}
+        for symbol in dict.fromkeys(symbols):
+            cached = self.query.responses.get('fundamentals', symbol)
+            if cached is not MISSING:
+                fundamentals[symbol] = cached
+        missing = [ symbol for symbol in dict.fromkeys(symbols) if symbol not in fundamentals ]
+        results = await self.__bulk(FUNDAMENTALS_URL, 'symbols', missing, FUNDAMENTALS_PER_REQUEST)
+        for symbol, result in zip(missing, results):
+            self.query.responses.set('fundamentals', symbol, result)
+            fundamentals[symbol] = result
+        return { symbol: Utility.merge_dicts(result, { 'symbol': symbol }) for symbol, result in fundamentals.items() if result is not None }
+
+    # prewarm_instruments:Void (async)
+    # param urls:[String] => URLs of instruments to cache.
+    # NOTE: Fetches every uncached instrument into the shared instrument cache with concurrent bulk requests.
+    async def prewarm_instruments(self, urls):
+        missing = [ url for url in dict.fromkeys(urls) if url not in self.query.instruments ]
+        if len(missing) == 0:
+            return
+        for instrument in await self.__bulk(INSTRUMENTS_URL, 'ids', [ InstrumentCache.id_from_url(url) for url in missing ], INSTRUMENTS_PER_REQUEST):
+            if instrument is not None:
+                self.query.instruments.put(instrument)
+        await self.gather([ self.__fetch_instrument(url) for url in missing if url not in self.query.instruments ])
+        self.query.instruments.save()
+
+    # __fetch_instrument:Void (async)
+    # param url:String => URL of an instrument missing from the bulk response.
+    async def __fetch_instrument(self, url):
+        self.query.instruments.put(await self.get(url))
+
+    ##
+    #
+    #   MARK: - USER METHODS
+    #
+    ##
+
+    # user_stock_portfolio:[String:String] (async)
+    # returns Stock portfolio for the user, each position merged with its instrument.
+    async def user_stock_portfolio(self):
+        positions = (await self.get(POSITIONS_URL, { 'nonzero': 'true' })).get('results') or []
+        await self.prewarm_instruments([ position['instrument'] for position in positions ])
+        return [ Utility.merge_dicts(position, self.query.instruments.get(position['instrument'])) for position in positions ]
@@ -0,0 +1,235 @@
+# Anthony Krivonos
+# src/backends.py
+
+# Imports
+import sys
+import os
+import gzip
+import json
+import random
+import threading
+from time import sleep
+
+# Abstract: Pluggable trader backends for Query (see its trader parameter).
+#           Recorder wraps a live Robinhood client and captures its responses to a gzipped JSON file, and Replayer serves
+#           a recording back without credentials or network, with configurable latency, for offline tests and benchmarks.
+
+# Methods that are passed through without being recorded, since their arguments hold credentials
+UNRECORDED_METHODS = [ 'login', 'logout' ]
+
+# Version of the recording file format
+RECORDING_VERSION = 1
+
+class ReplayError(KeyError):
+    pass
+
+class Backend:
+
+    # key:String (static)
+    # param method:String => Name of the method called, like 'quote_data'. Raw session requests are named 'session.get'.
+    # param args:(Any) => Positional arguments of the call.
+    # param kwargs:{String:Any} => Keyword arguments of the call.
+    # returns The canonical JSON key a call's responses are stored under.
+    @staticmethod
+    def key(method, args, kwargs):
+        return json.dumps([ method, list(args), kwargs ], sort_keys=True, default=str)
+
+    # describe:String (static)
+    # param key:String => Key of a call.
+    # returns The call in a readable form, like "quote_data('AAPL')".
+    @staticmethod
+    def describe(key):
+        method, args, kwargs = json.loads(key)
+        return method + '(' + ', '.join([ repr(arg) for arg in args ] + [ name + '=' + repr(value) for name, value in kwargs.items() ]) + ')'
+
+class Recorder:
+
+    # __init__:Void
+    # param trader:Robinhood => Live client whose responses are recorded.
+    # param path:String => Gzipped JSON file the recording is saved to, like 'recordings/session.json.gz'.
+    def __init__(self, trader, path):
+        self.trader = trader
+        self.path = path
+        self.session = RecordingSession(self)
+        self.__calls = {}
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles the client and the calls recorded so far, without the lock. Copies in worker processes (e.g. of a
+    #       Sweep) record on their own, so calls they make are not saved by this recorder.
+    def __getstate__(self):
+        with self.__lock:
+            return { 'trader': self.trader, 'path': self.path, 'calls': { key: list(responses) for key, responses in self.__calls.items() } }
+
+    def __setstate__(self, state):
+        self.__init__(state['trader'], state['path'])
+        self.__calls = state['calls']
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('_Recorder__') or (attribute.startswith('__') and attribute.endswith('__')):
+            raise AttributeError(attribute)
+        value = getattr(self.trader, attribute)
+        if not callable(value) or attribute in UNRECORDED_METHODS:
+            return value
+        def recorded(*args, **kwargs):
+            return self.record(attribute, args, kwargs, value(*args, **kwargs))
+        return recorded
+
+    # record:Any
+    # param method:String => Name of the method called.
+    # param args:(Any) => Positional arguments of the call.
+    # param kwargs:{String:Any} => Keyword arguments of the call.
+    # param response:Any => JSON-serializable response.
+    # NOTE: Repeated calls keep every response in order, so changing responses (e.g. order history) replay in sequence.
+    # returns The response.
+    def record(self, method, args, kwargs, response):
+        key = Backend.key(method, args, kwargs)
+        with self.__lock:
+            self.__calls.setdefault(key, []).append(response)
+        return response
+
+    def __len__(self):
+        return len(self.__calls)
+
+    # save:Void
+    # NOTE: Writes every recorded call to the file atomically.
+    def save(self):
+        with self.__lock:
+            recording = { 'version': RECORDING_VERSION, 'calls': [ [ key, responses ] for key, responses in self.__calls.items() ] }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.' + str(threading.get_ident()) + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as file:
+            json.dump(recording, file)
+        os.replace(temp_path, self.path)
+
+class RecordingSession:
+
+    # __init__:Void
+    # param recorder:Recorder => Recorder whose live client's session is wrapped.
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def __getattr__(self, attribute):
+        return getattr(self.recorder.trader.session, attribute)
+
+    # get:Response
+    # NOTE: Makes the request on the live session and records its decoded JSON under 'session.get'.
+    # returns The live response.
+    def get(self, url, params = None, timeout = None):
+        response = self.recorder.trader.session.get(url, params=params, timeout=timeout)
+        self.recorder.record('session.get', [ url ], { 'params': params }, response.json())
+        return response
+
+class Replayer:
+
+    # __init__:Void
+    # param path:String => Gzipped JSON file saved by a Recorder.
+    # param latency:Float => Seconds every call waits before responding, to simulate the network. (default: 0)
+    # param jitter:Float => Maximum extra seconds added to each call's latency, drawn uniformly. (default: 0)
+    # param seed:Integer => Seed of the jitter, so replays are deterministic.
+    # param strict:Boolean => If False, order placements and cancellations missing from the recording are acknowledged
+    #                         with synthetic responses. Other missing calls always raise a ReplayError.
+    def __init__(self, path, latency = 0.0, jitter = 0.0, seed = 0, strict = False):
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.strict = strict
+        self.headers = {}
+        self.session = ReplaySession(self)
+        self.__calls = {}
+        self.__served = {}
+        self.__orders = 0
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            recording = json.load(file)
+        if recording.get('version') != RECORDING_VERSION:
+            raise ValueError("Unsupported recording version in " + path + ": " + str(recording.get('version')))
+        for key, responses in recording['calls']:
+            self.__calls[key] = responses
+
+    # NOTE: Pickles only the configuration, so worker processes reload the recording and replay it from the start.
+    def __getstate__(self):
+        return { 'path': self.path, 'latency': self.latency, 'jitter': self.jitter, 'seed': self.seed, 'strict': self.strict }
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['latency'], state['jitter'], state['seed'], state['strict'])
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('_Replayer__') or (attribute.startswith('__') and attribute.endswith('__')):
+            raise AttributeError(attribute)
+        def replayed(*args, **kwargs):
+            return self.replay(attribute, args, kwargs)
+        return replayed
+
+    def __len__(self):
+        return len(self.__calls)
+
+    # login:Boolean
+    # returns True, since replays need no credentials.
+    def login(self, username = None, password = None, *args, **kwargs):
+        return True
+
+    # logout:Void
+    def logout(self, *args, **kwargs):
+        pass
+
+    # replay:Any
+    # param method:String => Name of the method called.
+    # param args:(Any) => Positional arguments of the call.
+    # param kwargs:{String:Any} => Keyword arguments of the call.
+    # NOTE: Waits for the configured latency. Repeated calls are served the recorded responses in order, then the last one again.
+    # returns The recorded response.
+    def replay(self, method, args, kwargs):
+        key = Backend.key(method, args, kwargs)
+        with self.__lock:
+            delay = self.latency + (self.__random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+            responses = self.__calls.get(key)
+            if responses is not None:
+                index = self.__served.get(key, 0)
+                self.__served[key] = index + 1
+                response = responses[min(index, len(responses) - 1)]
+            elif not self.strict and (method.startswith('place_') or method == 'cancel_order'):
+                self.__orders += 1
+                response = { 'id': 'replay-' + str(self.__orders), 'state': 'cancelled' if method == 'cancel_order' else 'queued', 'method': method, 'args': list(args) }
+            else:
+                raise ReplayError("No recorded response for " + Backend.describe(key) + " in " + self.path)
+        if delay > 0:
+            sleep(delay)
+        return response
+
+    # rewind:Void
+    # NOTE: Serves every call's responses from the first one again.
+    def rewind(self):
+        with self.__lock:
+            self.__served = {}
+            self.__orders = 0
+            self.__random = random.Random(self.seed)
+
+class ReplaySession:
+
+    # __init__:Void
+    # param replayer:Replayer => Replayer serving the recorded 'session.get' calls.
+    def __init__(self, replayer):
+        self.replayer = replayer
+
+    # get:ReplayResponse
+    # returns The recorded response of the request.
+    def get(self, url, params = None, timeout = None):
+        return ReplayResponse(self.replayer.replay('session.get', [ url ], { 'params': params }))
+
+class ReplayResponse:
+
+    # __init__:Void
+    # param data:Any => Decoded JSON body.
+    def __init__(self, data):
+        self.data = data
+        self.status_code = 200
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
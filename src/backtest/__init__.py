@@ -0,0 +1,4 @@
+from backtest.data import *
+from backtest.orders import *
+from backtest.engine import *
+from backtest.sweep import *
@@ -0,0 +1,215 @@
+# Anthony Krivonos
+# src/backtest/data.py
+
+# Imports
+import os
+import json
+from collections.abc import Mapping
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# PriceSeriesModel
+from models.price_series import *
+
+# Abstract: Preloaded (time x symbol x field) price data for backtests, and read-only price views over it.
+
+class BacktestData:
+
+    # Field indices along the last axis of bars
+    OPEN = 0
+    CLOSE = 1
+    HIGH = 2
+    LOW = 3
+    FIELD_COUNT = 4
+
+    # __init__:Void
+    # param times:[float] => Sorted timestamps of every bar.
+    # param symbols:[String] => Symbols along the second axis of bars.
+    # param bars:np.array => Array of shape (len(times), len(symbols), FIELD_COUNT). Missing bars are NaN.
+    def __init__(self, times, symbols, bars):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.symbols = list(symbols)
+        self.bars = bars
+        self.index = { symbol: i for i, symbol in enumerate(self.symbols) }
+
+    ##
+    #
+    #   MARK: - CONSTRUCTORS
+    #
+    ##
+
+    # from_series:BacktestData (static)
+    # param series_map:{String:PriceSeries} => Map of symbols to price series.
+    # returns Backtest data aligned on the union of all bar times, with gaps forward-filled.
+    @staticmethod
+    def from_series(series_map):
+        times = np.zeros(0)
+        for series in series_map.values():
+            times = np.union1d(times, series.time)
+        data = BacktestData(times, [], np.full((len(times), 0, BacktestData.FIELD_COUNT), np.nan))
+        data.add_symbols(series_map)
+        return data
+
+    # preload:BacktestData (static)
+    # param portfolio:Portfolio => Portfolio used to query history.
+    # param symbols:[String] => Symbols to load.
+    # param interval:Span => Time in between each bar.
+    # param span:Span => Range of the backtest.
+    # param bounds:Bounds => The bounds to be included.
+    # returns Backtest data for every given symbol.
+    @staticmethod
+    def preload(portfolio, symbols, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        return BacktestData.from_series({ symbol: portfolio.get_symbol_history(symbol, interval, span, bounds) for symbol in dict.fromkeys(symbols) })
+
+    ##
+    #
+    #   MARK: - SETTERS
+    #
+    ##
+
+    # add_symbols:Void
+    # param series_map:{String:PriceSeries} => Map of new symbols to price series. Bars off the time axis are ignored.
+    def add_symbols(self, series_map):
+        series_map = { symbol: series for symbol, series in series_map.items() if symbol not in self.index }
+        if len(series_map) == 0:
+            return
+        added = np.full((len(self.times), len(series_map), BacktestData.FIELD_COUNT), np.nan)
+        for j, (symbol, series) in enumerate(series_map.items()):
+            rows = np.searchsorted(self.times, series.time)
+            on_axis = (rows < len(self.times))
+            on_axis[on_axis] = self.times[rows[on_axis]] == series.time[on_axis]
+            rows = rows[on_axis]
+            added[rows, j, BacktestData.OPEN] = series.open[on_axis]
+            added[rows, j, BacktestData.CLOSE] = series.close[on_axis]
+            added[rows, j, BacktestData.HIGH] = series.high[on_axis]
+            added[rows, j, BacktestData.LOW] = series.low[on_axis]
+            self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        BacktestData.forward_fill(added)
+        self.bars = np.concatenate((self.bars, added), axis=1)
+
+    # forward_fill:Void (static)
+    # param bars:np.array => Array of shape (times, symbols, fields) to fill in place.
+    # NOTE: Replaces every missing bar with the close of the previous bar. Leading gaps stay NaN.
+    @staticmethod
+    def forward_fill(bars):
+        missing = np.isnan(bars[:, :, BacktestData.CLOSE])
+        if not missing.any():
+            return
+        rows = np.where(missing, 0, np.arange(len(bars))[:, None])
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        columns = np.arange(bars.shape[1])[None, :]
+        filled = bars[rows, columns, BacktestData.CLOSE]
+        for field in range(BacktestData.FIELD_COUNT):
+            bars[:, :, field] = np.where(missing, filled, bars[:, :, field])
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # row:np.array
+    # param step:Integer => Index along the time axis.
+    # param field:Integer => Field index.
+    # returns A view of the given field for every symbol at the given step.
+    def row(self, step, field):
+        return self.bars[step, :, field]
+
+    # view:PriceView
+    # param step:Integer => Index along the time axis.
+    # param field:Integer => Field index.
+    # returns A mapping of symbols to prices backed by the given row.
+    def view(self, step, field):
+        return PriceView(self.index, self.row(step, field))
+
+    # screen:[{String:Any}]
+    # param stop:Integer => Number of completed bars. Symbols are screened by the low and high of the last completed bar,
+    #                       or by the first bar's open if none has completed.
+    # param price_range:(Float, Float) => Range the low and high must lie within.
+    # returns Fundamentals of every symbol in range, each with its 'symbol', 'low' and 'high'.
+    def screen(self, stop, price_range):
+        if len(self.times) == 0:
+            return []
+        if stop > 0:
+            low, high = self.bars[stop - 1, :, BacktestData.LOW], self.bars[stop - 1, :, BacktestData.HIGH]
+        else:
+            low = high = self.bars[0, :, BacktestData.OPEN]
+        in_range = np.flatnonzero((low >= price_range[0]) & (high <= price_range[1]))
+        return [ { 'symbol': self.symbols[i], 'low': float(low[i]), 'high': float(high[i]) } for i in in_range ]
+
+    # series:PriceSeries
+    # param symbol:String => Symbol to return bars for.
+    # param stop:Integer? => Index along the time axis to stop before. If None, returns all bars.
+    # returns A price series of the symbol's bars, skipping leading gaps.
+    def series(self, symbol, stop = None):
+        bars = self.bars[:stop, self.index[symbol], :]
+        valid = ~np.isnan(bars[:, BacktestData.CLOSE])
+        return PriceSeries(self.times[:stop][valid], bars[valid, BacktestData.OPEN], bars[valid, BacktestData.CLOSE], bars[valid, BacktestData.HIGH], bars[valid, BacktestData.LOW])
+
+    ##
+    #
+    #   MARK: - PERSISTENCE
+    #
+    ##
+
+    # save:Void
+    # param directory:String => Directory to write times.npy, bars.npy and symbols.json into.
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'times.npy'), self.times)
+        np.save(os.path.join(directory, 'bars.npy'), np.ascontiguousarray(self.bars))
+        with open(os.path.join(directory, 'symbols.json'), 'w') as file:
+            json.dump(self.symbols, file)
+
+    # load:BacktestData (static)
+    # param directory:String => Directory written by save(...).
+    # param mmap:Boolean => If True, memory-maps the bars read-only instead of reading them into memory.
+    # returns The loaded backtest data.
+    @staticmethod
+    def load(directory, mmap = True):
+        with open(os.path.join(directory, 'symbols.json'), 'r') as file:
+            symbols = json.load(file)
+        times = np.load(os.path.join(directory, 'times.npy'))
+        bars = np.load(os.path.join(directory, 'bars.npy'), mmap_mode='r' if mmap else None)
+        return BacktestData(times, symbols, bars)
+
+# Abstract: Read-only map of symbols to prices, backed by one row of a BacktestData array.
+#           Symbols without a price at the row are treated as missing.
+
+class PriceView(Mapping):
+
+    # __init__:Void
+    # param index:{String:Integer} => Map of symbols to column indices.
+    # param row:np.array => Prices for each column.
+    def __init__(self, index, row):
+        self.__index = index
+        self.__row = row
+
+    def __getitem__(self, symbol):
+        i = self.__index.get(symbol)
+        if i is None or i >= len(self.__row) or np.isnan(self.__row[i]):
+            raise KeyError(symbol)
+        return float(self.__row[i])
+
+    def __contains__(self, symbol):
+        i = self.__index.get(symbol)
+        return i is not None and i < len(self.__row) and not np.isnan(self.__row[i])
+
+    def __iter__(self):
+        for symbol, i in self.__index.items():
+            if i < len(self.__row) and not np.isnan(self.__row[i]):
+                yield symbol
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.__row)))
+
+    def __str__(self):
+        return str(dict(self))
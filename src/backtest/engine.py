@@ -0,0 +1,482 @@
+# Anthony Krivonos
+# src/backtest/engine.py
+
+# Imports
+import sys
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# Sessions
+from sessions import *
+
+# History Cache
+from cache.history import *
+
+# QuoteModel
+from models.quote import *
+
+# Backtesting
+from backtest.data import *
+from backtest.orders import *
+
+# Abstract: Event-driven backtest engine. History is preloaded once into a (time x symbol x field) array,
+#           event hooks receive array-backed price views, and cash, positions and fills are kept in NumPy ledgers.
+#           Daily bars fire every event once per bar. Intraday bars are replayed at the algorithm's sec_interval,
+#           with events grouped into market sessions and history resampled from the bars seen so far.
+#           Orders go through a simulated order book, matched against every bar before its events fire.
+
+class Ledger:
+
+    # Structured dtype of one fill
+    FILL_DTYPE = np.dtype([ ('step', np.int64), ('time', np.float64), ('symbol', np.int32), ('quantity', np.float64), ('price', np.float64) ])
+
+    # __init__:Void
+    # param cash:Float => Starting cash.
+    # param symbol_count:Integer => Number of symbols to hold positions in.
+    # param step_count:Integer => Number of steps to record equity for.
+    def __init__(self, cash, symbol_count, step_count):
+        self.cash = cash
+        self.positions = np.zeros(symbol_count)
+        self.equity = np.full(step_count, np.nan)
+        self.fills = np.zeros(64, dtype=Ledger.FILL_DTYPE)
+        self.fill_count = 0
+
+    # resize:Void
+    # param symbol_count:Integer => New number of symbols.
+    def resize(self, symbol_count):
+        if symbol_count > len(self.positions):
+            self.positions = np.concatenate((self.positions, np.zeros(symbol_count - len(self.positions))))
+
+    # record:Void
+    # param step:Integer => Index along the time axis.
+    # param time:Float => Timestamp of the fill.
+    # param symbol:Integer => Column index of the symbol.
+    # param quantity:Float => Signed number of shares (positive for buys, negative for sells).
+    # param price:Float => Price per share.
+    def record(self, step, time, symbol, quantity, price):
+        if self.fill_count == len(self.fills):
+            self.fills = np.concatenate((self.fills, np.zeros(len(self.fills), dtype=Ledger.FILL_DTYPE)))
+        self.fills[self.fill_count] = (step, time, symbol, quantity, price)
+        self.fill_count += 1
+        self.positions[symbol] += quantity
+        self.cash -= quantity * price
+
+    # get_fills:np.array
+    # returns The structured array of recorded fills.
+    def get_fills(self):
+        return self.fills[:self.fill_count]
+
+    # max_drawdown:Float
+    # returns The largest peak-to-trough drop in equity, as a fraction of the peak.
+    def max_drawdown(self):
+        equity = self.equity[~np.isnan(self.equity)]
+        if len(equity) == 0:
+            return 0.0
+        peaks = np.maximum.accumulate(equity)
+        return float(np.max((peaks - equity) / np.where(peaks > 0, peaks, 1)))
+
+class Backtest:
+
+    # Data shared by every backtest in this process, e.g. memory-mapped by a sweep worker
+    shared_data = None
+
+    # __init__:Void
+    # param algorithm:Algorithm => The algorithm to backtest.
+    # param interval:Span => Time in between each bar. (default: DAY)
+    # param span:Span => Range of the backtest. (default: YEAR)
+    # param bounds:Bounds => The bounds to be included. (default: REGULAR)
+    # param data:BacktestData? => Preloaded data. If None, uses shared_data or preloads the algorithm's backtest_universe().
+    # NOTE: Symbols missing from preloaded data are loaded on first use, unless the data was given or shared.
+    #       Whether to replay intraday is decided by the spacing of the data's bars, not by interval.
+    def __init__(self, algorithm, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR, data = None):
+        self.algorithm = algorithm
+        self.interval = interval
+        self.span = span
+        self.bounds = bounds
+        self.data = data if data is not None else Backtest.shared_data
+        self.lazy = self.data is None
+        if self.lazy:
+            self.data = BacktestData.preload(algorithm.portfolio, algorithm.backtest_universe(), interval, span, bounds)
+        self.bar_seconds = Backtest.bar_seconds(self.data.times, interval)
+        self.intraday = self.bar_seconds < Utility.span_to_seconds(Span.DAY)
+        self.step = 0
+        self.field = BacktestData.OPEN
+        self.ledger = None
+        self.orders = SimulatedOrders()
+        self.session = 0
+        self.start_value = 0.00
+        self.missing = set()
+
+    # bar_seconds:Float (static)
+    # param times:np.array => Sorted timestamps of every bar.
+    # param interval:Span => Interval to fall back on if there are too few bars to tell.
+    # returns The typical number of seconds between consecutive bars.
+    @staticmethod
+    def bar_seconds(times, interval):
+        if len(times) < 2:
+            return float(Utility.span_to_seconds(interval))
+        return float(np.median(np.diff(times)))
+
+    # session_ids:np.array (static)
+    # param times:np.array => Sorted timestamps of every bar.
+    # param market:String => Name of the market calendar. (default: 'NYSE')
+    # returns The index of the latest market session opened by each bar, or its UTC day if the calendar is unavailable.
+    @staticmethod
+    def session_ids(times, market = 'NYSE'):
+        try:
+            return Sessions.shared(market).opened_session_ids(times)
+        except ImportError:
+            return (np.asarray(times) // Utility.span_to_seconds(Span.DAY)).astype(np.int64)
+
+    ##
+    #
+    #   MARK: - RUNNING
+    #
+    ##
+
+    # run:Dict
+    # returns The results of the backtest (see results()).
+    def run(self):
+        algorithm = self.algorithm
+        times = self.data.times
+
+        # Assure enough historicals data will be processed
+        if len(times) == 0:
+            algorithm.log("Not enough data for a backtest.", 't')
+            return None
+
+        # Assure enough cash is allocated
+        if algorithm.cash == 0.00:
+            algorithm.log("Not enough starting cash for backtest.", 't')
+            return None
+
+        # Open the ledger with the portfolio's current positions
+        self.ledger = Ledger(algorithm.cash, len(self.data.symbols), len(times))
+        for quote in algorithm.portfolio.get_quotes():
+            self.__column(quote.symbol)
+            if quote.symbol in self.data.index:
+                self.ledger.positions[self.data.index[quote.symbol]] += quote.count
+        start_value = self.ledger.cash + self.value()
+        self.start_value = start_value
+
+        algorithm.log("Starting backtest from " + Utility.get_timestamp_string(times[0]) + " to " + Utility.get_timestamp_string(times[-1]) + " with $" + str(start_value), 't')
+
+        # Run through timeline
+        if self.intraday:
+            self.__run_intraday(start_value)
+        else:
+            self.__run_daily(start_value)
+
+        results = self.results()
+        self.__announce("Final results (backtest)", start_value, results['end_value'])
+        return results
+
+    # __run_daily:Void
+    # param start_value:Float => Value at the start of the backtest.
+    # NOTE: Fires every event on each bar, with while_market_open once at the low and once at the high. Orders placed at
+    #       the open can fill anywhere within the bar, and orders placed at the low or high at its close, so good-for-day
+    #       orders get their whole session before they expire.
+    def __run_daily(self, start_value):
+        algorithm = self.algorithm
+        times = self.data.times
+        for step in range(len(times)):
+            self.step = step
+            algorithm.timestamp = times[step]
+            self.__match()
+            if step > 0:
+                self.__add_bar(step - 1)
+
+            # Execute events with appropriate prices
+            self.__fire(algorithm.on_market_will_open, BacktestData.OPEN)
+            self.__fire(algorithm.on_market_open, BacktestData.OPEN)
+            self.__match(BacktestData.OPEN)
+            self.__fire(algorithm.while_market_open, BacktestData.LOW)
+            self.__fire(algorithm.while_market_open, BacktestData.HIGH)
+            self.__match(BacktestData.CLOSE)
+            self.session += 1
+            self.__fire(algorithm.on_market_close, BacktestData.CLOSE)
+            self.orders.expire(self.session - 1)
+
+            self.ledger.equity[step] = self.ledger.cash + self.value()
+            self.__announce(Utility.get_timestamp_string(times[step]) + " (backtest)", start_value, self.ledger.equity[step])
+        self.__add_bar(len(times) - 1)
+
+    # __run_intraday:Void
+    # param start_value:Float => Value at the start of the backtest.
+    # NOTE: Opens each session at its first bar's open, ticks while_market_open at the close of the first bar of every
+    #       sec_interval, and closes the session at its last bar's close. Results are announced once per session.
+    def __run_intraday(self, start_value):
+        algorithm = self.algorithm
+        times = self.data.times
+        opens, ticks, closes = self.schedule()
+        for step in range(len(times)):
+            self.step = step
+            algorithm.timestamp = times[step]
+            self.__match()
+            if step > 0 and closes[step - 1]:
+                self.__add_bar(step - 1)
+
+            # Execute the events due at this bar
+            if opens[step]:
+                self.__fire(algorithm.on_market_will_open, BacktestData.OPEN)
+                self.__fire(algorithm.on_market_open, BacktestData.OPEN)
+            if ticks[step]:
+                self.__fire(algorithm.while_market_open, BacktestData.CLOSE)
+            if closes[step]:
+                self.session += 1
+                self.__fire(algorithm.on_market_close, BacktestData.CLOSE)
+                self.orders.expire(self.session - 1)
+
+            self.field = BacktestData.CLOSE
+            self.ledger.equity[step] = self.ledger.cash + self.value()
+            if closes[step]:
+                self.__announce(Utility.get_timestamp_string(times[step]) + " (backtest)", start_value, self.ledger.equity[step])
+        self.__add_bar(len(times) - 1)
+
+    # schedule:(np.array, np.array, np.array)
+    # NOTE: A session starts at the first bar after each market open. Bars after a close (e.g. synthetic bars ignoring
+    #       daylight saving time) stay in their session, and bars on holidays join the previous one.
+    # returns Boolean arrays marking the steps that open a session, tick while_market_open and close a session.
+    def schedule(self):
+        times = self.data.times
+        if len(times) == 0:
+            return (np.zeros(0, dtype=bool), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))
+        opens = np.ones(len(times), dtype=bool)
+        opens[1:] = np.diff(Backtest.session_ids(times)) != 0
+        session_start = times[opens][np.cumsum(opens) - 1]
+        periods = (times - session_start) // max(self.algorithm.sec_interval, 1)
+        ticks = opens.copy()
+        ticks[1:] |= np.diff(periods) != 0
+        closes = np.ones(len(times), dtype=bool)
+        closes[:-1] = opens[1:]
+        return (opens, ticks, closes)
+
+    # __add_bar:Void
+    # param step:Integer => Index of a completed bar, the last of its session for intraday bars.
+    # NOTE: Feeds the closes of the portfolio's symbols into its return statistics, once the bar is in the past.
+    def __add_bar(self, step):
+        closes = {}
+        for symbol in self.algorithm.portfolio.get_symbols():
+            column = self.data.index.get(symbol)
+            if column is not None and not np.isnan(self.data.bars[step, column, BacktestData.CLOSE]):
+                closes[symbol] = float(self.data.bars[step, column, BacktestData.CLOSE])
+        self.algorithm.portfolio.add_bar(self.data.times[step], closes)
+
+    # __fire:Void
+    # param event:Function => Event hook of the algorithm.
+    # param field:Integer => Field the event's prices are read from.
+    def __fire(self, event, field):
+        self.field = field
+        event(self.buying_power(), self.data.view(self.step, field))
+
+    # __announce:Void
+    # param prefix:String => Text to start the log with.
+    # param start_value:Float => Value at the start of the backtest.
+    # param value:Float => Current value.
+    def __announce(self, prefix, start_value, value):
+        percentage = (value - start_value) / start_value * 100
+        difference = value - start_value
+        kind = "gain" if percentage >= 0.00 else "loss"
+        self.algorithm.log(prefix + ": value($" + str(value) + "), cash($" + str(self.ledger.cash) + "), " + kind + "(" + str(abs(percentage)) + "%, $" + str(abs(difference)) + ")", 't')
+
+    ##
+    #
+    #   MARK: - PRICES
+    #
+    ##
+
+    # price:Float?
+    # param symbol:String => Symbol to price.
+    # returns The symbol's price at the current step and field, or None if it has no data.
+    def price(self, symbol):
+        column = self.__column(symbol)
+        if column is None:
+            return None
+        price = self.data.bars[self.step, column, self.field]
+        return None if np.isnan(price) else float(price)
+
+    # buying_power:Float
+    # returns The cash not held back for open buy orders.
+    def buying_power(self):
+        return self.ledger.cash - self.orders.reserved()
+
+    # value:Float
+    # returns The value of all open positions at the current step and field.
+    def value(self):
+        prices = self.data.row(self.step, self.field)
+        held = self.ledger.positions != 0
+        return float(np.dot(self.ledger.positions[held], np.nan_to_num(prices[held])))
+
+    # screen:[{String:Any}]
+    # param price_range:(Float, Float) => Range the low and high must lie within.
+    # NOTE: Screens the preloaded symbols by the last bar completed by the current step and field.
+    # returns Fundamentals of every symbol in range, each with its 'symbol', 'low' and 'high'.
+    def screen(self, price_range):
+        return self.data.screen(self.step + 1 if self.field == BacktestData.CLOSE else self.step, price_range)
+
+    # history:PriceSeries
+    # param symbol:String => Symbol to return bars for.
+    # param interval:Span => Time in between each bar. Coarser intervals are resampled from the bars.
+    # param span:Span => Range of the bars to return, ending at the current step.
+    # NOTE: Only holds bars completed by the current step and field, so events never see future prices. The current bar
+    #       is only included at its close, not while events fire at its open, low or high. A resampled bar is only
+    #       included once every bar within it has completed.
+    # returns The symbol's price series as of the current step.
+    def history(self, symbol, interval, span):
+        column = self.__column(symbol)
+        times = self.data.times
+        stop = self.step + 1 if self.field == BacktestData.CLOSE else self.step
+        if column is None or stop == 0:
+            return PriceSeries([], [], [], [], [])
+        now = times[stop - 1] + self.bar_seconds
+        interval_seconds = Utility.span_to_seconds(interval)
+        start = np.searchsorted(times, now - Utility.span_to_seconds(span) - interval_seconds, side='left')
+        bars = self.data.bars[start:stop, column, :]
+        valid = ~np.isnan(bars[:, BacktestData.CLOSE])
+        columns = {
+            'time': times[start:stop][valid],
+            'open': bars[valid, BacktestData.OPEN],
+            'close': bars[valid, BacktestData.CLOSE],
+            'high': bars[valid, BacktestData.HIGH],
+            'low': bars[valid, BacktestData.LOW]
+        }
+        if interval_seconds > self.bar_seconds:
+            columns = HistoryCache.resample(columns, interval)
+            complete = columns['time'] + interval_seconds <= now
+            columns = { name: values[complete] for name, values in columns.items() }
+        recent = columns['time'] >= now - Utility.span_to_seconds(span)
+        return PriceSeries.from_columns({ name: values[recent] for name, values in columns.items() })
+
+    # __column:Integer?
+    # param symbol:String => Symbol to look up.
+    # NOTE: Symbols missing from given or shared data are logged once and counted in the results.
+    # returns The column of the symbol, loading its history once if it was not preloaded.
+    def __column(self, symbol):
+        if symbol not in self.data.index:
+            if not self.lazy:
+                if symbol not in self.missing:
+                    self.missing.add(symbol)
+                    self.algorithm.log("No backtest data for " + symbol + ", which was not preloaded.", 't')
+                return None
+            self.algorithm.log("Loading history for " + symbol + ", which was not preloaded.", 't')
+            self.data.add_symbols({ symbol: self.algorithm.portfolio.get_symbol_history(symbol, self.interval, self.span, self.bounds) })
+            if self.ledger is not None:
+                self.ledger.resize(len(self.data.symbols))
+        return self.data.index[symbol]
+
+    ##
+    #
+    #   MARK: - EXECUTION
+    #
+    ##
+
+    # submit:(String, Boolean)
+    # param symbol:String => Symbol traded.
+    # param quantity:Float => Signed number of shares (positive for buys, negative for sells).
+    # param stop:Float? => Stop price, if any.
+    # param limit:Float? => Limit price, if any.
+    # param time:GoodFor? => Expiration of the order. Good-for-day orders expire at the close of the session they were
+    #                        placed in, or of the next one if placed in on_market_close. (default: GOOD_TIL_CANCELED)
+    # NOTE: Orders marketable at the current price fill at once. Others rest in the order book until a later bar trades
+    #       through them, and are filled at the bar's price then.
+    # returns A tuple containing (order ID, whether it filled immediately), or (None, False) for a symbol without data.
+    def submit(self, symbol, quantity, stop = None, limit = None, time = None):
+        column = self.__column(symbol)
+        if column is None:
+            return (None, False)
+        price = self.data.bars[self.step, column, self.field]
+        order_id, fill_price = self.orders.place(column, quantity, stop, limit, time or GoodFor.GOOD_TIL_CANCELED, price, self.session, self.step)
+        if fill_price is not None:
+            self.fill(symbol, quantity, fill_price)
+        return (Backtest.order_name(order_id), fill_price is not None)
+
+    # cancel:Boolean
+    # param order_id:String => ID of the order to cancel, as returned by submit(...).
+    # returns True if the order was open and is now cancelled.
+    def cancel(self, order_id):
+        return self.orders.cancel(Backtest.order_number(order_id))
+
+    # cancel_open:[String]
+    # returns IDs of every cancelled open order.
+    def cancel_open(self):
+        return [ Backtest.order_name(order_id) for order_id in self.orders.cancel_all() ]
+
+    # open_orders:[{String:Any}]
+    # returns Every open order, like Query.user_open_orders: each with its 'id', 'symbol', 'side' and 'quantity'.
+    def open_orders(self):
+        return [ { 'id': Backtest.order_name(order['id']), 'symbol': self.data.symbols[order['symbol']], 'side': (Side.BUY if order['quantity'] > 0 else Side.SELL).value, 'quantity': abs(float(order['quantity'])) } for order in self.orders.get_open() ]
+
+    # fill:Void
+    # param symbol:String => Symbol traded.
+    # param quantity:Float => Signed number of shares (positive for buys, negative for sells).
+    # param price:Float => Price per share.
+    # NOTE: Records the fill in the ledger and moves the shares in or out of the algorithm's portfolio.
+    def fill(self, symbol, quantity, price):
+        column = self.__column(symbol)
+        if column is not None:
+            self.ledger.record(self.step, self.data.times[self.step], column, quantity, price)
+            if quantity > 0:
+                self.algorithm.portfolio.add_quote(Quote(symbol, quantity))
+            else:
+                self.algorithm.portfolio.remove_quote(Quote(symbol, -quantity))
+
+    # __match:Void
+    # param field:Integer? => If OPEN, fills the orders placed at the current bar that the whole bar trades through. If
+    #                         CLOSE, fills the orders placed at the current bar that its close trades through. If None,
+    #                         fills the orders placed before the current bar that it trades through.
+    def __match(self, field = None):
+        if len(self.orders) == 0:
+            return
+        bars = self.data.bars[self.step]
+        if field == BacktestData.CLOSE:
+            close = bars[:, BacktestData.CLOSE]
+            fills, prices = self.orders.match(self.step, close, close, close, True)
+        else:
+            fills, prices = self.orders.match(self.step, bars[:, BacktestData.OPEN], bars[:, BacktestData.HIGH], bars[:, BacktestData.LOW], field is not None)
+        for order, price in zip(fills, prices):
+            symbol = self.data.symbols[order['symbol']]
+            self.fill(symbol, float(order['quantity']), float(price))
+            self.algorithm.log("Filled order " + Backtest.order_name(order['id']) + " for " + str(float(order['quantity'])) + " shares of " + symbol + " at " + str(float(price)))
+
+    # order_name:String (static)
+    # param order_id:Integer => Number of a simulated order.
+    # returns The order's ID as given to the algorithm.
+    @staticmethod
+    def order_name(order_id):
+        return 'backtest-' + str(int(order_id))
+
+    # order_number:Integer (static)
+    # param order_id:String => ID given to the algorithm.
+    # returns The number of the simulated order, or -1 if the ID is not one.
+    @staticmethod
+    def order_number(order_id):
+        name = str(order_id)
+        return int(name[len('backtest-'):]) if name.startswith('backtest-') and name[len('backtest-'):].isdigit() else -1
+
+    ##
+    #
+    #   MARK: - RESULTS
+    #
+    ##
+
+    # results:Dict
+    # returns Map with the starting value, ending cash and value, max drawdown, trade count, open order count and number
+    #         of symbols used without data of the backtest.
+    def results(self):
+        equity = self.ledger.equity[~np.isnan(self.ledger.equity)]
+        return {
+            'start_value': self.start_value,
+            'end_cash': self.ledger.cash,
+            'end_value': float(equity[-1]) if len(equity) > 0 else self.ledger.cash,
+            'max_drawdown': self.ledger.max_drawdown(),
+            'trades': self.ledger.fill_count,
+            'open_orders': len(self.orders),
+            'missing_symbols': len(self.missing)
+        }
@@ -0,0 +1,158 @@
+# Anthony Krivonos
+# src/backtest/orders.py
+
+# Imports
+import sys
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Abstract: Simulated book of resting market, limit, stop and stop-limit orders for the backtest engine.
+#           Open orders are kept in one structured NumPy array and matched against each bar's open, high and low in a
+#           single vectorized pass, so matching costs O(open orders) per bar.
+
+class SimulatedOrders:
+
+    # Structured dtype of one open order. Quantities are signed (positive for buys), and missing prices are NaN.
+    ORDER_DTYPE = np.dtype([ ('id', np.int64), ('symbol', np.int32), ('quantity', np.float64), ('stop', np.float64), ('limit', np.float64), ('triggered', np.bool_), ('good_for_day', np.bool_), ('session', np.int64), ('step', np.int64) ])
+
+    # __init__:Void
+    def __init__(self):
+        self.orders = np.zeros(64, dtype=SimulatedOrders.ORDER_DTYPE)
+        self.count = 0
+        self.next_id = 1
+
+    def __len__(self):
+        return self.count
+
+    ##
+    #
+    #   MARK: - PLACING
+    #
+    ##
+
+    # place:(Integer, Float?)
+    # param symbol:Integer => Column index of the symbol.
+    # param quantity:Float => Signed number of shares (positive for buys, negative for sells).
+    # param stop:Float? => Stop price, if any.
+    # param limit:Float? => Limit price, if any.
+    # param time:GoodFor => Expiration of the order.
+    # param price:Float => Current price of the symbol, or NaN if it has none.
+    # param session:Integer => Session a good-for-day order expires with.
+    # param step:Integer => Index along the time axis the order was placed at.
+    # NOTE: Orders marketable at the current price fill immediately at it, like on a live exchange. Others rest.
+    # returns A tuple containing (order ID, fill price or None if the order rests).
+    def place(self, symbol, quantity, stop, limit, time, price, session, step):
+        order_id = self.next_id
+        self.next_id += 1
+        stop = np.nan if stop is None else float(stop)
+        limit = np.nan if limit is None else float(limit)
+        buy = quantity > 0
+        triggered = np.isnan(stop) or (price >= stop if buy else price <= stop)
+        if triggered and (np.isnan(limit) or (price <= limit if buy else price >= limit)) and not np.isnan(price):
+            return (order_id, price)
+        if self.count == len(self.orders):
+            self.orders = np.concatenate((self.orders, np.zeros(len(self.orders), dtype=SimulatedOrders.ORDER_DTYPE)))
+        self.orders[self.count] = (order_id, symbol, quantity, stop, limit, bool(triggered) and not np.isnan(stop), time == GoodFor.GOOD_FOR_DAY, session, step)
+        self.count += 1
+        return (order_id, None)
+
+    # cancel:Boolean
+    # param order_id:Integer => ID of the order to cancel.
+    # returns True if the order was open and is now cancelled.
+    def cancel(self, order_id):
+        return len(self.__remove(self.get_open()['id'] == order_id)) > 0
+
+    # cancel_all:[Integer]
+    # param symbol:Integer? => Column index of the symbol whose orders are cancelled. If None, cancels every order.
+    # returns IDs of the cancelled orders.
+    def cancel_all(self, symbol = None):
+        open_orders = self.get_open()
+        return self.__remove(np.ones(self.count, dtype=bool) if symbol is None else open_orders['symbol'] == symbol).tolist()
+
+    # expire:[Integer]
+    # param session:Integer => Session that just closed.
+    # returns IDs of the good-for-day orders that expired with the session or an earlier one.
+    def expire(self, session):
+        open_orders = self.get_open()
+        return self.__remove(open_orders['good_for_day'] & (open_orders['session'] <= session)).tolist()
+
+    ##
+    #
+    #   MARK: - MATCHING
+    #
+    ##
+
+    # match:(np.array, np.array)
+    # param step:Integer => Index along the time axis of the bar.
+    # param open:np.array => Opens of every symbol at the bar.
+    # param high:np.array => Highs of every symbol at the bar.
+    # param low:np.array => Lows of every symbol at the bar.
+    # param current:Boolean => If True, only matches orders placed at the bar, against the part of it still to come.
+    #                          Otherwise, only matches orders placed before the bar. (default: False)
+    # NOTE: Stops trigger when the bar trades through them, and fill at the stop, or at the open if it gapped past it.
+    #       Limits fill when the bar trades at or through them, at the limit or the better of the open and the stop.
+    #       A stop-limit that triggers but cannot fill rests as a limit order. Bars with missing prices never match.
+    # returns A tuple containing (the filled orders, removed from the book, their fill prices).
+    def match(self, step, open, high, low, current = False):
+        if self.count == 0:
+            return (self.orders[:0], np.zeros(0))
+        orders = self.get_open()
+        symbols = orders['symbol']
+        o, h, l = open[symbols], high[symbols], low[symbols]
+        buy = orders['quantity'] > 0
+        eligible = orders['step'] == step if current else orders['step'] < step
+        stop, limit = orders['stop'], orders['limit']
+        has_stop, has_limit = ~np.isnan(stop), ~np.isnan(limit)
+
+        # Trigger stops, trading from the stop (or the open, on a gap) onwards
+        hit = eligible & has_stop & ~orders['triggered'] & np.where(buy, h >= stop, l <= stop)
+        orders['triggered'] |= hit
+        reference = np.where(hit, np.where(buy, np.maximum(o, stop), np.minimum(o, stop)), o)
+
+        # Fill limits the bar traded through, and stops and market orders outright
+        active = eligible & (~has_stop | orders['triggered'])
+        crossed = np.where(buy, l <= limit, h >= limit)
+        filled = active & np.where(has_limit, crossed, ~np.isnan(reference))
+        if not filled.any():
+            return (self.orders[:0], np.zeros(0))
+        fills = orders[filled].copy()
+        prices = np.where(has_limit, np.where(buy, np.minimum(reference, limit), np.maximum(reference, limit)), reference)[filled]
+        self.__remove(filled)
+        return (fills, prices)
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # get_open:np.array
+    # returns A view of the open orders.
+    def get_open(self):
+        return self.orders[:self.count]
+
+    # reserved:Float
+    # returns The cash held back for open buy orders, at their limit or stop prices.
+    def reserved(self):
+        orders = self.get_open()
+        buys = orders[orders['quantity'] > 0]
+        if len(buys) == 0:
+            return 0.0
+        prices = np.where(np.isnan(buys['limit']), buys['stop'], buys['limit'])
+        return float(np.nansum(buys['quantity'] * prices))
+
+    # __remove:np.array
+    # param mask:np.array => Boolean mask over the open orders to remove.
+    # returns IDs of the removed orders.
+    def __remove(self, mask):
+        orders = self.get_open()
+        removed = orders['id'][mask].copy()
+        if len(removed) > 0:
+            kept = orders[~mask]
+            self.orders[:len(kept)] = kept
+            self.count = len(kept)
+        return removed
@@ -0,0 +1,155 @@
+# Anthony Krivonos
+# src/backtest/sweep.py
+
+# Imports
+import os
+import copy
+import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# Models
+from models.portfolio import *
+from models.quote import *
+
+# Backtesting
+from backtest.data import *
+from backtest.engine import *
+
+# Abstract: Runs backtests of one algorithm over many parameter configurations across a process pool.
+#           History is preloaded once, saved as .npy files, and memory-mapped read-only by every worker.
+
+# Default directory for shared sweep data
+SWEEP_DIR = os.path.join('.cache', 'sweep')
+
+class Sweep:
+
+    # __init__:Void
+    # param algorithm_class:Class => Algorithm subclass to backtest. Must accept a params keyword argument.
+    # param query:Query => Query object, sent to each worker for API access.
+    # param quotes:[Quote] => Quotes of the starting portfolio for every backtest.
+    # param cash:Float => Starting cash for every backtest.
+    # param symbols:[String]? => Extra symbols to preload beyond the quotes and the algorithm's backtest_universe().
+    # param directory:String => Directory to write the shared, memory-mapped history into.
+    # param interval:Span => Time in between each preloaded bar. Intraday intervals replay at each algorithm's sec_interval. (default: DAY)
+    # param span:Span => Range of the preloaded bars. (default: YEAR)
+    def __init__(self, algorithm_class, query, quotes, cash, symbols = None, directory = SWEEP_DIR, interval = Span.DAY, span = Span.YEAR):
+        self.algorithm_class = algorithm_class
+        self.query = query
+        self.quotes = quotes
+        self.cash = cash
+        self.symbols = list(dict.fromkeys([ quote.symbol for quote in quotes ] + (symbols or [])))
+        self.directory = directory
+        self.interval = interval
+        self.span = span
+
+    ##
+    #
+    #   MARK: - CONFIGURATIONS
+    #
+    ##
+
+    # grid:[{String:Any}] (static)
+    # param grid:{String:[Any]} => Map of parameter names to lists of values.
+    # returns Every combination of the given values.
+    @staticmethod
+    def grid(grid):
+        names = list(grid.keys())
+        return [ dict(zip(names, values)) for values in itertools.product(*[ grid[name] for name in names ]) ]
+
+    # sample:[{String:Any}] (static)
+    # param space:{String:Any} => Map of parameter names to lists of choices or (low, high) tuples.
+    # param count:Integer => Number of configurations to draw.
+    # param seed:Integer? => Random seed, for reproducible searches.
+    # returns Randomly drawn configurations. Tuples of integers draw integers, other tuples draw floats.
+    @staticmethod
+    def sample(space, count, seed = None):
+        rand = random.Random(seed)
+        def draw(values):
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    return rand.randint(low, high)
+                return rand.uniform(low, high)
+            return rand.choice(values)
+        return [ { name: draw(values) for name, values in space.items() } for _ in range(count) ]
+
+    ##
+    #
+    #   MARK: - RUNNING
+    #
+    ##
+
+    # run:[{String:Any}]
+    # param configs:[{String:Any}] => Parameter configurations to backtest, e.g. from grid(...) or sample(...).
+    # param workers:Integer? => Number of worker processes. Defaults to the number of cores.
+    # NOTE: Workers only see the preloaded symbols. Rows count the symbols a backtest used without data in 'missing_symbols'.
+    # returns One row per configuration with its parameters, start and end value, end cash, max drawdown and trades, best first.
+    def run(self, configs, workers = None):
+
+        # Preload every symbol once and share it read-only with the workers
+        symbols = list(dict.fromkeys(self.symbols + self.universe()))
+        portfolio = Portfolio(self.query, copy.deepcopy(self.quotes), 'Sweep')
+        BacktestData.preload(portfolio, symbols, self.interval, self.span).save(self.directory)
+
+        Utility.log("Sweeping " + str(len(configs)) + " configurations of " + self.algorithm_class.__name__ + " over " + str(len(symbols)) + " symbols")
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=Sweep.load_shared, initargs=(self.directory,)) as executor:
+            futures = [ executor.submit(Sweep.run_config, self.algorithm_class, self.query, self.quotes, self.cash, config) for config in configs ]
+            for future in as_completed(futures):
+                rows.append(future.result())
+        return sorted(rows, key=lambda row: row.get('end_value', float('-inf')), reverse=True)
+
+    # universe:[String]
+    # NOTE: Instantiates the algorithm with its default parameters on empty data, so it initializes without backtesting,
+    #       then screens once here, in the parent, so workers never have to.
+    # returns The symbols the algorithm trades, along with its screened candidates (see Algorithm.backtest_universe).
+    def universe(self):
+        portfolio = Portfolio(self.query, copy.deepcopy(self.quotes), 'Sweep')
+        shared_data = Backtest.shared_data
+        Backtest.shared_data = BacktestData([], [], np.zeros((0, 0, BacktestData.FIELD_COUNT)))
+        try:
+            return self.algorithm_class(self.query, portfolio, test=True, cash=self.cash).backtest_universe()
+        finally:
+            Backtest.shared_data = shared_data
+
+    # load_shared:Void (static)
+    # param directory:String => Directory of the shared sweep data.
+    # NOTE: Runs once in each worker process.
+    @staticmethod
+    def load_shared(directory):
+        Backtest.shared_data = BacktestData.load(directory, mmap=True)
+
+    # run_config:{String:Any} (static)
+    # param algorithm_class:Class => Algorithm subclass to backtest.
+    # param query:Query => Query object for API access.
+    # param quotes:[Quote] => Quotes of the starting portfolio.
+    # param cash:Float => Starting cash.
+    # param params:{String:Any} => Parameters of the configuration.
+    # returns The configuration's parameters merged with its backtest results, or with an 'error' if it failed.
+    @staticmethod
+    def run_config(algorithm_class, query, quotes, cash, params):
+        try:
+            portfolio = Portfolio(query, copy.deepcopy(quotes), 'Sweep')
+            algorithm = algorithm_class(query, portfolio, test=True, cash=cash, params=params)
+            return Utility.merge_dicts(params, algorithm.backtest.results() if algorithm.backtest.ledger is not None else { 'error': 'No backtest data' })
+        except Exception as e:
+            return Utility.merge_dicts(params, { 'error': str(e) })
+
+    # to_frame:DataFrame (static)
+    # param rows:[{String:Any}] => Rows returned by run(...).
+    # returns The results table as a pandas DataFrame.
+    @staticmethod
+    def to_frame(rows):
+        import pandas as pd
+        return pd.DataFrame(rows)
@@ -0,0 +1,5 @@
+from cache.history import *
+from cache.instruments import *
+from cache.orders import *
+from cache.responses import *
+from cache.ttl import *
@@ -0,0 +1,275 @@
+# Anthony Krivonos
+# src/cache/history.py
+
+# Imports
+import sys
+import os
+import threading
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# Abstract: Persistent, columnar store of historical OHLC bars that sits between Query and the Robinhood API.
+#           Each (symbol, interval, span, bounds) key is held in memory and in a compact .npz file of
+#           contiguous arrays. Stale entries are refreshed by fetching only the smallest span covering
+#           the missing tail and merging it into the stored bars.
+
+# Default directory for history files
+HISTORY_DIR = os.path.join('.cache', 'history')
+
+# Maximum number of seconds a history entry is considered fresh
+HISTORY_MAX_AGE = 3600
+
+# Seconds from the epoch (a Thursday) to the first Monday, so weekly bars begin on Mondays
+WEEK_OFFSET = 4 * 86400
+
+class HistoryCache:
+
+    # Names of the float columns stored for each bar (the 'time' column is stored as int64 seconds)
+    FIELDS = ['open', 'close', 'high', 'low', 'volume']
+
+    # Map of intervals to the spans the API accepts for them, smallest first
+    TAIL_SPANS = {
+        Span.FIVE_MINUTE: [ Span.DAY, Span.WEEK ],
+        Span.TEN_MINUTE: [ Span.DAY, Span.WEEK ],
+        Span.DAY: [ Span.WEEK, Span.YEAR ],
+        Span.WEEK: [ Span.YEAR ]
+    }
+
+    # __init__:Void
+    # param directory:String? => Directory to persist history files in. If None, only caches in memory.
+    # param max_age:Integer => Number of seconds after a fetch before the entry is refreshed. Capped by the interval.
+    def __init__(self, directory = HISTORY_DIR, max_age = HISTORY_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.__entries = {}
+        self.__lock = threading.Lock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # NOTE: Pickles without the in-memory entries or lock, so worker processes reload entries from disk.
+    def __getstate__(self):
+        return { 'directory': self.directory, 'max_age': self.max_age }
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_age'])
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # get:{String:np.array}
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each value.
+    # param span:Span => Range for the data to be returned.
+    # param bounds:Bounds => The bounds to be included.
+    # param fetch:Function(String, Span, Span, Bounds) => Returns raw API historicals for the given symbol, interval, span and bounds.
+    # returns Map of column names ('time' and FIELDS) to contiguous arrays, oldest bar first.
+    def get(self, symbol, interval, span, bounds, fetch):
+        key = (symbol, interval, span, bounds)
+        entry = self.__entry(key)
+        now = int(Utility.now_timestamp())
+        if self.__is_fresh(entry, interval, now):
+            return entry['columns']
+
+        # Fetch the whole span when nothing is cached, otherwise only the tail
+        if entry is None or len(entry['columns']['time']) == 0:
+            tail_span = span
+        else:
+            tail_span = self.tail_span(interval, span, now - int(entry['columns']['time'][-1]))
+        columns = HistoryCache.columns_from_historicals(fetch(symbol, interval, tail_span, bounds))
+        if entry is not None and tail_span != span:
+            columns = HistoryCache.merge(entry['columns'], columns, now - Utility.span_to_seconds(span))
+
+        entry = { 'columns': columns, 'fetched_at': now }
+        with self.__lock:
+            self.__entries[key] = entry
+        self.__save(key, entry)
+        return columns
+
+    # put:Void
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each value.
+    # param span:Span => Range of the data.
+    # param bounds:Bounds => The bounds included.
+    # param columns:{String:np.array} => Map of column names ('time' and FIELDS) to arrays, oldest bar first.
+    # NOTE: Stores the columns as if they were just fetched, e.g. to seed the cache with recorded or synthetic data.
+    def put(self, symbol, interval, span, bounds, columns):
+        key = (symbol, interval, span, bounds)
+        entry = { 'columns': columns, 'fetched_at': int(Utility.now_timestamp()) }
+        with self.__lock:
+            self.__entries[key] = entry
+        self.__save(key, entry)
+
+    # fresh:{String:np.array}?
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each value.
+    # param span:Span => Range for the data to be returned.
+    # param bounds:Bounds => The bounds to be included.
+    # returns The cached columns if they are fresh, otherwise None. Never fetches.
+    def fresh(self, symbol, interval, span, bounds):
+        entry = self.__entry((symbol, interval, span, bounds))
+        return entry['columns'] if self.__is_fresh(entry, interval, int(Utility.now_timestamp())) else None
+
+    # __entry:Dict?
+    # param key:(String, Span, Span, Bounds) => Key of the entry.
+    # returns The entry in memory, or loaded from disk, or None.
+    def __entry(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+        return entry if entry is not None else self.__load(key)
+
+    # __is_fresh:Boolean
+    # param entry:Dict? => A cache entry.
+    # param interval:Span => Time in between each value.
+    # param now:Integer => Current timestamp.
+    # returns True if the entry exists and was fetched less than max_age (and one interval) ago.
+    def __is_fresh(self, entry, interval, now):
+        return entry is not None and now - entry['fetched_at'] < min(self.max_age, Utility.span_to_seconds(interval))
+
+    # tail_span:Span
+    # param interval:Span => Time in between each value.
+    # param span:Span => Span of the cached entry.
+    # param gap:Integer => Number of seconds since the newest cached bar.
+    # returns The smallest span the API accepts for the interval that covers the gap, never larger than the cached span.
+    def tail_span(self, interval, span, gap):
+        span_seconds = Utility.span_to_seconds(span)
+        for tail in HistoryCache.TAIL_SPANS.get(interval, []):
+            tail_seconds = Utility.span_to_seconds(tail)
+            if tail_seconds >= span_seconds:
+                break
+            if tail_seconds >= gap + Utility.span_to_seconds(interval):
+                return tail
+        return span
+
+    # clear:Void
+    # NOTE: Drops every entry from memory and disk.
+    def clear(self):
+        with self.__lock:
+            self.__entries = {}
+        if self.directory is not None:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith('.npz'):
+                    os.remove(os.path.join(self.directory, file_name))
+
+    ##
+    #
+    #   MARK: - COLUMNS
+    #
+    ##
+
+    # columns_from_historicals:{String:np.array} (static)
+    # param historicals:Dict => Raw dictionary returned by Robinhood.get_historical_quotes.
+    # returns Map of column names to arrays for the given historicals.
+    @staticmethod
+    def columns_from_historicals(historicals):
+        bars = (historicals or {}).get('historicals') or []
+        columns = { 'time': Utility.iso_to_timestamps([ bar['begins_at'] for bar in bars ]) }
+        for field in HistoryCache.FIELDS:
+            columns[field] = np.array([ float(bar.get(field + '_price', bar.get(field)) or 0.0) for bar in bars ], dtype=np.float64)
+        return columns
+
+    # historicals_from_columns:Dict (static)
+    # param symbol:String => String symbol of the instrument.
+    # param columns:{String:np.array} => Map of column names to arrays.
+    # returns A dictionary shaped like the response of Robinhood.get_historical_quotes.
+    @staticmethod
+    def historicals_from_columns(symbol, columns):
+        times = Utility.timestamps_to_iso(columns['time'])
+        rows = zip(times, columns['open'].tolist(), columns['close'].tolist(), columns['high'].tolist(), columns['low'].tolist(), columns['volume'].tolist())
+        return {
+            'symbol': symbol,
+            'historicals': [ { 'begins_at': t, 'open_price': o, 'close_price': c, 'high_price': h, 'low_price': l, 'volume': int(v) } for t, o, c, h, l, v in rows ]
+        }
+
+    # resample:{String:np.array} (static)
+    # param columns:{String:np.array} => One symbol's bars, sorted by time.
+    # param interval:Span => Coarser time in between each bar: TEN_MINUTE, DAY or WEEK.
+    # returns The bars aggregated into intervals beginning at their 'time', as Robinhood's coarser historicals are.
+    #         Weekly bars begin on Mondays. Volume is summed if present.
+    @staticmethod
+    def resample(columns, interval):
+        seconds = Utility.span_to_seconds(interval)
+        offset = WEEK_OFFSET if interval == Span.WEEK else 0
+        keys = (np.asarray(columns['time']).astype(np.int64) - offset) // seconds
+        if len(keys) == 0:
+            return { name: values[:0] for name, values in columns.items() }
+        starts = np.concatenate(([ 0 ], np.flatnonzero(np.diff(keys)) + 1))
+        ends = np.concatenate((starts[1:], [ len(keys) ])) - 1
+        resampled = {
+            'time': (keys[starts] * seconds + offset).astype(np.asarray(columns['time']).dtype),
+            'open': columns['open'][starts],
+            'close': columns['close'][ends],
+            'high': np.maximum.reduceat(columns['high'], starts),
+            'low': np.minimum.reduceat(columns['low'], starts)
+        }
+        if columns.get('volume') is not None:
+            resampled['volume'] = np.add.reduceat(columns['volume'], starts)
+        return resampled
+
+    # merge:{String:np.array} (static)
+    # param old:{String:np.array} => Previously cached columns.
+    # param new:{String:np.array} => Newly fetched columns, overriding old bars from their first time onwards.
+    # param since:Integer => Timestamp before which bars are dropped.
+    # returns The merged columns.
+    @staticmethod
+    def merge(old, new, since):
+        cutoff = new['time'][0] if len(new['time']) > 0 else sys.maxsize
+        keep = (old['time'] < cutoff) & (old['time'] >= since)
+        return { name: np.concatenate((old[name][keep], new[name])) for name in new }
+
+    ##
+    #
+    #   MARK: - PERSISTENCE
+    #
+    ##
+
+    # __path:String
+    # param key:(String, Span, Span, Bounds) => Key of the entry.
+    # returns The file path of the entry.
+    def __path(self, key):
+        symbol, interval, span, bounds = key
+        return os.path.join(self.directory, '-'.join([ symbol, interval.value, span.value, bounds.value ]) + '.npz')
+
+    # __load:Dict?
+    # param key:(String, Span, Span, Bounds) => Key of the entry.
+    # returns The entry stored on disk, or None.
+    def __load(self, key):
+        if self.directory is None or not os.path.isfile(self.__path(key)):
+            return None
+        try:
+            with np.load(self.__path(key)) as data:
+                entry = {
+                    'columns': { name: data[name] for name in ['time'] + HistoryCache.FIELDS },
+                    'fetched_at': int(data['fetched_at'])
+                }
+        except Exception as e:
+            Utility.warning("Could not load history for " + key[0] + ": " + str(e))
+            return None
+        with self.__lock:
+            self.__entries[key] = entry
+        return entry
+
+    # __save:Void
+    # param key:(String, Span, Span, Bounds) => Key of the entry.
+    # param entry:Dict => Entry to store on disk.
+    # NOTE: Writes to a temporary file first so a crash never leaves a partial entry behind.
+    def __save(self, key, entry):
+        if self.directory is None:
+            return
+        path = self.__path(key)
+        temp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                np.savez(file, fetched_at=np.int64(entry['fetched_at']), **entry['columns'])
+            os.replace(temp_path, path)
+        except Exception as e:
+            Utility.warning("Could not save history for " + key[0] + ": " + str(e))
@@ -0,0 +1,156 @@
+# Anthony Krivonos
+# src/cache/instruments.py
+
+# Imports
+import os
+import json
+import threading
+from collections import OrderedDict
+
+# Utility
+from utility import *
+
+# Abstract: Bounded, persistent cache of instrument metadata indexed by URL, symbol and instrument ID.
+#           Instruments never change, so entries never expire; the least recently used are evicted past capacity.
+
+# Default file for cached instruments
+INSTRUMENTS_FILE = os.path.join('.cache', 'instruments.json')
+
+# Default maximum number of cached instruments
+INSTRUMENTS_CAPACITY = 20000
+
+class InstrumentCache:
+
+    # Fields of each instrument that are kept
+    FIELDS = ['id', 'url', 'symbol', 'name', 'simple_name', 'type', 'tradeable']
+
+    # __init__:Void
+    # param path:String? => JSON file to persist instruments in. If None, only caches in memory.
+    # param capacity:Integer => Maximum number of instruments held.
+    def __init__(self, path = INSTRUMENTS_FILE, capacity = INSTRUMENTS_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.__by_url = OrderedDict()
+        self.__url_by_symbol = {}
+        self.__url_by_id = {}
+        self.__lock = threading.Lock()
+        self.__load()
+
+    # NOTE: Pickles only the configuration, so worker processes reload instruments from disk.
+    def __getstate__(self):
+        return { 'path': self.path, 'capacity': self.capacity }
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['capacity'])
+
+    def __len__(self):
+        return len(self.__by_url)
+
+    def __contains__(self, url):
+        return url in self.__by_url
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # get:Dict?
+    # param url:String => URL of the instrument.
+    # returns The cached instrument, or None.
+    def get(self, url):
+        with self.__lock:
+            instrument = self.__by_url.get(url)
+            if instrument is not None:
+                self.__by_url.move_to_end(url)
+            return instrument
+
+    # get_by_symbol:Dict?
+    # param symbol:String => Symbol of the instrument.
+    # returns The cached instrument, or None.
+    def get_by_symbol(self, symbol):
+        url = self.__url_by_symbol.get(symbol)
+        return self.get(url) if url is not None else None
+
+    # get_by_id:Dict?
+    # param instrument_id:String => ID of the instrument.
+    # returns The cached instrument, or None.
+    def get_by_id(self, instrument_id):
+        url = self.__url_by_id.get(instrument_id)
+        return self.get(url) if url is not None else None
+
+    # resolve:Dict
+    # param url:String => URL of the instrument.
+    # param fetch:Function(String) => Returns the instrument at the given URL from the API.
+    # returns The instrument at the given URL, fetched and stored only if it was not cached.
+    def resolve(self, url, fetch):
+        instrument = self.get(url)
+        if instrument is None:
+            instrument = self.put(fetch(url))
+            self.save()
+        return instrument
+
+    # id_from_url:String (static)
+    # param url:String => URL of the instrument, like ".../instruments/<id>/".
+    # returns The instrument ID in the URL.
+    @staticmethod
+    def id_from_url(url):
+        return url.rstrip('/').split('/')[-1]
+
+    ##
+    #
+    #   MARK: - SETTERS
+    #
+    ##
+
+    # put:Dict
+    # param instrument:Dict => Instrument returned from the API.
+    # returns The stored (trimmed) instrument.
+    def put(self, instrument):
+        instrument = { field: instrument.get(field) for field in InstrumentCache.FIELDS }
+        with self.__lock:
+            self.__by_url[instrument['url']] = instrument
+            self.__by_url.move_to_end(instrument['url'])
+            self.__url_by_symbol[instrument['symbol']] = instrument['url']
+            self.__url_by_id[instrument['id']] = instrument['url']
+            while len(self.__by_url) > self.capacity:
+                url, evicted = self.__by_url.popitem(last=False)
+                self.__url_by_symbol.pop(evicted['symbol'], None)
+                self.__url_by_id.pop(evicted['id'], None)
+        return instrument
+
+    ##
+    #
+    #   MARK: - PERSISTENCE
+    #
+    ##
+
+    # save:Void
+    # NOTE: Writes every instrument to a temporary file, then atomically replaces the cache file.
+    def save(self):
+        if self.path is None:
+            return
+        with self.__lock:
+            instruments = list(self.__by_url.values())
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(instruments, file)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            Utility.warning("Could not save instruments: " + str(e))
+
+    # __load:Void
+    # NOTE: Loads instruments from the cache file, if it exists.
+    def __load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                for instrument in json.load(file):
+                    self.put(instrument)
+        except Exception as e:
+            Utility.warning("Could not load instruments: " + str(e))
@@ -0,0 +1,178 @@
+# Anthony Krivonos
+# src/cache/orders.py
+
+# Imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# Abstract: Local mirror of the user's orders, indexed by ID, state, symbol and date.
+#           After the first full sync, only orders updated since the last cursor are requested.
+
+# Endpoint listing the user's orders
+ORDERS_URL = 'https://api.robinhood.com/orders/'
+
+# States of orders that may still be filled or cancelled
+OPEN_ORDER_STATES = [ 'queued', 'unconfirmed', 'confirmed', 'partially_filled' ]
+
+# Number of threads cancelling orders at once
+CANCEL_WORKERS = 8
+
+class OrderBook:
+
+    # __init__:Void
+    # param query:Query => Query object for API access and instrument lookups.
+    def __init__(self, query):
+        self.query = query
+        self.cursor = None
+        self.__orders = {}
+        self.__by_state = {}
+        self.__by_symbol = {}
+        self.__by_date = {}
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles without the mirrored orders, so worker processes sync from scratch.
+    def __getstate__(self):
+        return { 'query': self.query }
+
+    def __setstate__(self, state):
+        self.__init__(state['query'])
+
+    def __len__(self):
+        return len(self.__orders)
+
+    ##
+    #
+    #   MARK: - SYNCING
+    #
+    ##
+
+    # sync:Integer
+    # NOTE: Fetches every page of orders updated since the cursor and indexes them.
+    # returns The number of orders added or updated.
+    def sync(self):
+        trader = self.query.trader
+        if self.cursor is None:
+            page = trader.order_history(None)
+        else:
+            with self.query.metrics.timer('query_request_seconds', ('endpoint', 'orders')):
+                page = trader.session.get(ORDERS_URL, params={ 'updated_at[gte]': self.cursor }, timeout=15).json()
+        orders = []
+        while page is not None:
+            orders += page.get('results') or []
+            if not page.get('next'):
+                break
+            with self.query.metrics.timer('query_request_seconds', ('endpoint', 'orders')):
+                page = trader.session.get(page['next'], timeout=15).json()
+        self.query.prewarm_instruments([ order['instrument'] for order in orders ])
+        for order in orders:
+            self.put(order)
+        return len(orders)
+
+    # put:Void
+    # param order:Dict => Order returned from the API. Replaces any mirrored order with the same ID.
+    def put(self, order):
+        order = Utility.merge_dicts(order, { 'symbol': self.query.symbol_from_instrument_url(order['instrument']) })
+        with self.__lock:
+            self.__unindex(order['id'])
+            self.__orders[order['id']] = order
+            self.__by_state.setdefault(order['state'], set()).add(order['id'])
+            self.__by_symbol.setdefault(order['symbol'], set()).add(order['id'])
+            self.__by_date.setdefault(OrderBook.order_date(order), set()).add(order['id'])
+            if order.get('updated_at') and (self.cursor is None or order['updated_at'] > self.cursor):
+                self.cursor = order['updated_at']
+
+    # __unindex:Void
+    # param order_id:String => ID of the order to remove from every index.
+    def __unindex(self, order_id):
+        order = self.__orders.pop(order_id, None)
+        if order is not None:
+            self.__by_state.get(order['state'], set()).discard(order_id)
+            self.__by_symbol.get(order['symbol'], set()).discard(order_id)
+            self.__by_date.get(OrderBook.order_date(order), set()).discard(order_id)
+
+    # order_date:date (static)
+    # param order:Dict => Order returned from the API.
+    # returns The date of the order's last transaction, or of its creation if it has none.
+    @staticmethod
+    def order_date(order):
+        return Utility.iso_to_datetime(order.get('last_transaction_at') or order['created_at']).date()
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # get:Dict?
+    # param order_id:String => ID of the order.
+    # returns The mirrored order, or None.
+    def get(self, order_id):
+        return self.__orders.get(order_id)
+
+    # orders:[Dict]
+    # param states:[String]? => States to include. If None, includes every state.
+    # param symbol:String? => Symbol to include. If None, includes every symbol.
+    # param date:date? => Date of the last transaction to include. If None, includes every date.
+    # param side:Side? => Side to include. If None, includes both sides.
+    # returns The mirrored orders matching every given criterion.
+    def orders(self, states = None, symbol = None, date = None, side = None):
+        with self.__lock:
+            ids = set(self.__orders.keys()) if states is None else set().union(*[ self.__by_state.get(state, set()) for state in states ])
+            if symbol is not None:
+                ids &= self.__by_symbol.get(symbol, set())
+            if date is not None:
+                ids &= self.__by_date.get(date, set())
+            orders = [ self.__orders[order_id] for order_id in ids ]
+        if side is not None:
+            orders = [ order for order in orders if order['side'] == side.value ]
+        return orders
+
+    # open_orders:[Dict]
+    # param symbol:String? => Symbol to include. If None, includes every symbol.
+    # returns The mirrored orders that are still open.
+    def open_orders(self, symbol = None):
+        return self.orders(OPEN_ORDER_STATES, symbol)
+
+    # todays_orders:[Dict]
+    # param side:Side? => Side to include. If None, includes both sides.
+    # returns The mirrored orders with a transaction today, in any state.
+    def todays_orders(self, side = None):
+        return self.orders(date=datetime.datetime.now().date(), side=side)
+
+    # todays_fills:[Dict]
+    # param side:Side? => Side to include. If None, includes both sides.
+    # returns The mirrored orders filled today.
+    def todays_fills(self, side = None):
+        return self.orders([ 'filled' ], date=datetime.datetime.now().date(), side=side)
+
+    ##
+    #
+    #   MARK: - EXECUTION
+    #
+    ##
+
+    # cancel_open:[String]
+    # param workers:Integer => Number of threads cancelling orders at once.
+    # returns The IDs of the open orders that were cancelled.
+    def cancel_open(self, workers = CANCEL_WORKERS):
+        orders = self.open_orders()
+        if len(orders) == 0:
+            return []
+        def cancel(order):
+            try:
+                self.query.trader.cancel_order(order['id'])
+                return order
+            except Exception as e:
+                Utility.error("Could not cancel order " + order['id'] + ": " + str(e))
+                return None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            cancelled = [ order for order in executor.map(cancel, orders) if order is not None ]
+        for order in cancelled:
+            self.put(Utility.merge_dicts(order, { 'state': 'cancelled' }))
+        return [ order['id'] for order in cancelled ]
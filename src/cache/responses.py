@@ -0,0 +1,131 @@
+# Anthony Krivonos
+# src/cache/responses.py
+
+# Imports
+import threading
+
+# Cache
+from cache.ttl import *
+
+# Abstract: Per-endpoint cache of API responses with short TTLs for volatile data and long TTLs for static data.
+#           Concurrent requests for the same key are coalesced: one thread fetches while the others wait for its result.
+
+# Default number of seconds responses are cached for, by endpoint
+RESPONSE_TTLS = {
+    'quote': 5,
+    'fundamentals': 6 * 3600,
+    'instrument': 24 * 3600,
+    'tag': 60,
+    'news': 300
+}
+
+# Default maximum number of responses cached per endpoint
+RESPONSE_CAPACITY = 10000
+
+class ResponseCache:
+
+    # __init__:Void
+    # param ttls:{String:Float}? => Map of endpoints to seconds their responses are cached for, overriding RESPONSE_TTLS.
+    # param capacity:Integer => Maximum number of responses cached per endpoint.
+    def __init__(self, ttls = None, capacity = RESPONSE_CAPACITY):
+        self.ttls = dict(RESPONSE_TTLS, **(ttls or {}))
+        self.capacity = capacity
+        self.__caches = { endpoint: TTLCache(ttl, capacity) for endpoint, ttl in self.ttls.items() }
+        self.__counters = { endpoint: { 'hits': 0, 'misses': 0, 'coalesced': 0 } for endpoint in self.ttls }
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles only the configuration, so worker processes start with an empty cache.
+    def __getstate__(self):
+        return { 'ttls': self.ttls, 'capacity': self.capacity }
+
+    def __setstate__(self, state):
+        self.__init__(state['ttls'], state['capacity'])
+
+    # cache:TTLCache
+    # param endpoint:String => Name of the endpoint, like 'quote'.
+    # returns The TTL cache backing the endpoint.
+    def cache(self, endpoint):
+        return self.__caches[endpoint]
+
+    ##
+    #
+    #   MARK: - FETCHING
+    #
+    ##
+
+    # fetch:Any
+    # param endpoint:String => Name of the endpoint, like 'quote'.
+    # param key:Hashable => Key of the request within the endpoint, like a symbol.
+    # param request:Function() => Makes the request. Called at most once per key at a time.
+    # NOTE: If the same request is already in flight on another thread, waits for and shares its result or error.
+    # returns The cached or fetched response.
+    def fetch(self, endpoint, key, request):
+        response = self.get(endpoint, key)
+        if response is not MISSING:
+            return response
+        with self.__lock:
+            flight = self.__in_flight.get((endpoint, key))
+            leader = flight is None
+            if leader:
+                flight = { 'done': threading.Event(), 'response': None, 'error': None }
+                self.__in_flight[(endpoint, key)] = flight
+                self.__counters[endpoint]['misses'] += 1
+            else:
+                self.__counters[endpoint]['coalesced'] += 1
+        if not leader:
+            flight['done'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['response']
+        try:
+            flight['response'] = request()
+            self.__caches[endpoint].set(key, flight['response'])
+            return flight['response']
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__in_flight[(endpoint, key)]
+            flight['done'].set()
+
+    # get:Any
+    # param endpoint:String => Name of the endpoint.
+    # param key:Hashable => Key of the request within the endpoint.
+    # returns The cached response, or MISSING. Counts a hit if found.
+    def get(self, endpoint, key):
+        response = self.__caches[endpoint].get(key)
+        if response is not MISSING:
+            with self.__lock:
+                self.__counters[endpoint]['hits'] += 1
+        return response
+
+    # set:Void
+    # param endpoint:String => Name of the endpoint.
+    # param key:Hashable => Key of the request within the endpoint.
+    # param response:Any => Response to cache, e.g. one item of a bulk response. Counts a miss.
+    def set(self, endpoint, key, response):
+        self.__caches[endpoint].set(key, response)
+        with self.__lock:
+            self.__counters[endpoint]['misses'] += 1
+
+    ##
+    #
+    #   MARK: - STATISTICS
+    #
+    ##
+
+    # stats:{String:{String:Integer}}
+    # returns Map of endpoints to their 'hits', 'misses' and 'coalesced' counts.
+    def stats(self):
+        with self.__lock:
+            return { endpoint: dict(counters) for endpoint, counters in self.__counters.items() }
+
+    # clear:Void
+    # NOTE: Drops every cached response and resets the counters.
+    def clear(self):
+        for cache in self.__caches.values():
+            cache.clear()
+        with self.__lock:
+            self.__counters = { endpoint: { 'hits': 0, 'misses': 0, 'coalesced': 0 } for endpoint in self.ttls }
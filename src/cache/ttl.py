@@ -0,0 +1,64 @@
+# Anthony Krivonos
+# src/cache/ttl.py
+
+# Imports
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+# Abstract: Thread-safe in-memory cache whose entries expire a fixed number of seconds after being set.
+
+# Returned by TTLCache.get(...) when a key is missing or expired
+MISSING = object()
+
+class TTLCache:
+
+    # __init__:Void
+    # param ttl:Float => Number of seconds an entry stays valid.
+    # param capacity:Integer? => Maximum number of entries. The oldest entries are evicted first. Unbounded if None.
+    def __init__(self, ttl, capacity = None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles only the configuration, so worker processes start with an empty cache.
+    def __getstate__(self):
+        return { 'ttl': self.ttl, 'capacity': self.capacity }
+
+    def __setstate__(self, state):
+        self.__init__(state['ttl'], state['capacity'])
+
+    # get:Any
+    # param key:Hashable => Key of the entry.
+    # param default:Any => Value returned if the key is missing or expired. (default: MISSING)
+    # returns The cached value, or the default.
+    def get(self, key, default = MISSING):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= monotonic():
+                del self.__entries[key]
+                return default
+            return entry[1]
+
+    # set:Void
+    # param key:Hashable => Key of the entry.
+    # param value:Any => Value to cache, including None.
+    def set(self, key, value):
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (monotonic() + self.ttl, value)
+            if self.capacity is not None:
+                while len(self.__entries) > self.capacity:
+                    self.__entries.popitem(last=False)
+
+    # clear:Void
+    # NOTE: Removes every entry.
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
@@ -72,4 +72,9 @@ class Event(Enum):
     ON_MARKET_WILL_OPEN = 0
     ON_MARKET_OPEN = 1
     WHILE_MARKET_OPEN = 2
-    ON_MARKET_CLOSE = 3
\ No newline at end of file
+    ON_MARKET_CLOSE = 3
+
+# Policies for repeating timers that fall behind
+class Overrun(Enum):
+    SKIP = 'skip'     # drop missed ticks and resume on the next future deadline
+    QUEUE = 'queue'   # run every missed tick back to back
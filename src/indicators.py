@@ -0,0 +1,481 @@
+# Anthony Krivonos
+# src/indicators.py
+
+# Imports
+import sys
+import math
+from collections import deque
+
+# NumPy
+import numpy as np
+
+# Sessions
+from sessions import *
+
+# Abstract: Technical indicators, each implemented twice with the same floating-point arithmetic:
+#           compute(...) is vectorized over full history arrays (for backtests and warm-up), and update(...) advances an O(1)
+#           incremental state by one bar (for live trading), so both give identical values for the same bars.
+#           Values are NaN until an indicator has seen enough bars (see ready).
+
+class Indicator:
+
+    # __init__:Void
+    # param period:Integer => Number of bars the indicator spans.
+    def __init__(self, period):
+        if period < 1:
+            raise ValueError("Indicator period must be at least 1, not " + str(period))
+        self.period = period
+        self.reset()
+
+    def __str__(self):
+        return type(self).__name__ + "(" + str(self.period) + "): " + str(self.value)
+
+    # reset:Void
+    # NOTE: Clears the state, as if no bar had been seen.
+    def reset(self):
+        self.count = 0          # Number of bars seen
+        self.time = None        # Timestamp of the last bar seen, if given
+        self.value = math.nan   # Current value
+        self.ready = False      # True once the value is defined
+
+    ##
+    #
+    #   MARK: - UPDATING
+    #
+    ##
+
+    # update:Any
+    # param close:Float => Close price of the bar.
+    # param high:Float? => High price of the bar. Defaults to the close.
+    # param low:Float? => Low price of the bar. Defaults to the close.
+    # param volume:Float? => Volume of the bar.
+    # param time:Float? => Timestamp of the bar.
+    # NOTE: Subclasses call this first, then advance their own state.
+    # returns The current value.
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        self.count += 1
+        self.time = time
+        return self.value
+
+    # update_series:Any
+    # param series:PriceSeries => Bars, oldest first.
+    # NOTE: Only the bars after the last one seen are added, so overlapping histories can be passed on every tick.
+    # returns The current value.
+    def update_series(self, series):
+        start = 0 if self.time is None else int(np.searchsorted(series.time, self.time, side='right'))
+        for i in range(start, len(series)):
+            self.update(float(series.close[i]), float(series.high[i]), float(series.low[i]), float(series.volume[i]), float(series.time[i]))
+        return self.value
+
+    ##
+    #
+    #   MARK: - VECTORIZED
+    #
+    ##
+
+    # compute:np.array
+    # param close:[Float] => Close prices, oldest first.
+    # param high:[Float]? => High prices. Defaults to the closes.
+    # param low:[Float]? => Low prices. Defaults to the closes.
+    # param volume:[Float]? => Volumes.
+    # param time:[Float]? => Timestamps.
+    # NOTE: Stateless; does not change this indicator's incremental state.
+    # returns The indicator's value after each bar, as update(...) would give them.
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        raise NotImplementedError(type(self).__name__ + " does not implement compute")
+
+    # compute_series:np.array
+    # param series:PriceSeries => Bars, oldest first.
+    # returns The indicator's value after each bar.
+    def compute_series(self, series):
+        return self.compute(series.close, series.high, series.low, series.volume, series.time)
+
+    # anchored_sums:(np.array, np.array, Float) (static)
+    # param values:np.array => Values, oldest first.
+    # param squares:Boolean => If True, also returns the running sums of squares.
+    # NOTE: Sums are of each value minus the first, which keeps them small and the rolling differences precise.
+    # returns A tuple containing (running sums with a leading 0, running sums of squares with a leading 0 or None, first value).
+    @staticmethod
+    def anchored_sums(values, squares = False):
+        deviations = values - values[0]
+        sums = np.concatenate(([ 0.0 ], np.cumsum(deviations)))
+        square_sums = np.concatenate(([ 0.0 ], np.cumsum(deviations * deviations))) if squares else None
+        return (sums, square_sums, values[0])
+
+    # smooth:np.array (static)
+    # param values:np.array => Values following the seed, oldest first.
+    # param seed:Float => Smoothed value before the first value.
+    # param alpha:Float => Weight of each new value.
+    # returns The exponentially smoothed values, each computed as (1 - alpha) * previous + alpha * value.
+    @staticmethod
+    def smooth(values, seed, alpha):
+        from scipy.signal import lfilter
+        if len(values) == 0:
+            return np.zeros(0)
+        decay = 1.0 - alpha
+        return lfilter([ alpha ], [ 1.0, -decay ], values, zi=[ decay * seed ])[0]
+
+    # arrays:(np.array, np.array, np.array) (static)
+    # returns The close, high and low prices as float arrays, with missing highs and lows defaulting to the closes.
+    @staticmethod
+    def arrays(close, high, low):
+        close = np.asarray(close, dtype=np.float64)
+        high = np.asarray(high, dtype=np.float64) if high is not None else close
+        low = np.asarray(low, dtype=np.float64) if low is not None else close
+        return (close, high, low)
+
+##
+#
+#   MARK: - MOVING AVERAGES
+#
+##
+
+# Abstract: Simple moving average of the closes over the last period bars.
+
+class SMA(Indicator):
+
+    def reset(self):
+        Indicator.reset(self)
+        self.anchor = None
+        self.sum = 0.0
+        self.sums = deque([ 0.0 ], maxlen=self.period + 1)
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if self.anchor is None:
+            self.anchor = close
+        self.sum += close - self.anchor
+        self.sums.append(self.sum)
+        if self.count >= self.period:
+            self.value = self.anchor + (self.sums[-1] - self.sums[0]) / self.period
+            self.ready = True
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close = np.asarray(close, dtype=np.float64)
+        values = np.full(len(close), np.nan)
+        if len(close) >= self.period:
+            sums, _, anchor = Indicator.anchored_sums(close)
+            values[self.period - 1:] = anchor + (sums[self.period:] - sums[:-self.period]) / self.period
+        return values
+
+# Abstract: Exponential moving average of the closes, seeded with the simple average of the first period bars.
+
+class EMA(Indicator):
+
+    # __init__:Void
+    # param period:Integer => Number of bars the average spans.
+    # param alpha:Float? => Weight of each new bar. Defaults to 2 / (period + 1).
+    def __init__(self, period, alpha = None):
+        self.alpha = alpha if alpha is not None else 2.0 / (period + 1)
+        self.decay = 1.0 - self.alpha
+        Indicator.__init__(self, period)
+
+    def reset(self):
+        Indicator.reset(self)
+        self.seed_sum = 0.0
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if self.count <= self.period:
+            self.seed_sum += close
+            if self.count == self.period:
+                self.value = self.seed_sum / self.period
+                self.ready = True
+        else:
+            self.value = self.decay * self.value + self.alpha * close
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close = np.asarray(close, dtype=np.float64)
+        values = np.full(len(close), np.nan)
+        if len(close) >= self.period:
+            values[self.period - 1] = np.cumsum(close[:self.period])[-1] / self.period
+            values[self.period:] = Indicator.smooth(close[self.period:], values[self.period - 1], self.alpha)
+        return values
+
+# Abstract: Mean of the closes of every bar within the last seconds of the latest bar, however many there are, so short
+#           and half-day sessions are averaged over the bars they have. Without timestamps, averages every bar seen.
+
+class WindowMean(Indicator):
+
+    # __init__:Void
+    # param seconds:Float => Length of the window, ending at the latest bar's timestamp.
+    def __init__(self, seconds):
+        self.seconds = seconds
+        Indicator.__init__(self, 1)
+
+    def reset(self):
+        Indicator.reset(self)
+        self.anchor = None
+        self.sum = 0.0
+        self.window = deque()   # (timestamp, running sum before the bar) of each bar in the window
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if self.anchor is None:
+            self.anchor = close
+        self.window.append((time, self.sum))
+        self.sum += close - self.anchor
+        if time is not None:
+            while self.window[0][0] <= time - self.seconds:
+                self.window.popleft()
+        self.value = self.anchor + (self.sum - self.window[0][1]) / len(self.window)
+        self.ready = True
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close = np.asarray(close, dtype=np.float64)
+        if len(close) == 0:
+            return np.zeros(0)
+        sums, _, anchor = Indicator.anchored_sums(close)
+        stops = np.arange(1, len(close) + 1)
+        starts = np.searchsorted(time, np.asarray(time, dtype=np.float64) - self.seconds, side='right') if time is not None else np.zeros(len(close), dtype=int)
+        return anchor + (sums[stops] - sums[starts]) / (stops - starts)
+
+##
+#
+#   MARK: - OSCILLATORS
+#
+##
+
+# Abstract: Relative strength index (0-100) of the close-to-close changes, with Wilder's smoothing over period changes.
+
+class RSI(Indicator):
+
+    def __init__(self, period = 14):
+        self.alpha = 1.0 / period
+        self.decay = 1.0 - self.alpha
+        Indicator.__init__(self, period)
+
+    def reset(self):
+        Indicator.reset(self)
+        self.last = None
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if self.last is not None:
+            change = close - self.last
+            gain = max(change, 0.0)
+            loss = max(-change, 0.0)
+            changes = self.count - 1
+            if changes <= self.period:
+                self.gain += gain
+                self.loss += loss
+                if changes == self.period:
+                    self.gain /= self.period
+                    self.loss /= self.period
+            else:
+                self.gain = self.decay * self.gain + self.alpha * gain
+                self.loss = self.decay * self.loss + self.alpha * loss
+            if changes >= self.period:
+                total = self.gain + self.loss
+                self.value = 100.0 * self.gain / total if total > 0 else 50.0
+                self.ready = True
+        self.last = close
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close = np.asarray(close, dtype=np.float64)
+        values = np.full(len(close), np.nan)
+        if len(close) > self.period:
+            change = np.diff(close)
+            gains = np.maximum(change, 0.0)
+            losses = np.maximum(-change, 0.0)
+            gain = np.concatenate(([ np.cumsum(gains[:self.period])[-1] / self.period ], np.zeros(len(change) - self.period)))
+            loss = np.concatenate(([ np.cumsum(losses[:self.period])[-1] / self.period ], np.zeros(len(change) - self.period)))
+            gain[1:] = Indicator.smooth(gains[self.period:], gain[0], self.alpha)
+            loss[1:] = Indicator.smooth(losses[self.period:], loss[0], self.alpha)
+            total = gain + loss
+            values[self.period:] = np.where(total > 0, 100.0 * gain / np.where(total > 0, total, 1.0), 50.0)
+        return values
+
+# Abstract: Population standard deviation of the closes over the last period bars. Also tracks their mean.
+
+class RollingStd(Indicator):
+
+    def reset(self):
+        Indicator.reset(self)
+        self.mean = math.nan
+        self.std = math.nan
+        self.anchor = None
+        self.sum = 0.0
+        self.square_sum = 0.0
+        self.sums = deque([ 0.0 ], maxlen=self.period + 1)
+        self.square_sums = deque([ 0.0 ], maxlen=self.period + 1)
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if self.anchor is None:
+            self.anchor = close
+        deviation = close - self.anchor
+        self.sum += deviation
+        self.square_sum += deviation * deviation
+        self.sums.append(self.sum)
+        self.square_sums.append(self.square_sum)
+        if self.count >= self.period:
+            mean = (self.sums[-1] - self.sums[0]) / self.period
+            variance = max((self.square_sums[-1] - self.square_sums[0]) / self.period - mean * mean, 0.0)
+            self.mean = self.anchor + mean
+            self.std = math.sqrt(variance)
+            self.value = self.std
+            self.ready = True
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        return self.compute_moments(close)[1]
+
+    # compute_moments:(np.array, np.array)
+    # param close:[Float] => Close prices, oldest first.
+    # returns A tuple containing the (mean, standard deviation) after each bar.
+    def compute_moments(self, close):
+        close = np.asarray(close, dtype=np.float64)
+        means = np.full(len(close), np.nan)
+        deviations = np.full(len(close), np.nan)
+        if len(close) >= self.period:
+            sums, square_sums, anchor = Indicator.anchored_sums(close, True)
+            mean = (sums[self.period:] - sums[:-self.period]) / self.period
+            variance = np.maximum((square_sums[self.period:] - square_sums[:-self.period]) / self.period - mean * mean, 0.0)
+            means[self.period - 1:] = anchor + mean
+            deviations[self.period - 1:] = np.sqrt(variance)
+        return (means, deviations)
+
+# Abstract: Bollinger bands of the closes; the value is a (lower, middle, upper) tuple.
+
+class Bollinger(RollingStd):
+
+    # __init__:Void
+    # param period:Integer => Number of bars the bands span. (default: 20)
+    # param deviations:Float => Number of standard deviations between the middle and each outer band. (default: 2)
+    def __init__(self, period = 20, deviations = 2.0):
+        self.deviations = deviations
+        RollingStd.__init__(self, period)
+
+    def reset(self):
+        RollingStd.reset(self)
+        self.value = (math.nan, math.nan, math.nan)
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        RollingStd.update(self, close, high, low, volume, time)
+        if self.ready:
+            self.value = (self.mean - self.deviations * self.std, self.mean, self.mean + self.deviations * self.std)
+        return self.value
+
+    # compute:(np.array, np.array, np.array)
+    # returns The (lower, middle, upper) bands after each bar.
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        means, deviations = self.compute_moments(close)
+        return (means - self.deviations * deviations, means, means + self.deviations * deviations)
+
+# Abstract: Number of standard deviations the close is from its mean over the last period bars. 0 when the closes are flat.
+
+class ZScore(RollingStd):
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        RollingStd.update(self, close, high, low, volume, time)
+        if self.ready:
+            self.value = (close - self.mean) / self.std if self.std > 0 else 0.0
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close = np.asarray(close, dtype=np.float64)
+        means, deviations = self.compute_moments(close)
+        values = np.full(len(close), np.nan)
+        defined = ~np.isnan(deviations)
+        values[defined] = np.where(deviations[defined] > 0, (close[defined] - means[defined]) / np.where(deviations[defined] > 0, deviations[defined], 1.0), 0.0)
+        return values
+
+##
+#
+#   MARK: - VOLUME AND VOLATILITY
+#
+##
+
+# Abstract: Volume-weighted average of the typical price (high + low + close) / 3, restarting every market session
+#           when bar timestamps are given. NaN until some volume has traded in the session.
+
+class VWAP(Indicator):
+
+    # __init__:Void
+    # param market:String => Name of the market calendar whose sessions restart the average.
+    def __init__(self, market = 'NYSE'):
+        self.market = market
+        Indicator.__init__(self, 1)
+
+    def reset(self):
+        Indicator.reset(self)
+        self.session = None
+        self.weighted_sum = 0.0
+        self.volume_sum = 0.0
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        if time is not None:
+            session = int(Sessions.shared(self.market).session_ids([ time ])[0])
+            if session != self.session:
+                self.session = session
+                self.weighted_sum = 0.0
+                self.volume_sum = 0.0
+        high = high if high is not None else close
+        low = low if low is not None else close
+        volume = volume or 0.0
+        self.weighted_sum += (high + low + close) / 3.0 * volume
+        self.volume_sum += volume
+        self.ready = self.volume_sum > 0
+        self.value = self.weighted_sum / self.volume_sum if self.ready else math.nan
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close, high, low = Indicator.arrays(close, high, low)
+        volume = np.asarray(volume, dtype=np.float64) if volume is not None else np.zeros(len(close))
+        weighted = (high + low + close) / 3.0 * volume
+        starts = [ 0 ]
+        if time is not None and len(close) > 0:
+            starts += (np.flatnonzero(np.diff(Sessions.shared(self.market).session_ids(time))) + 1).tolist()
+        weighted_sums = np.empty(len(close))
+        volume_sums = np.empty(len(close))
+        for start, stop in zip(starts, starts[1:] + [ len(close) ]):
+            weighted_sums[start:stop] = np.cumsum(weighted[start:stop])
+            volume_sums[start:stop] = np.cumsum(volume[start:stop])
+        return np.where(volume_sums > 0, weighted_sums / np.where(volume_sums > 0, volume_sums, 1.0), np.nan)
+
+# Abstract: Average true range, with Wilder's smoothing over period bars. The first bar's true range is its high - low.
+
+class ATR(Indicator):
+
+    def __init__(self, period = 14):
+        self.alpha = 1.0 / period
+        self.decay = 1.0 - self.alpha
+        Indicator.__init__(self, period)
+
+    def reset(self):
+        Indicator.reset(self)
+        self.last = None
+        self.seed_sum = 0.0
+
+    def update(self, close, high = None, low = None, volume = None, time = None):
+        Indicator.update(self, close, high, low, volume, time)
+        high = high if high is not None else close
+        low = low if low is not None else close
+        true_range = high - low if self.last is None else max(high - low, abs(high - self.last), abs(low - self.last))
+        if self.count <= self.period:
+            self.seed_sum += true_range
+            if self.count == self.period:
+                self.value = self.seed_sum / self.period
+                self.ready = True
+        else:
+            self.value = self.decay * self.value + self.alpha * true_range
+        self.last = close
+        return self.value
+
+    def compute(self, close, high = None, low = None, volume = None, time = None):
+        close, high, low = Indicator.arrays(close, high, low)
+        values = np.full(len(close), np.nan)
+        if len(close) >= self.period:
+            true_range = high - low
+            true_range[1:] = np.maximum(true_range[1:], np.maximum(np.abs(high[1:] - close[:-1]), np.abs(low[1:] - close[:-1])))
+            values[self.period - 1] = np.cumsum(true_range[:self.period])[-1] / self.period
+            values[self.period:] = Indicator.smooth(true_range[self.period:], values[self.period - 1], self.alpha)
+        return values
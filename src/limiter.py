@@ -0,0 +1,75 @@
+# Anthony Krivonos
+# src/limiter.py
+
+# Imports
+import asyncio
+import threading
+from time import sleep, monotonic
+
+# Abstract: Token bucket rate limiters shared by threads (RateLimiter) or coroutines (AsyncRateLimiter) making API calls.
+
+class RateLimiter:
+
+    # __init__:Void
+    # param rate:Float => Number of tokens added per second.
+    # param burst:Integer? => Maximum number of tokens held at once. Defaults to one second's worth.
+    def __init__(self, rate, burst = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self.__tokens = self.burst
+        self.__updated = monotonic()
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles only the configuration, e.g. when sent to worker processes.
+    def __getstate__(self):
+        return { 'rate': self.rate, 'burst': self.burst }
+
+    def __setstate__(self, state):
+        self.__init__(state['rate'], state['burst'])
+
+    # acquire:Void
+    # param tokens:Float => Number of tokens to take.
+    # NOTE: Blocks until the given number of tokens is available.
+    def acquire(self, tokens = 1):
+        while True:
+            wait = self.__take(tokens)
+            if wait <= 0:
+                return
+            sleep(wait)
+
+    # __take:Float
+    # param tokens:Float => Number of tokens to take.
+    # returns 0 if the tokens were taken, otherwise the number of seconds until they could be.
+    def __take(self, tokens):
+        with self.__lock:
+            now = monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return 0
+            return (tokens - self.__tokens) / self.rate
+
+class AsyncRateLimiter:
+
+    # __init__:Void
+    # param rate:Float => Number of tokens added per second.
+    # param burst:Integer? => Maximum number of tokens held at once. Defaults to one second's worth.
+    def __init__(self, rate, burst = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self.__tokens = self.burst
+        self.__updated = monotonic()
+
+    # acquire:Void (async)
+    # param tokens:Float => Number of tokens to take.
+    # NOTE: Waits without blocking the event loop until the given number of tokens is available.
+    async def acquire(self, tokens = 1):
+        while True:
+            now = monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.__tokens) / self.rate)
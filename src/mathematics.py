@@ -5,9 +5,6 @@
 # Imports
 import sys
 
-# Pandas
-import pandas as pd
-
 # NumPy
 import numpy as np
 
@@ -15,19 +12,17 @@ import numpy as np
 from enums import *
 
 # Math
+import math
 from math import exp
-from sympy import *
-from mpmath import *
+from decimal import Decimal, Context
 
 # Warnings
 import warnings
 
 # Abstract: Math functions for dataset analysis.
 
-# Configure mpmath
+# Number of significant digits kept by DecimalArithmetic
 EPSILON = 20
-mp.dps = EPSILON
-mp.pretty = False
 
 # Math Methods
 class Math:
@@ -44,16 +39,90 @@ class Math:
     # returns A list of length |deg| for coefficients of the polynomial.
     @staticmethod
     def poly(x, y, degree):
-        warnings.filterwarnings("error")
-        while degree > 0:
-            try:
-                x = np.array(x)
-                y = np.array(y)
-                return np.polyfit(x, y, degree)
-            except:
-                degree = int(Math.p_sub(degree, 1))
+        x = np.array(x)
+        y = np.array(y)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            while degree > 0:
+                try:
+                    return np.polyfit(x, y, degree)
+                except:
+                    degree -= 1
         return np.polyfit(x, y, 0)
 
+    # batch_poly:(np.array, np.array)
+    # param x:[float] or [[float]] => Shared x values (bars), or one row of x values per series (series x bars).
+    # param y:[[float]] => Matrix of y values (series x bars). NaN values are treated as missing.
+    # param degree:integer => Degree of every polynomial. (default: 2)
+    # param mask:[[bool]]? => Matrix of which bars to include (series x bars). If None, includes every non-NaN bar.
+    # returns A tuple containing (coefficients (series x degree + 1, highest power first, like poly), rank_deficient (series)).
+    # NOTE: Rank-deficient rows (e.g. fewer than degree + 1 bars) get the minimum-norm fit and are flagged instead of raising.
+    @staticmethod
+    def batch_poly(x, y, degree = 2, mask = None):
+        coefficients, origins, scales, deficient = Math.__batch_fit(x, y, degree, mask)
+
+        # Expand each sum of c_j * ((x - origin) / scale)^j back into powers of x
+        expanded = np.zeros_like(coefficients)
+        for j in range(degree + 1):
+            for i in range(j + 1):
+                expanded[:, i] += coefficients[:, j] * math.comb(j, i) * (-origins) ** (j - i) / scales ** j
+        return (expanded[:, ::-1], deficient)
+
+    # batch_derivatives:(np.array, np.array, np.array)
+    # param x:[float] or [[float]] => Shared x values (bars), or one row of x values per series (series x bars).
+    # param y:[[float]] => Matrix of y values (series x bars). NaN values are treated as missing.
+    # param degree:integer => Degree of every polynomial. (default: 2)
+    # param mask:[[bool]]? => Matrix of which bars to include (series x bars). If None, includes every non-NaN bar.
+    # returns A tuple containing (slope, concavity, rank_deficient) of each series' fit at its last included x.
+    @staticmethod
+    def batch_derivatives(x, y, degree = 2, mask = None):
+        coefficients, origins, scales, deficient = Math.__batch_fit(x, y, degree, mask)
+        slope = coefficients[:, 1] / scales if degree >= 1 else np.zeros(len(coefficients))
+        concavity = 2 * coefficients[:, 2] / scales ** 2 if degree >= 2 else np.zeros(len(coefficients))
+        return (slope, concavity, deficient)
+
+    # __batch_fit:(np.array, np.array, np.array, np.array)
+    # NOTE: Solves every least-squares fit at once from stacked normal equations, in x centered on each series' last included
+    #       value and scaled by its spread so the Vandermonde matrices stay well-conditioned.
+    # returns A tuple containing (coefficients (lowest power first, in scaled x), origins, scales, rank_deficient).
+    @staticmethod
+    def __batch_fit(x, y, degree, mask):
+        y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+        x = np.broadcast_to(np.asarray(x, dtype=np.float64), y.shape)
+        valid = ~np.isnan(y) & ~np.isnan(x)
+        if mask is not None:
+            valid &= np.asarray(mask, dtype=bool)
+        counts = valid.sum(axis=1)
+
+        # Center on the last included x and scale by the spread of included x
+        last = np.where(valid, np.arange(y.shape[1]), -1).max(axis=1)
+        origins = np.where(counts > 0, x[np.arange(len(y)), np.maximum(last, 0)], 0.0)
+        spread = np.where(valid, x, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scales = np.nanmax(spread, axis=1) - np.nanmin(spread, axis=1)
+        scales = np.where(np.isfinite(scales) & (scales > 0), scales, 1.0)
+        u = np.where(valid, (x - origins[:, None]) / scales[:, None], 0.0)
+
+        # Stacked normal equations; excluded bars become zero rows, which leave the solution unchanged
+        vandermonde = np.empty(y.shape + (degree + 1,))
+        vandermonde[..., 0] = valid
+        for power in range(1, degree + 1):
+            vandermonde[..., power] = vandermonde[..., power - 1] * u
+        transposed = vandermonde.transpose(0, 2, 1)
+        normal = transposed @ vandermonde
+        moments = (transposed @ np.where(valid, y, 0.0)[..., None])[..., 0]
+
+        # Pseudo-inverse of each small normal matrix, dropping singular values below the rank tolerance
+        left, singular, right = np.linalg.svd(normal)
+        tolerance = singular.max(axis=1, keepdims=True) * (degree + 1) * np.finfo(np.float64).eps * 1e3
+        nonzero = singular > tolerance
+        inverse = np.where(nonzero, 1.0 / np.where(nonzero, singular, 1.0), 0.0)
+        coefficients = np.einsum('kji,kj,klj,kl->ki', right, inverse, left, moments, optimize=True)
+        deficient = nonzero.sum(axis=1) < degree + 1
+        coefficients[counts == 0] = np.nan
+        return (coefficients, origins, scales, deficient)
+
     # deriv:[float]
     # param poly:[float] => A list of length |deg| for coefficients of the polynomial.
     # param order:integer => Order of the differentiation.
@@ -62,7 +131,7 @@ class Math:
     def deriv(poly, order):
         while order > 0:
             poly = np.polyder(poly)
-            order = int(Math.p_sub(order, 1))
+            order -= 1
         return poly
 
     # eval:float
@@ -159,56 +228,255 @@ class Math:
     #
     ##
 
-    # __mp_to_float:Float
-    # param n:mpf => MPMath floating point number.
-    # Returns a precise float conversion from an mpf float.
-    def __mp_to_float(n):
-        return Float(str(n), EPSILON)
+    # Arithmetic backend used by the p_* methods (see set_backend)
+    backend = None
+
+    # set_backend:Void
+    # param backend:FloatArithmetic|DecimalArithmetic => Arithmetic backend for the p_* methods.
+    # NOTE: Use FloatArithmetic for analytics and DecimalArithmetic (the default) for money.
+    @staticmethod
+    def set_backend(backend):
+        Math.backend = backend
 
     # p_mul:Float
-    # param a:Float => First number to multiply.
-    # param b:Float => Second number to multiply.
+    # param a:Float or [Float] => First number(s) to multiply.
+    # param b:Float or [Float] => Second number(s) to multiply.
     # Returns a precise multiplication of the two numbers.
     @staticmethod
     def p_mul(a, b):
-        m = fmul(a, b)
-        return Math.__mp_to_float(m)
+        return Math.backend.mul(a, b)
 
     # p_exp:Float
-    # param a:Float => Base number.
-    # param b:Float => Exponent number.
+    # param a:Float or [Float] => Base number(s).
+    # param b:Float or [Float] => Exponent number(s).
     # Returns a precise exponentiation of a^b.
     @staticmethod
     def p_exp(a, b):
-        m = mpmathify(a)
-        while b > 1:
-            m = fmul(m, m)
-            b -= 1
-        return Math.__mp_to_float(m)
+        return Math.backend.exp(a, b)
 
     # p_div:Float
-    # param a:Float => First number to divide.
-    # param b:Float => Second number to divide.
+    # param a:Float or [Float] => First number(s) to divide.
+    # param b:Float or [Float] => Second number(s) to divide.
     # Returns a precise division of the two numbers.
     @staticmethod
     def p_div(a, b):
-        m = fdiv(a, b)
-        return Math.__mp_to_float(m)
+        return Math.backend.div(a, b)
 
     # p_add:Float
-    # param a:Float => First number to add.
-    # param b:Float => Second number to add.
+    # param a:Float or [Float] => First number(s) to add.
+    # param b:Float or [Float] => Second number(s) to add.
     # Returns a precise addition of the two numbers.
     @staticmethod
     def p_add(a, b):
-        m = fadd(a, b)
-        return Math.__mp_to_float(m)
+        return Math.backend.add(a, b)
 
     # p_sub:Float
-    # param a:Float => First number to subtract.
-    # param b:Float => Second number to subtract.
+    # param a:Float or [Float] => First number(s) to subtract.
+    # param b:Float or [Float] => Second number(s) to subtract.
     # Returns a precise subtraction of the two numbers.
     @staticmethod
     def p_sub(a, b):
-        m = fsub(a, b)
-        return Math.__mp_to_float(m)
+        return Math.backend.sub(a, b)
+
+# Abstract: Arithmetic backend computing in float64 with vectorized NumPy operations.
+#           Scalars in give floats out; lists or arrays in give float64 arrays out.
+
+class FloatArithmetic:
+
+    def mul(self, a, b):
+        return FloatArithmetic.__result(np.multiply(a, b, dtype=np.float64))
+
+    def div(self, a, b):
+        return FloatArithmetic.__result(np.divide(a, b, dtype=np.float64))
+
+    def add(self, a, b):
+        return FloatArithmetic.__result(np.add(a, b, dtype=np.float64))
+
+    def sub(self, a, b):
+        return FloatArithmetic.__result(np.subtract(a, b, dtype=np.float64))
+
+    def exp(self, a, b):
+        return FloatArithmetic.__result(np.power(a, b, dtype=np.float64))
+
+    # __result:Float or np.array
+    # param result:np.float64 or np.array => Result of a NumPy operation.
+    # returns A float for scalar results, otherwise the array.
+    @staticmethod
+    def __result(result):
+        return float(result) if np.ndim(result) == 0 else result
+
+# Abstract: Arithmetic backend computing exactly in decimal with a fixed, reused context, then rounding to float.
+#           Operands are converted through their shortest repr, so 0.1 is treated as exactly 0.1.
+#           Lists or arrays are computed element-wise and returned as float64 arrays.
+
+class DecimalArithmetic:
+
+    # __init__:Void
+    # param precision:Integer => Number of significant digits kept by each operation.
+    def __init__(self, precision = EPSILON):
+        self.context = Context(prec=precision)
+        decimal = DecimalArithmetic.decimal
+        self.__ops = {
+            'mul': lambda a, b: float(self.context.multiply(decimal(a), decimal(b))),
+            'div': lambda a, b: float(self.context.divide(decimal(a), decimal(b))),
+            'add': lambda a, b: float(self.context.add(decimal(a), decimal(b))),
+            'sub': lambda a, b: float(self.context.subtract(decimal(a), decimal(b))),
+            'exp': lambda a, b: float(self.context.power(decimal(a), decimal(b)))
+        }
+        self.__ufuncs = { name: np.frompyfunc(op, 2, 1) for name, op in self.__ops.items() }
+
+    def mul(self, a, b):
+        return self.__apply('mul', a, b)
+
+    def div(self, a, b):
+        return self.__apply('div', a, b)
+
+    def add(self, a, b):
+        return self.__apply('add', a, b)
+
+    def sub(self, a, b):
+        return self.__apply('sub', a, b)
+
+    def exp(self, a, b):
+        return self.__apply('exp', a, b)
+
+    # decimal:Decimal (static)
+    # param n:Number => Number to convert.
+    # returns The number as a Decimal, converting floats through their shortest repr.
+    @staticmethod
+    def decimal(n):
+        if isinstance(n, float):
+            return Decimal(repr(float(n)))
+        if isinstance(n, (int, Decimal)):
+            return Decimal(n)
+        if isinstance(n, np.integer):
+            return Decimal(int(n))
+        return Decimal(repr(float(n)))
+
+    # __apply:Float or np.array
+    # param op:String => Name of the operation.
+    # param a:Number or [Number] => First operand(s).
+    # param b:Number or [Number] => Second operand(s).
+    # returns A float for scalar operands, otherwise a float64 array.
+    def __apply(self, op, a, b):
+        if not isinstance(a, (list, tuple, np.ndarray)) and not isinstance(b, (list, tuple, np.ndarray)):
+            return self.__ops[op](a, b)
+        result = np.asarray(self.__ufuncs[op](a, b), dtype=np.float64)
+        return float(result) if result.ndim == 0 else result
+
+# Default to exact decimal arithmetic
+Math.set_backend(DecimalArithmetic())
+
+# Abstract: Incremental least-squares polynomial fit of many series sampled at shared times, e.g. one price per symbol per tick.
+#           Keeps the normal-equation sums (sums of w*t^p and w*t^p*y) per series, always centered on the newest sample,
+#           so each update costs O(degree^2) per series regardless of history length, and the fitted derivatives at the
+#           newest time are read straight off the coefficients. Old samples leave through a fixed window or exponential decay.
+
+class RollingFit:
+
+    # __init__:Void
+    # param count:Integer => Number of series fitted at once.
+    # param degree:Integer => Degree of the fitted polynomial. (default: 2)
+    # param window:Integer? => Number of most recent samples fitted. If None, every sample is kept (subject to halflife).
+    # param halflife:Float? => Seconds after which a sample's weight halves. If None, samples are weighted equally.
+    # param scale:Float => Seconds per unit of fitted time, keeping powers of t well conditioned. (default: 3600)
+    def __init__(self, count, degree = 2, window = None, halflife = None, scale = 3600.0):
+        self.count = count
+        self.degree = degree
+        self.window = window
+        self.halflife = halflife
+        self.scale = float(scale)
+        self.time = None
+        self.distinct_times = 0
+        self.samples = np.zeros(count, dtype=np.int64)
+        self.t_sums = np.zeros((count, 2 * degree + 1))
+        self.ty_sums = np.zeros((count, degree + 1))
+        self.last = np.full(count, np.nan)
+        if window is not None:
+            self.__times = np.full(window, np.nan)
+            self.__values = np.full((window, count), np.nan)
+            self.__next = 0
+
+        # shift[p][j] = C(p, j), used to move the origin of the power sums
+        size = 2 * degree + 1
+        self.__binomial = np.array([ [ float(math.comb(p, j)) if j <= p else 0.0 for j in range(size) ] for p in range(size) ])
+
+    # update:Void
+    # param time:Float => Timestamp (seconds since epoch) of the samples. Must not be earlier than the previous update.
+    # param values:[Float] => One value per series. NaN values are skipped.
+    def update(self, time, values):
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        if self.time is None or time != self.time:
+            self.distinct_times += 1
+        if self.time is not None:
+            self.__shift((time - self.time) / self.scale)
+            if self.halflife is not None:
+                decay = 0.5 ** ((time - self.time) / self.halflife)
+                self.t_sums *= decay
+                self.ty_sums *= decay
+        self.time = time
+
+        # Drop the sample leaving the window, weighted as it would be now
+        if self.window is not None:
+            old_time = self.__times[self.__next]
+            if not np.isnan(old_time):
+                old_values = self.__values[self.__next]
+                old_valid = ~np.isnan(old_values)
+                weight = 0.5 ** ((time - old_time) / self.halflife) if self.halflife is not None else 1.0
+                powers = ((old_time - time) / self.scale) ** np.arange(2 * self.degree + 1) * weight
+                self.t_sums[old_valid] -= powers
+                self.ty_sums[old_valid] -= np.outer(old_values[old_valid], powers[:self.degree + 1])
+                self.samples[old_valid] -= 1
+                if self.__times[(self.__next + 1) % self.window] != old_time:
+                    self.distinct_times -= 1
+            self.__times[self.__next] = time
+            self.__values[self.__next] = values
+            self.__next = (self.__next + 1) % self.window
+
+        # The new sample sits at t = 0, so it only adds to the zeroth powers
+        self.t_sums[valid, 0] += 1
+        self.ty_sums[valid, 0] += values[valid]
+        self.samples[valid] += 1
+        self.last[valid] = values[valid]
+
+    # __shift:Void
+    # param delta:Float => Scaled time between the old and new origin.
+    # NOTE: Re-expresses every power sum relative to the new origin with the binomial theorem: (t - d)^p = sum C(p, j) t^j (-d)^(p - j).
+    def __shift(self, delta):
+        if delta == 0:
+            return
+        size = 2 * self.degree + 1
+        exponents = np.subtract.outer(np.arange(size), np.arange(size))
+        shift = self.__binomial * np.where(exponents >= 0, (-delta) ** np.maximum(exponents, 0), 0.0)
+        self.t_sums = self.t_sums.dot(shift.T)
+        self.ty_sums = self.ty_sums.dot(shift[:self.degree + 1, :self.degree + 1].T)
+
+    # coefficients:np.array
+    # returns A (count x degree + 1) array of coefficients, lowest power first, in scaled time centered on the newest sample.
+    # NOTE: Series with too few samples (or sample times) are fitted with the highest degree they support. Series with none are NaN.
+    def coefficients(self):
+        coefficients = np.full((self.count, self.degree + 1), np.nan)
+        degrees = np.minimum(np.minimum(self.samples, self.distinct_times), self.degree + 1) - 1
+        for degree in range(self.degree + 1):
+            rows = degrees == degree
+            if not rows.any():
+                continue
+            size = degree + 1
+            normal = self.t_sums[rows][:, np.add.outer(np.arange(size), np.arange(size))]
+            rhs = self.ty_sums[rows, :size]
+            try:
+                solution = np.linalg.solve(normal, rhs[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                solution = np.einsum('kij,kj->ki', np.linalg.pinv(normal), rhs)
+            coefficients[rows] = 0.0
+            coefficients[rows, :size] = solution
+        return coefficients
+
+    # derivatives:(np.array, np.array)
+    # returns (slope, concavity) of every series at the newest sample, per second and per second squared.
+    def derivatives(self):
+        coefficients = self.coefficients()
+        slope = coefficients[:, 1] / self.scale if self.degree >= 1 else np.zeros(self.count)
+        concavity = 2 * coefficients[:, 2] / self.scale ** 2 if self.degree >= 2 else np.zeros(self.count)
+        return (slope, concavity)
@@ -0,0 +1,294 @@
+# Anthony Krivonos
+# src/metrics.py
+
+# Imports
+import sys
+import json
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# Abstract: In-process call counters and latency histograms, exported as a Prometheus text snapshot or as JSON.
+#           Recording a sample costs a couple of microseconds, so instrumentation can stay on while live trading.
+
+# Default upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every exported metric name
+METRICS_PREFIX = 'quantico_'
+
+class Histogram:
+
+    # __init__:Void
+    # param buckets:(Float) => Ascending upper bounds of the buckets. Larger values fall into a final +Inf bucket.
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [ 0 ] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    # observe:Void
+    # param value:Float => Value to record.
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # quantile:Float
+    # param q:Float => Quantile between 0 and 1.
+    # returns An estimate of the quantile: the upper bound of the bucket it falls in, or the maximum for the +Inf bucket.
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    # as_dict:{String:Any}
+    # returns The count, sum, mean, max, quantile estimates and cumulative bucket counts.
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + [ '+Inf' ], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count > 0 else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': buckets
+        }
+
+class Metrics:
+
+    # Registry shared by the whole process (see shared)
+    __shared = None
+    __shared_lock = threading.Lock()
+
+    # __init__:Void
+    # param buckets:(Float) => Upper bounds of every latency histogram's buckets, in seconds.
+    # param enabled:Boolean => If False, nothing is recorded.
+    def __init__(self, buckets = LATENCY_BUCKETS, enabled = True):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled
+        self.__histograms = {}
+        self.__counters = {}
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles only the configuration, so worker processes record into their own empty registry.
+    def __getstate__(self):
+        return { 'buckets': self.buckets, 'enabled': self.enabled }
+
+    def __setstate__(self, state):
+        self.__init__(state['buckets'], state['enabled'])
+
+    # shared:Metrics (static)
+    # returns The process-wide registry, created on first use.
+    @staticmethod
+    def shared():
+        with Metrics.__shared_lock:
+            if Metrics.__shared is None:
+                Metrics.__shared = Metrics()
+            return Metrics.__shared
+
+    ##
+    #
+    #   MARK: - RECORDING
+    #
+    ##
+
+    # observe:Void
+    # param name:String => Name of the histogram, like 'query_request_seconds'.
+    # param value:Float => Value to record, like a latency in seconds.
+    # param labels:(String, String)* => Label names and values, e.g. ('endpoint', 'quote_data').
+    def observe(self, name, value, *labels):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    # increment:Void
+    # param name:String => Name of the counter, like 'algorithm_tick_overruns_total'.
+    # param labels:(String, String)* => Label names and values.
+    # param amount:Float => Amount to add. (default: 1)
+    def increment(self, name, *labels, amount = 1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + amount
+
+    # timer:Timer
+    # param name:String => Name of the histogram.
+    # param labels:(String, String)* => Label names and values.
+    # NOTE: Use as `with metrics.timer(name, ('event', 'on_market_open')): ...`. Errors raised inside also count towards
+    #       the counter named like the histogram, with '_seconds' replaced by '_errors_total'.
+    # returns A context manager recording its wall time.
+    def timer(self, name, *labels):
+        return Timer(self, name, labels)
+
+    # timed:Function
+    # param function:Function => Function to time.
+    # param name:String => Name of the histogram.
+    # param labels:(String, String)* => Label names and values.
+    # returns A function that calls the given one and records its wall time.
+    def timed(self, function, name, *labels):
+        def timed_function(*args, **kwargs):
+            with Timer(self, name, labels):
+                return function(*args, **kwargs)
+        timed_function.__wrapped__ = function
+        return timed_function
+
+    # instrument:InstrumentedProxy
+    # param target:Any => Object whose method calls should be timed, like a Robinhood client.
+    # param name:String => Name of the histogram.
+    # param label:String => Name of the label holding each method's name. (default: 'method')
+    # returns A proxy timing every method called through it and passing other attributes through.
+    def instrument(self, target, name, label = 'method'):
+        return InstrumentedProxy(target, self, name, label)
+
+    ##
+    #
+    #   MARK: - EXPORTING
+    #
+    ##
+
+    # snapshot:{String:[Dict]}
+    # returns Map of 'histograms' and 'counters' to lists of { 'name', 'labels', ... } entries, sorted by name and labels.
+    def snapshot(self):
+        with self.__lock:
+            histograms = [ Metrics.__entry(key, histogram.as_dict()) for key, histogram in sorted(self.__histograms.items()) ]
+            counters = [ Metrics.__entry(key, { 'value': value }) for key, value in sorted(self.__counters.items()) ]
+        return { 'histograms': histograms, 'counters': counters }
+
+    # json:String
+    # param indent:Integer? => Indentation of the JSON text.
+    # returns The snapshot as JSON.
+    def json(self, indent = None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    # prometheus:String
+    # returns The snapshot in the Prometheus text exposition format.
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for entry in snapshot['counters']:
+            name = METRICS_PREFIX + entry['name']
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE ' + name + ' counter')
+            lines.append(name + Metrics.__labels(entry['labels']) + ' ' + repr(entry['value']))
+        for entry in snapshot['histograms']:
+            name = METRICS_PREFIX + entry['name']
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE ' + name + ' histogram')
+            for bound, count in entry['buckets'].items():
+                lines.append(name + '_bucket' + Metrics.__labels(dict(entry['labels'], le=bound)) + ' ' + str(count))
+            lines.append(name + '_sum' + Metrics.__labels(entry['labels']) + ' ' + repr(entry['sum']))
+            lines.append(name + '_count' + Metrics.__labels(entry['labels']) + ' ' + str(entry['count']))
+        return '\n'.join(lines) + '\n'
+
+    # reset:Void
+    # NOTE: Drops every recorded histogram and counter.
+    def reset(self):
+        with self.__lock:
+            self.__histograms = {}
+            self.__counters = {}
+
+    # __entry:{String:Any} (static)
+    # returns The exported entry for a ((name, labels), values) pair.
+    @staticmethod
+    def __entry(key, values):
+        name, labels = key
+        return dict({ 'name': name, 'labels': dict(labels) }, **values)
+
+    # __labels:String (static)
+    # returns The labels in Prometheus' {name="value",...} form, or an empty string.
+    @staticmethod
+    def __labels(labels):
+        if len(labels) == 0:
+            return ''
+        escaped = [ name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in labels.items() ]
+        return '{' + ','.join(escaped) + '}'
+
+class Timer:
+
+    # __init__:Void
+    # param metrics:Metrics => Registry to record into.
+    # param name:String => Name of the histogram.
+    # param labels:((String, String)) => Label names and values.
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        self.__start = perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.seconds = perf_counter() - self.__start
+        self.metrics.observe(self.name, self.seconds, *self.labels)
+        if error_type is not None:
+            self.metrics.increment(self.name.replace('_seconds', '') + '_errors_total', *self.labels)
+        return False
+
+class InstrumentedProxy:
+
+    # __init__:Void
+    # param target:Any => Object whose method calls are timed.
+    # param metrics:Metrics => Registry to record into.
+    # param name:String => Name of the histogram.
+    # param label:String => Name of the label holding each method's name.
+    def __init__(self, target, metrics, name, label = 'method'):
+        self.__target = target
+        self.__metrics = metrics
+        self.__name = name
+        self.__label = label
+        self.__methods = {}
+
+    def __getstate__(self):
+        return { 'target': self.__target, 'metrics': self.__metrics, 'name': self.__name, 'label': self.__label }
+
+    def __setstate__(self, state):
+        self.__init__(state['target'], state['metrics'], state['name'], state['label'])
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('_InstrumentedProxy__') or (attribute.startswith('__') and attribute.endswith('__')):
+            raise AttributeError(attribute)
+        method = self.__methods.get(attribute)
+        if method is None:
+            value = getattr(self.__target, attribute)
+            if not callable(value):
+                return value
+            method = self.__methods[attribute] = self.__metrics.timed(value, self.__name, (self.__label, attribute))
+        return method
+
+    def __setattr__(self, attribute, value):
+        if attribute.startswith('_InstrumentedProxy__'):
+            object.__setattr__(self, attribute, value)
+        else:
+            setattr(self.__target, attribute, value)
+
+    # target:Any
+    # returns The proxied object.
+    def target(self):
+        return self.__target
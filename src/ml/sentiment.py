@@ -10,13 +10,8 @@ import math
 from utility import *
 from enums import *
 
-# Pandas
-import pandas as pd
-
-# TextBlob
-from textblob import TextBlob, Word, Blobber
-
 # Abstract: Offers sentiment analysis for given text.
+#           TextBlob is imported on first use to keep startup fast.
 
 class Sentiment():
 
@@ -31,6 +26,7 @@ class Sentiment():
 
     @staticmethod
     def get_sentiment(text):
+        from textblob import TextBlob
         return TextBlob(text).sentiment
 
     @staticmethod
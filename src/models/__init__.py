@@ -1,3 +1,5 @@
 from models.portfolio import *
 from models.price import *
+from models.price_series import *
 from models.quote import *
+from models.return_stats import *
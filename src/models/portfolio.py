@@ -5,15 +5,9 @@
 # Imports
 import sys
 
-# Pandas
-import pandas as pd
-
 # NumPy
 import numpy as np
 
-# SciPy
-import scipy.optimize as optimize
-
 # Enums
 from enums import *
 
@@ -23,6 +17,12 @@ from math import exp
 # PriceModel
 from models.price import *
 
+# PriceSeriesModel
+from models.price_series import *
+
+# ReturnStatsModel
+from models.return_stats import *
+
 # QuoteModel
 from models.quote import *
 
@@ -32,12 +32,8 @@ from utility import *
 # Mathematics
 from mathematics import *
 
-# Matplotlib
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-
 # Abstract: Model storing stock info and historical prices.
+#           Pandas, SciPy and Matplotlib are imported on first use to keep startup fast.
 
 class Portfolio:
 
@@ -49,8 +45,9 @@ class Portfolio:
         self.__name = name
         self.__symbol_map = {}
         self.__total_assets = 0
-        self.__expected_return = 0
-        self.__covariance = 0
+        self.__weights_stale = True
+        self.__stats = None
+        self.__unloaded_symbols = set()
 
         # Update assets
         self.update_assets()
@@ -62,22 +59,45 @@ class Portfolio:
     ##
 
     # update_assets:Void
-    # NOTE: - Updates the total asset count and weights of each quote.
+    # NOTE: - Rebuilds the symbol map and total asset count. Weights and statistics are recomputed lazily.
     def update_assets(self):
         self.__total_assets = 0
         self.__symbol_map = {}
         for quote in self.__quotes:
             self.__total_assets += quote.count
             self.__symbol_map[quote.symbol] = quote
-        if self.__total_assets > 0:
-            for quote in self.__quotes:
-                quote.weight = quote.count / self.__total_assets
-        else:
-            for quote in self.__quotes:
-                quote.weight = 0.0
-        market_data = self.get_market_data_tuple()
-        self.__expected_return = market_data[1]        # Set portfolio return
-        self.__covariance = market_data[2]             # Set portfolio covariance
+        self.__weights_stale = True
+
+    # update_weights:Void
+    # NOTE: - Updates the weight of each quote, if any count changed since the last update.
+    def update_weights(self):
+        if not self.__weights_stale:
+            return
+        for quote in self.__quotes:
+            quote.weight = quote.count / self.__total_assets if self.__total_assets > 0 else 0.0
+        self.__weights_stale = False
+
+    # update_statistics:ReturnStats
+    # NOTE: - Fetches a year of DAY history for every symbol on first use, then only for symbols added since.
+    # returns The portfolio's return statistics.
+    def update_statistics(self):
+        if self.__stats is None:
+            self.__stats = ReturnStats.from_series(self.get_history())
+            self.__unloaded_symbols = set()
+        for symbol in self.__unloaded_symbols:
+            if symbol in self.__symbol_map:
+                series = self.get_symbol_history(symbol)
+                self.__stats.add_symbol(symbol, series.time, series.close)
+        self.__unloaded_symbols = set()
+        return self.__stats
+
+    # add_bar:Void
+    # param time:float => Timestamp (seconds since epoch) of the bar.
+    # param closes:{String:float} => Map of symbols to close prices.
+    # NOTE: - Updates the return statistics incrementally, if they have been loaded.
+    def add_bar(self, time, closes):
+        if self.__stats is not None:
+            self.__stats.add_bar(time, closes)
 
     ##
     #
@@ -104,30 +124,41 @@ class Portfolio:
     # add_quote:Void
     # param quote:Quote => A quote object to add to the portfolio. Overwrites existing quotes.
     def add_quote(self, quote):
-        for i, q in enumerate(self.__quotes):
-            if q.symbol == quote.symbol:
-                self.__quotes[i].count += quote.count
-                self.update_assets()
-                return
-        self.__quotes.append(quote)
-        self.update_assets()
+        existing = self.__symbol_map.get(quote.symbol)
+        if existing is not None:
+            existing.count += quote.count
+        else:
+            self.__quotes.append(quote)
+            self.__symbol_map[quote.symbol] = quote
+            self.__unloaded_symbols.add(quote.symbol)
+        self.__total_assets += quote.count
+        self.__weights_stale = True
 
     # remove_quote:Void
     # param quoteOrSymbol:Quote => A quote object or symbol string to remove from the portfolio, if it exists.
+    # NOTE: - A quote removes up to its count of shares. A symbol removes every share.
     def remove_quote(self, quote_or_symbol):
-        for i, q in enumerate(self.__quotes):
-            if (isinstance(quote_or_symbol, Quote) and q.symbol == quote.symbol) or quote_or_symbol == q.symbol:
-                if isinstance(quote_or_symbol, Quote) and quote_or_symbol.count > self.__quotes[i].count:
-                    self.__quotes[i].count -= quote_or_symbol.count
-                else:
-                    self.__quotes.remove(i)
-                self.update_assets()
-                return
+        symbol = quote_or_symbol.symbol if isinstance(quote_or_symbol, Quote) else quote_or_symbol
+        existing = self.__symbol_map.get(symbol)
+        if existing is None:
+            return
+        if isinstance(quote_or_symbol, Quote) and quote_or_symbol.count < existing.count:
+            existing.count -= quote_or_symbol.count
+            self.__total_assets -= quote_or_symbol.count
+        else:
+            self.__quotes.remove(existing)
+            del self.__symbol_map[symbol]
+            self.__total_assets -= existing.count
+            self.__unloaded_symbols.discard(symbol)
+            if self.__stats is not None:
+                self.__stats.remove_symbol(symbol)
+        self.__weights_stale = True
 
     # set_name:Void
     # param quotes:[Quote] => A list of quote objects to set.
     def set_quotes(self, quotes):
         self.__quotes = quotes
+        self.__stats = None
         self.update_assets()
 
     # set_name:Void
@@ -141,9 +172,15 @@ class Portfolio:
     #
     ##
 
+    # get_name:String
+    # Returns the name of the portfolio.
+    def get_name(self):
+        return self.__name
+
     # get_quotes:[Quote]
     # Returns a list of quote objects in the portfolio.
     def get_quotes(self):
+        self.update_weights()
         return self.__quotes
 
     # get_symbols:[String]
@@ -154,24 +191,32 @@ class Portfolio:
     # get_expected_return:[Quote]
     # Returns a float percentage for the return of this portfolio.
     def get_expected_return(self):
-        return self.__expected_return
+        return self.get_statistics()[0]
 
     # get_covariance:[Quote]
     # Returns the float covariance of this portfolio.
     # NOTE: - If > 0, the stocks in this portfolio are interrelated. Otherwise, not.
     def get_covariance(self):
-        return self.__covariance
+        return self.get_statistics()[1]
 
-    # get_history:[String:[Price]]
+    # get_statistics:(float, float)
+    # Returns a tuple containing (portfolio_return, portfolio_covariance) for the current weights.
+    # NOTE: - Computed from running sums, so only symbols added since the last call are fetched.
+    def get_statistics(self):
+        self.update_weights()
+        stats = self.update_statistics()
+        return stats.portfolio_statistics([ self.__symbol_map[symbol].weight for symbol in stats.symbols ])
+
+    # get_history:[String:PriceSeries]
     # param symbol:String => String symbol of the instrument.
     # param interval:Span => Time in between each value. (default: DAY)
     # param span:Span => Range for the data to be returned. (default: YEAR)
     # param bounds:Span => The bounds to be included. (default: REGULAR)
-    # returns Map of symbols to lists of Price models.
+    # returns Map of symbols to PriceSeries models.
     def get_history(self, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
         historicals = {}
         for quote in self.__quotes:
-            historicals[quote.symbol] = list(map(lambda price: price, self.get_symbol_history(quote.symbol, interval, span, bounds)))
+            historicals[quote.symbol] = self.get_symbol_history(quote.symbol, interval, span, bounds)
         return historicals
 
     # get_history_tuple:([String:[Float:Price]], [Float])
@@ -182,43 +227,32 @@ class Portfolio:
     # returns Tuple containing: (map of symbols to map of float timestamps to Price models, list of all times in historicals map).
     def get_history_tuple(self, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
         historicals = {}
-        times = {}
-        time_list = []
-        for quote in self.__quotes:
-            hist_map = {}
-            hist_array = list(map(lambda price: price, self.get_symbol_history(quote.symbol, interval, span, bounds)))
-            for price in hist_array:
-                hist_map[price.time] = price
-                if price.time not in times:
-                    times[price.time] = True
-            historicals[quote.symbol] = hist_map
-        for time in times:
-            time_list.append(time)
-        time_list = sorted(time_list)
-        return (historicals, time_list)
-
-    # get_history_tuples:[[(time, open, close, high, low)]]
+        times = np.zeros(0)
+        for symbol, series in self.get_history(interval, span, bounds).items():
+            historicals[symbol] = series.as_map()
+            times = np.union1d(times, series.time)
+        return (historicals, times.tolist())
+
+    # get_history_tuples:[String:[(time, open, close, high, low)]]
     # param symbol:String => String symbol of the instrument.
     # param interval:Span => Time in between each value. (default: DAY)
     # param span:Span => Range for the data to be returned. (default: YEAR)
     # param bounds:Span => The bounds to be included. (default: REGULAR)
-    # returns List of price tuples with the time, volume, open, close, high, low for each time in the interval.
+    # returns Map of symbols to lists of price tuples with the time, open, close, high, low for each time in the interval.
     def get_history_tuples(self, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
         history = self.get_history(interval, span, bounds)
         for symbol in history:
-            history[symbol] = [ quote.as_tuple() for quote in history[quote] ]
+            history[symbol] = history[symbol].as_tuples()
         return history
 
-    # get_symbol_history:[Price]
+    # get_symbol_history:PriceSeries
     # param symbol:String => String symbol of the instrument.
     # param interval:Span => Time in between each value. (default: DAY)
     # param span:Span => Range for the data to be returned. (default: YEAR)
     # param bounds:Span => The bounds to be included. (default: REGULAR)
-    # returns List of Price models with the time, volume, open, close, high, low for each time in the interval.
+    # returns PriceSeries model with the time, volume, open, close, high, low for each time in the interval.
     def get_symbol_history(self, symbol, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
-        historicals = self.__query.get_history(symbol, interval, span, bounds)['historicals']
-        historicals = list(map(lambda h: Price(Utility.datetime_to_float(Utility.iso_to_datetime(h['begins_at'])), float(h['open_price']), float(h['close_price']), float(h['high_price']), float(h['low_price'])), historicals))
-        return historicals
+        return PriceSeries.from_columns(self.__query.get_history_columns(symbol, interval, span, bounds))
 
     # get_symbol_history_map:[Float:Price]
     # param symbol:String => String symbol of the instrument.
@@ -227,12 +261,7 @@ class Portfolio:
     # param bounds:Span => The bounds to be included. (default: REGULAR)
     # returns Map of float timestamps to prices for the given symbol.
     def get_symbol_history_map(self, symbol, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
-        historicals = self.__query.get_history(symbol, interval, span, bounds)['historicals']
-        historicals = list(map(lambda h: Price(Utility.datetime_to_float(Utility.iso_to_datetime(h['begins_at'])), float(h['open_price']), float(h['close_price']), float(h['high_price']), float(h['low_price'])), historicals))
-        history = {}
-        for price in historicals:
-            history[price.time] = price
-        return history
+        return self.get_symbol_history(symbol, interval, span, bounds).as_map()
 
     # get_portfolio_history:[Price]
     # param symbol:String => String symbol of the instrument.
@@ -253,28 +282,13 @@ class Portfolio:
     # param bounds:Span => The bounds to be included. (default: REGULAR)
     # returns A tuple containing (dataFrame, float, float, [float], [float]).
     def get_market_data_tuple(self, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        import pandas as pd
 
         # Create dataFrame with times as rows, symbols as columns, and close prices as data
         historicals = self.get_history(interval, span, bounds)
-        times = []
-        close_prices = []
-        weights = []
-        market_days = 0
-        for quote in self.__quotes:
-            t = []
-            close_prices = []
-            for price in historicals[quote.symbol]:
-                if len(times) is 0:
-                    t.append(price.time)
-                close_prices.append(price.close)
-            if len(times) is 0:
-                times = t
-                time_filled = True
-                market_days = len(times)
-            historicals[quote.symbol] = close_prices
-            weights.append(quote.weight)
-        df = pd.DataFrame(historicals)
-        df.index = times
+        self.update_weights()
+        weights = [ quote.weight for quote in self.__quotes ]
+        df = pd.DataFrame({ quote.symbol: pd.Series(historicals[quote.symbol].close, index=historicals[quote.symbol].time) for quote in self.__quotes })
 
         # Calculate the returns for the given data
         returns = Math.get_returns(df, df.shift(1))
@@ -314,6 +328,7 @@ class Portfolio:
     # NOTE: - Optimizes according to the sharp ratio with the Markowitz Model.
     # Returns A tuple with list of quotes with quantities that would produce the optimal portfolio for the given symbols, optimized return, and optimized covariance.
     def sharpe_optimization(self):
+        import scipy.optimize as optimize
         quote_count = len(self.__quotes)
 
         market_data = self.get_market_data_tuple()
@@ -321,6 +336,7 @@ class Portfolio:
         market_days = len(returns)
         portfolio_return = market_data[1]
         portfolio_covariance = market_data[2]
+        self.update_weights()
         weights = [ quote.weight for quote in self.__quotes ]
 
         def min_sharpe_function(weights, returns):
@@ -358,12 +374,17 @@ class Portfolio:
     # param is_candlestick_chart:Boolean => If true, plots a candlestick plot. Else, plots a line plot.
     # param legend_on:Boolean => If true, shows the legend. Else, hides the legend.
     def plot_historicals(self, is_candlestick_chart = True, legend_on = True):
+        import pandas as pd
+        import matplotlib as mpl
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as mpatches
+        import mpl_finance as mpf
 
         # Set Pandas properties
         pd.options.display.max_columns = 3000
         pd.options.display.max_rows = 3000
 
-        historicals_list = self.get_history_tuples()
+        historicals_list = list(self.get_history_tuples().values())
 
         colors = [Utility.get_random_hex() for historicals in historicals_list]
 
@@ -5,9 +5,6 @@
 # Imports
 import sys
 
-# Pandas
-import pandas as pd
-
 # NumPy
 import numpy as np
 
@@ -0,0 +1,131 @@
+# Anthony Krivonos
+# src/models/price_series.py
+
+# Imports
+import sys
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# PriceModel
+from models.price import *
+
+# Utility
+from utility import *
+
+# Abstract: Model storing a series of prices as contiguous NumPy columns, oldest first.
+#           Columns are exposed directly (no copies), and Price models are only built when indexed or iterated.
+
+class PriceSeries:
+
+    # __init__:Void
+    # param time:[float] => Timestamps (seconds since epoch) of each bar, ascending.
+    # param open:[float] => Open prices of each bar.
+    # param close:[float] => Close prices of each bar.
+    # param high:[float] => High prices of each bar.
+    # param low:[float] => Low prices of each bar.
+    # param volume:[float]? => Volume of each bar. Zeroes if None.
+    def __init__(self, time, open, close, high, low, volume = None):
+
+        # Set properties
+        self.time = np.ascontiguousarray(time, dtype=np.float64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.volume = np.ascontiguousarray(volume if volume is not None else np.zeros(len(self.time)), dtype=np.float64)
+
+    ##
+    #
+    #   MARK: - CONSTRUCTORS
+    #
+    ##
+
+    # from_columns:PriceSeries (static)
+    # param columns:{String:np.array} => Map of 'time', 'open', 'close', 'high', 'low' and optionally 'volume' to arrays.
+    # returns A price series backed by the given columns.
+    @staticmethod
+    def from_columns(columns):
+        return PriceSeries(columns['time'], columns['open'], columns['close'], columns['high'], columns['low'], columns.get('volume'))
+
+    # from_historicals:PriceSeries (static)
+    # param historicals:Dict => Raw dictionary returned from get_history(...) in Query.
+    # returns A price series for the given historicals, with timestamps parsed in a single vectorized pass.
+    @staticmethod
+    def from_historicals(historicals):
+        bars = historicals['historicals'] or []
+        return PriceSeries(
+            Utility.iso_to_timestamps([ bar['begins_at'] for bar in bars ]),
+            [ float(bar['open_price']) for bar in bars ],
+            [ float(bar['close_price']) for bar in bars ],
+            [ float(bar['high_price']) for bar in bars ],
+            [ float(bar['low_price']) for bar in bars ],
+            [ float(bar.get('volume') or 0.0) for bar in bars ]
+        )
+
+    ##
+    #
+    #   MARK: - ACCESSORS
+    #
+    ##
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        for i in range(len(self.time)):
+            yield self.price(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PriceSeries(self.time[index], self.open[index], self.close[index], self.high[index], self.low[index], self.volume[index])
+        return self.price(index)
+
+    def __str__(self):
+        return str([ str(price) for price in self ])
+
+    # price:Price
+    # param index:Integer => Index of the bar.
+    # returns A Price model for the bar at the given index.
+    def price(self, index):
+        return Price(float(self.time[index]), float(self.open[index]), float(self.close[index]), float(self.high[index]), float(self.low[index]))
+
+    # index_of:Integer
+    # param time:Float => Timestamp of the bar.
+    # returns The index of the bar at exactly the given time, or -1 if there is none.
+    def index_of(self, time):
+        i = int(np.searchsorted(self.time, time))
+        if i < len(self.time) and self.time[i] == time:
+            return i
+        return -1
+
+    # at:Price?
+    # param time:Float => Timestamp of the bar.
+    # returns The Price model at exactly the given time, or None.
+    def at(self, time):
+        i = self.index_of(time)
+        return self.price(i) if i >= 0 else None
+
+    # since:PriceSeries
+    # param time:Float => Earliest timestamp to include.
+    # returns A view of the bars at or after the given time.
+    def since(self, time):
+        return self[int(np.searchsorted(self.time, time)):]
+
+    # as_map:{Float:Price}
+    # returns Map of timestamps to Price models.
+    def as_map(self):
+        return { price.time: price for price in self }
+
+    # as_tuples:[(time, open, close, high, low)]
+    # returns List of price tuples in Quintuple order.
+    def as_tuples(self):
+        return list(zip(self.time.tolist(), self.open.tolist(), self.close.tolist(), self.high.tolist(), self.low.tolist()))
+
+    # as_matrix:np.array
+    # returns A (bars x 5) array with columns in Quintuple order.
+    def as_matrix(self):
+        return np.column_stack((self.time, self.open, self.close, self.high, self.low))
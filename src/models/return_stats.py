@@ -0,0 +1,192 @@
+# Anthony Krivonos
+# src/models/return_stats.py
+
+# Imports
+import sys
+
+# NumPy
+import numpy as np
+
+# Abstract: Running sums and co-moments of per-bar log returns for a set of symbols, aligned on one time axis.
+#           New bars and symbols update the sums incrementally; means and covariances are only derived when asked for.
+
+class ReturnStats:
+
+    # __init__:Void
+    # param window:Integer? => Maximum number of returns kept per symbol. The oldest are rolled off. Unbounded if None.
+    def __init__(self, window = None):
+        self.window = window
+        self.symbols = []
+        self.index = {}
+        self.times = np.zeros(0)
+        self.last_close = np.zeros(0)
+        self.sums = np.zeros(0)
+        self.products = np.zeros((0, 0))
+        self.__returns = np.zeros((0, 0))
+        self.__start = 0
+        self.__stop = 0
+
+    def __len__(self):
+        return self.__stop - self.__start
+
+    # from_series:ReturnStats (static)
+    # param series_map:{String:PriceSeries} => Map of symbols to price series.
+    # param window:Integer? => Maximum number of returns kept per symbol. Unbounded if None.
+    # returns Statistics over the union of every series' times, with missing closes forward-filled.
+    @staticmethod
+    def from_series(series_map, window = None):
+        stats = ReturnStats(window)
+        times = np.zeros(0)
+        for series in series_map.values():
+            times = np.union1d(times, series.time)
+        stats.times = times
+        for symbol, series in series_map.items():
+            stats.add_symbol(symbol, series.time, series.close)
+        return stats
+
+    ##
+    #
+    #   MARK: - UPDATERS
+    #
+    ##
+
+    # add_symbol:Void
+    # param symbol:String => Symbol to add. Replaces the symbol if it is already present.
+    # param time:[float] => Timestamps of the symbol's closes, ascending.
+    # param close:[float] => Close prices of the symbol.
+    # NOTE: Closes are forward-filled onto the existing time axis. The first symbol added defines the axis if it is empty.
+    def add_symbol(self, symbol, time, close):
+        if symbol in self.index:
+            self.remove_symbol(symbol)
+        time = np.asarray(time, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        if len(self.times) == 0:
+            self.times = time.copy()
+        positions = np.searchsorted(time, self.times, side='right') - 1
+        aligned = np.where(positions >= 0, close[np.maximum(positions, 0)], np.nan) if len(time) > 0 else np.full(len(self.times), np.nan)
+        returns = ReturnStats.log_returns(aligned[:-1], aligned[1:])
+        if self.window is not None:
+            returns = returns[-self.window:]
+
+        # The first symbol sizes the returns buffer
+        if len(self.symbols) == 0:
+            self.__returns = np.zeros((max(len(returns), 1), 0))
+            self.__start = 0
+            self.__stop = len(returns)
+        returns = returns[-len(self):] if len(self) > 0 else returns[:0]
+        padded = np.zeros(len(self.__returns))
+        padded[self.__start:self.__stop] = returns
+        current = self.__returns[self.__start:self.__stop]
+
+        # Co-moments of the new column with every existing column
+        cross = current.T.dot(returns)
+        diagonal = returns.dot(returns)
+        self.products = np.block([
+            [ self.products, cross[:, None] ],
+            [ cross[None, :], np.array([[ diagonal ]]) ]
+        ])
+        self.sums = np.append(self.sums, returns.sum())
+        self.last_close = np.append(self.last_close, aligned[-1] if len(aligned) > 0 else np.nan)
+        self.__returns = np.column_stack([ self.__returns, padded ])
+        self.index[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+
+    # remove_symbol:Void
+    # param symbol:String => Symbol to remove, if present.
+    def remove_symbol(self, symbol):
+        i = self.index.pop(symbol, None)
+        if i is None:
+            return
+        self.symbols.pop(i)
+        self.index = { s: j for j, s in enumerate(self.symbols) }
+        self.sums = np.delete(self.sums, i)
+        self.last_close = np.delete(self.last_close, i)
+        self.products = np.delete(np.delete(self.products, i, axis=0), i, axis=1)
+        self.__returns = np.delete(self.__returns, i, axis=1)
+        if len(self.symbols) == 0:
+            self.__init__(self.window)
+
+    # add_bar:Void
+    # param time:float => Timestamp of the bar. Ignored unless later than the last bar.
+    # param closes:{String:float} => Map of symbols to close prices. Missing symbols keep their last close.
+    def add_bar(self, time, closes):
+        if len(self.symbols) == 0 or (len(self.times) > 0 and time <= self.times[-1]):
+            return
+        close = self.last_close.copy()
+        for symbol, price in closes.items():
+            if symbol in self.index:
+                close[self.index[symbol]] = price
+        returns = ReturnStats.log_returns(self.last_close, close)
+        self.last_close = np.where(np.isnan(close), self.last_close, close)
+        self.times = np.append(self.times, time)
+
+        # Roll off the oldest return once the window is full
+        if self.window is not None and len(self) >= self.window:
+            oldest = self.__returns[self.__start]
+            self.sums -= oldest
+            self.products -= np.outer(oldest, oldest)
+            self.__start += 1
+        self.sums += returns
+        self.products += np.outer(returns, returns)
+        self.__append(returns)
+
+    # __append:Void
+    # param returns:[float] => Row of returns to append, doubling (or compacting) the buffer when it is full.
+    def __append(self, returns):
+        if self.__stop == len(self.__returns):
+            kept = self.__returns[self.__start:self.__stop]
+            capacity = max(2 * len(kept), 1) if self.__start == 0 else len(self.__returns)
+            buffer = np.zeros((capacity, len(self.symbols)))
+            buffer[:len(kept)] = kept
+            self.__returns = buffer
+            self.__start = 0
+            self.__stop = len(kept)
+        self.__returns[self.__stop] = returns
+        self.__stop += 1
+
+    # log_returns:np.array (static)
+    # param previous:[float] => Previous close prices.
+    # param current:[float] => Current close prices.
+    # returns Log returns from previous to current, with 0 wherever either price is missing.
+    @staticmethod
+    def log_returns(previous, current):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(np.asarray(current) / np.asarray(previous))
+        return np.where(np.isfinite(returns), returns, 0.0)
+
+    ##
+    #
+    #   MARK: - GETTERS
+    #
+    ##
+
+    # returns:np.array
+    # returns A (bars - 1) x symbols view of the kept returns, oldest first.
+    def returns(self):
+        return self.__returns[self.__start:self.__stop]
+
+    # mean:np.array
+    # returns The mean return of each symbol.
+    def mean(self):
+        return self.sums / len(self) if len(self) > 0 else np.zeros(len(self.symbols))
+
+    # covariance:np.array
+    # returns The symbols x symbols sample covariance matrix of the returns.
+    def covariance(self):
+        n = len(self)
+        if n < 2:
+            return np.zeros((len(self.symbols), len(self.symbols)))
+        mean = self.mean()
+        return (self.products - n * np.outer(mean, mean)) / (n - 1)
+
+    # portfolio_statistics:(float, float)
+    # param weights:[float] => Weight of each symbol, in the order of self.symbols.
+    # returns A tuple containing (portfolio_return, portfolio_covariance), each scaled by the number of bars.
+    def portfolio_statistics(self, weights):
+        if len(self.symbols) == 0:
+            return (0.0, 0.0)
+        weights = np.asarray(weights, dtype=np.float64)
+        bars = len(self) + 1
+        portfolio_return = self.mean().dot(weights) * bars
+        portfolio_covariance = np.sqrt(max(weights.dot(self.covariance() * bars).dot(weights), 0.0))
+        return (portfolio_return, portfolio_covariance)
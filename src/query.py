@@ -5,12 +5,28 @@
 # Imports
 import sys
 from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from Robinhood import Robinhood
 
 from enums import *
 from utility import *
 from models import *
+from cache import *
+from limiter import *
+from metrics import *
+
+# Maximum number of symbols sent in one bulk quotes request
+QUOTES_PER_REQUEST = 100
+
+# Number of threads screening fundamentals concurrently
+SCREEN_WORKERS = 8
+
+# Maximum number of fundamentals requests per second
+FUNDAMENTALS_RATE = 20
+
+# Maximum number of instrument IDs sent in one bulk instruments request
+INSTRUMENTS_PER_REQUEST = 50
 
 # Abstract: Offers query methods that act as a wrapper for the Robinhood API and convert the returned objects into workable models.
 
@@ -19,47 +35,88 @@ class Query:
     # __init__:Void
     # param email:String => Email of the Robinhood user.
     # param password:String => Password for the Robinhood user.
-    def __init__(self, email, password):
-        self.trader = Robinhood()
+    # param history_dir:String? => Directory to persist historical quotes in. If None, history is only cached in memory.
+    # param instruments_file:String? => File to persist instrument metadata in. If None, instruments are only cached in memory.
+    # param response_ttls:{String:Float}? => Map of endpoints ('quote', 'fundamentals', 'instrument', 'tag', 'news') to seconds their responses are cached for.
+    # param metrics:Metrics? => Registry recording the latency of every API call, by endpoint. Defaults to the shared registry.
+    # param trader:Any? => Client the API calls are made on, like a Recorder or Replayer from backends. Defaults to a live Robinhood client.
+    def __init__(self, email, password, history_dir = HISTORY_DIR, instruments_file = INSTRUMENTS_FILE, response_ttls = None, metrics = None, trader = None):
+        self.metrics = metrics if metrics is not None else Metrics.shared()
+        self.trader = self.metrics.instrument(trader if trader is not None else Robinhood(), 'query_request_seconds', 'endpoint')
         self.trader.login(username=email, password=password)
         self.email = email
         self.password = password
-
+        self.history = HistoryCache(history_dir)
+        self.price_latencies = []
+        self.responses = ResponseCache(response_ttls)
+        self.fundamentals_limiter = RateLimiter(FUNDAMENTALS_RATE)
+        self.instruments = InstrumentCache(instruments_file)
+        self.orders = OrderBook(self)
+        self.__async_client = None
+
+
+    # async_client:AsyncQuery
+    # NOTE: Created on first use, so aiohttp is only imported when asynchronous queries are needed.
+    # returns The asyncio client sharing this query's credentials and caches.
+    def async_client(self):
+        if self.__async_client is None:
+            from async_query import AsyncQuery
+            self.__async_client = AsyncQuery(self)
+        return self.__async_client
 
     ##           ##
     #   Getters   #
     ##           ##
 
 
-    # get_fundamentals_by_criteria:[String]
+    # get_fundamentals_by_criteria:[Dict[String:String]]
     # param price_range:(float, float) => High and low prices for the queried fundamentals.
-    # returns List of symbols that fit the given criteria.
+    # param tags:Tag|[Tag]? => Tag(s) to screen. If None, screens every instrument.
+    # returns List of fundamentals, each with its 'symbol', that fit the given criteria.
     def get_fundamentals_by_criteria(self, price_range = (0.00, sys.maxsize), tags = None):
-        all_symbols = []
-        if tags is not None and tags is not []:
-            if isinstance(tags, Enum):
+        return list(self.stream_fundamentals_by_criteria(price_range, tags))
+
+    # stream_fundamentals_by_criteria:Generator[Dict[String:String]]
+    # param price_range:(float, float) => High and low prices for the queried fundamentals.
+    # param tags:Tag|[Tag]? => Tag(s) to screen. If None, screens every instrument.
+    # param workers:Integer => Number of threads fetching fundamentals at once.
+    # NOTE: Symbols are de-duplicated across tags and fundamentals are fetched concurrently, rate limited and cached.
+    #       If the consumer stops early, pending fetches are cancelled without waiting for the ones in flight.
+    # returns Generator yielding fundamentals that fit the given criteria as soon as they are fetched.
+    def stream_fundamentals_by_criteria(self, price_range = (0.00, sys.maxsize), tags = None, workers = SCREEN_WORKERS):
+        if isinstance(tags, Enum):
+            tags = [ tags ]
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {}
+        try:
+            if tags:
+                all_symbols = []
+                for symbols in executor.map(self.__get_by_tag_safely, tags):
+                    all_symbols += symbols
+            else:
+                all_symbols = [ instrument['symbol'] for instrument in self.trader.instruments_all() ]
+            futures = { executor.submit(self.get_fundamentals, symbol): symbol for symbol in dict.fromkeys(all_symbols) }
+            for future in as_completed(futures):
                 try:
-                    all_symbols = self.get_by_tag(tag)
+                    fundamentals = future.result()
                 except Exception as e:
-                    pass
-            else:
-                for tag in tags:
-                    try:
-                        all_symbols += self.get_by_tag(tag)
-                    except Exception as e:
-                        pass
-        else:
-            all_symbols = [ instrument['symbol'] for instrument in self.trader.instruments_all() ]
-        queried_fundamentals = []
-        for symbol in all_symbols:
-            try:
-                fundamentals = self.get_fundamentals(symbol)
+                    continue
                 if fundamentals is not None and 'low' in fundamentals and 'high' in fundamentals and float(fundamentals['low'] or -1) >= price_range[0] and float(fundamentals['high'] or sys.maxsize + 1) <= price_range[1]:
-                    fundamentals['symbol'] = symbol
-                    queried_fundamentals.append(fundamentals)
-            except Exception as e:
-                continue
-        return queried_fundamentals
+                    fundamentals = Utility.merge_dicts(fundamentals, { 'symbol': futures[future] })
+                    yield fundamentals
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    # __get_by_tag_safely:[String]
+    # param tag:Tag => Type of tag to return the symbols by.
+    # returns Symbols for the given tag, or an empty list if the request failed.
+    def __get_by_tag_safely(self, tag):
+        try:
+            return self.get_by_tag(tag) or []
+        except Exception as e:
+            return []
 
     # get_symbols_by_criteria:[String]
     # param price_range:(float, float) => High and low prices for the queried symbols.
@@ -73,13 +130,37 @@ class Query:
     # param symbol:String => String symbol of the instrument to return.
     # returns Float value of the current price of the stock with the given symbol.
     def get_current_price(self, symbol):
-        return float(self.trader.quote_data(symbol)['last_trade_price'])
+        return float(self.get_quote(symbol)['last_trade_price'])
+
+    # get_current_prices:{String:Float}
+    # param symbols:[String] => List of string symbols to price.
+    # NOTE: Serves recently cached quotes, then sends one bulk quotes request per QUOTES_PER_REQUEST remaining symbols
+    #       and stores (symbol count, seconds) per request in price_latencies.
+    # returns Map of symbols to the float value of their current price. Symbols without a quote are left out.
+    def get_current_prices(self, symbols):
+        prices = {}
+        self.price_latencies = []
+        for symbol in dict.fromkeys(symbols):
+            quote = self.responses.get('quote', symbol)
+            if quote is not MISSING and quote is not None and quote.get('last_trade_price') is not None:
+                prices[symbol] = float(quote['last_trade_price'])
+        symbols = [ symbol for symbol in dict.fromkeys(symbols) if symbol not in prices ]
+        for i in range(0, len(symbols), QUOTES_PER_REQUEST):
+            chunk = symbols[i:i + QUOTES_PER_REQUEST]
+            start = time()
+            quotes = self.trader.quotes_data(chunk) or []
+            self.price_latencies.append((len(chunk), time() - start))
+            for quote in quotes:
+                if quote is not None and quote.get('last_trade_price') is not None:
+                    self.responses.set('quote', quote['symbol'], quote)
+                    prices[quote['symbol']] = float(quote['last_trade_price'])
+        return prices
 
     # get_quote:[String:String]
     # param symbol:String => String symbol of the instrument to return.
-    # returns Quote data for the instrument with the given symbol.
+    # returns Quote data for the instrument with the given symbol, cached for a few seconds.
     def get_quote(self, symbol):
-        return self.trader.quote_data(symbol)
+        return self.responses.fetch('quote', symbol, lambda: self.trader.quote_data(symbol))
 
     # get_quotes:[[String:String]]
     # param symbol:[String] => List of string symbols of the instrument to return.
@@ -91,13 +172,49 @@ class Query:
     # param symbol:String => String symbol of the instrument.
     # returns The instrument with the given symbol.
     def get_instrument(self, symbol):
-        return self.trader.instruments(symbol)[0] or None
+        instrument = self.instruments.get_by_symbol(symbol)
+        if instrument is None:
+            instrument = self.responses.fetch('instrument', symbol, lambda: self.trader.instruments(symbol)[0] or None)
+            if instrument is not None:
+                instrument = self.instruments.put(instrument)
+                self.instruments.save()
+        return instrument
 
     # stock_from_instrument_url:Dict[String:String]
     # param url:String => URL of instrument.
-    # returns Stock dictionary from the url of the instrument.
+    # returns Stock dictionary from the url of the instrument, served from the instrument cache.
     def stock_from_instrument_url(self, url):
-        return self.trader.stock_from_instrument_url(url)
+        return self.instruments.resolve(url, lambda url: self.responses.fetch('instrument', url, lambda: self.trader.stock_from_instrument_url(url)))
+
+    # symbol_from_instrument_url:String
+    # param url:String => URL of instrument.
+    # returns The symbol of the instrument at the given url.
+    def symbol_from_instrument_url(self, url):
+        return self.stock_from_instrument_url(url)['symbol']
+
+    # prewarm_instruments:Void
+    # param urls:[String] => URLs of instruments to cache.
+    # NOTE: Fetches every uncached instrument with bulk requests of INSTRUMENTS_PER_REQUEST IDs, falling back to one request each.
+    def prewarm_instruments(self, urls):
+        missing = [ url for url in dict.fromkeys(urls) if url not in self.instruments ]
+        for i in range(0, len(missing), INSTRUMENTS_PER_REQUEST):
+            chunk = missing[i:i + INSTRUMENTS_PER_REQUEST]
+            try:
+                ids = [ InstrumentCache.id_from_url(url) for url in chunk ]
+                base_url = chunk[0][:chunk[0].rindex(ids[0])]
+                with self.metrics.timer('query_request_seconds', ('endpoint', 'instruments')):
+                    instruments = self.trader.session.get(base_url + '?ids=' + ','.join(ids), timeout=15).json()['results']
+                for instrument in instruments:
+                    if instrument is not None:
+                        self.instruments.put(instrument)
+            except Exception as e:
+                Utility.warning("Could not prewarm instruments in bulk: " + str(e))
+            for url in chunk:
+                if url not in self.instruments:
+                    with self.metrics.timer('query_request_seconds', ('endpoint', 'instrument')):
+                        self.instruments.put(self.trader.session.get(url, timeout=15).json())
+        if len(missing) > 0:
+            self.instruments.save()
 
     # get_history:[[String:String]]
     # param symbol:String => String symbol of the instrument.
@@ -106,18 +223,43 @@ class Query:
     # param bounds:Span => The bounds to be included. (default: REGULAR)
     # returns Historical quote data for the instruments with the given symbols on a 5-minute, weekly interval.
     def get_history(self, symbol, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        return HistoryCache.historicals_from_columns(symbol, self.get_history_columns(symbol, interval, span, bounds))
+
+    # get_history_columns:{String:np.array}
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each value. (default: DAY)
+    # param span:Span => Range for the data to be returned. (default: YEAR)
+    # param bounds:Span => The bounds to be included. (default: REGULAR)
+    # returns Map of 'time', 'open', 'close', 'high', 'low' and 'volume' to arrays, served from the history cache.
+    def get_history_columns(self, symbol, interval = Span.DAY, span = Span.YEAR, bounds = Bounds.REGULAR):
+        return self.history.get(symbol, interval, span, bounds, self.__fetch_history)
+
+    # __fetch_history:[[String:String]]
+    # param symbol:String => String symbol of the instrument.
+    # param interval:Span => Time in between each value.
+    # param span:Span => Range for the data to be returned.
+    # param bounds:Span => The bounds to be included.
+    # returns Historical quote data straight from the API, bypassing the history cache.
+    def __fetch_history(self, symbol, interval, span, bounds):
         return self.trader.get_historical_quotes(symbol, interval.value, span.value, bounds.value)
 
     # get_news:[[String:String]]
     # param symbol:String => String symbol of the instrument.
     # returns News for the instrument with the given symbol.
     def get_news(self, symbol):
-        return self.trader.get_news(symbol)
+        return self.responses.fetch('news', symbol, lambda: self.trader.get_news(symbol))
 
     # get_fundamentals:Dict[String:String]
     # param symbol:String => String symbol of the instrument.
-    # returns Fundamentals for the instrument with the given symbol.
+    # returns Fundamentals for the instrument with the given symbol, cached for hours.
     def get_fundamentals(self, symbol):
+        return self.responses.fetch('fundamentals', symbol, lambda: self.__fetch_fundamentals(symbol))
+
+    # __fetch_fundamentals:Dict[String:String]
+    # param symbol:String => String symbol of the instrument.
+    # returns Fundamentals straight from the API, rate limited.
+    def __fetch_fundamentals(self, symbol):
+        self.fundamentals_limiter.acquire()
         return self.trader.get_fundamentals(symbol)
 
     # get_fundamentals:[String:String]
@@ -138,7 +280,12 @@ class Query:
     # param tag:Tag => Type of tag to return the quotes by.
     # returns Quotes for the given tag.
     def get_by_tag(self, tag):
-        return self.trader.get_tickers_by_tag(tag.value)
+        return self.responses.fetch('tag', tag.value, lambda: self.trader.get_tickers_by_tag(tag.value))
+
+    # response_stats:{String:{String:Integer}}
+    # returns Map of cached endpoints to their 'hits', 'misses' and 'coalesced' request counts.
+    def response_stats(self):
+        return self.responses.stats()
 
     # get_current_bid_price:Float
     # param symbol:String => String symbol of the quote.
@@ -163,10 +310,12 @@ class Query:
 
     # user_stock_portfolio:[String:String]
     # TODO: Better documentation.
+    # NOTE: Instruments missing from the cache after prewarming (e.g. evicted, or stored under another URL) are fetched one by one.
     # returns Stock perfolio for the user.
     def user_stock_portfolio(self):
         positions = self.trader.positions()['results'] or []
-        return list(map(lambda position: Utility.merge_dicts(position, self.trader.session.get(position['instrument'], timeout=15).json()), positions))
+        self.prewarm_instruments([ position['instrument'] for position in positions ])
+        return list(map(lambda position: Utility.merge_dicts(position, self.stock_from_instrument_url(position['instrument'])), positions))
 
     # user_portfolio:[String:String]
     # returns Positions for the logged in user.
@@ -240,14 +389,17 @@ class Query:
         return self.trader.order_history(None)
 
     # user_open_orders:[[String:String]]
-    # returns The open orders for the user
+    # returns The open orders for the user, after syncing orders updated since the last sync.
     def user_open_orders(self):
-        orders = self.trader.order_history(None)['results']
-        open_orders = []
-        for order in orders:
-            if order['state'] == 'queued':
-                open_orders.append(order)
-        return open_orders
+        self.orders.sync()
+        return self.orders.open_orders()
+
+    # user_todays_orders:[[String:String]]
+    # param side:Side? => Side of the orders to return. If None, returns both sides.
+    # returns The orders with a transaction today for the user, after syncing orders updated since the last sync.
+    def user_todays_orders(self, side = None):
+        self.orders.sync()
+        return self.orders.todays_orders(side)
 
     # user_account:[[String:String]]
     # returns The user's account.
@@ -308,11 +460,6 @@ class Query:
     # exec_cancel_open_orders:[String]
     # returns A list of string IDs for the cancelled orders.
     def exec_cancel_open_orders(self):
-        orders = self.trader.order_history(None)['results']
-        cancelled_order_ids = []
-        for order in orders:
-            if order['state'] == 'queued':
-                self.trader.cancel_order(order['id'])
-                cancelled_order_ids.append(order['id'])
-        return cancelled_order_ids
+        self.orders.sync()
+        return self.orders.cancel_open()
 
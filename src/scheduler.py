@@ -0,0 +1,175 @@
+# Anthony Krivonos
+# src/scheduler.py
+
+# Imports
+import sys
+import heapq
+import datetime
+import itertools
+import threading
+import traceback
+from time import time
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Abstract: Single-thread scheduler running timed actions from a priority queue of absolute deadlines.
+#           Repeating tasks are re-armed at start + k * interval, so ticks never drift by the action's runtime,
+#           and actions run one at a time, so a slow action can never overlap the next tick of any task.
+
+# Maximum number of seconds the scheduler thread sleeps before re-checking the wall clock
+MAX_WAIT = 60
+
+class ScheduledTask:
+
+    # __init__:Void
+    # param action:Function() => Function to call on each tick.
+    # param deadline:Float => Timestamp (seconds since epoch) of the first tick.
+    # param interval:Float? => Seconds between ticks. Runs once if None.
+    # param stop:Float? => Timestamp after which no ticks run. Repeats forever if None.
+    # param overrun:Overrun => What to do with ticks missed while actions were running.
+    def __init__(self, action, deadline, interval = None, stop = None, overrun = Overrun.SKIP):
+        self.action = action
+        self.deadline = deadline
+        self.interval = interval
+        self.stop = stop
+        self.overrun = overrun
+        self.runs = 0
+        self.overruns = 0
+        self.cancelled = False
+
+    # cancel:Void
+    # NOTE: Prevents any further ticks. Safe to call from any thread, including from within the action.
+    def cancel(self):
+        self.cancelled = True
+
+    # next_deadline:Float?
+    # param now:Float => Current timestamp.
+    # returns The timestamp of the next tick after the current one, or None if the task is done.
+    def next_deadline(self, now):
+        if self.interval is None or self.cancelled:
+            return None
+        deadline = self.deadline + self.interval
+        if deadline < now:
+            if self.overrun == Overrun.SKIP:
+                missed = int((now - deadline) // self.interval) + 1
+                self.overruns += missed
+                deadline += missed * self.interval
+            else:
+                self.overruns += 1
+        if self.stop is not None and deadline > self.stop:
+            return None
+        return deadline
+
+class Scheduler:
+
+    # Scheduler shared by every algorithm in the process (see shared)
+    __shared = None
+    __shared_lock = threading.Lock()
+
+    # __init__:Void
+    # param name:String => Name of the scheduler thread.
+    def __init__(self, name = 'Scheduler'):
+        self.name = name
+        self.__heap = []
+        self.__counter = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread = None
+
+    # shared:Scheduler (static)
+    # returns The process-wide scheduler, created on first use.
+    @staticmethod
+    def shared():
+        with Scheduler.__shared_lock:
+            if Scheduler.__shared is None:
+                Scheduler.__shared = Scheduler()
+            return Scheduler.__shared
+
+    # timestamp:Float? (static)
+    # param moment:datetime|datetime64|Float|None => A moment in time.
+    # returns The moment as seconds since epoch, or None.
+    @staticmethod
+    def timestamp(moment):
+        if moment is None:
+            return None
+        if isinstance(moment, datetime.datetime):
+            return moment.timestamp()
+        if isinstance(moment, np.datetime64):
+            return float(moment.astype('datetime64[ms]').astype(np.int64)) / 1000
+        return float(moment)
+
+    def __len__(self):
+        with self.__condition:
+            return len(self.__heap)
+
+    ##
+    #
+    #   MARK: - SCHEDULING
+    #
+    ##
+
+    # schedule:ScheduledTask
+    # param action:Function() => Function to call on each tick.
+    # param at:datetime|datetime64|Float|None => Moment of the first tick. Defaults to one interval from now, or now.
+    # param every:Float? => Seconds between ticks. Runs once if None.
+    # param until:datetime|datetime64|Float|None => Moment after which no ticks run. Repeats forever if None.
+    # param overrun:Overrun => What to do with ticks missed while actions were running. (default: SKIP)
+    # returns The scheduled task, which can be cancelled.
+    def schedule(self, action, at = None, every = None, until = None, overrun = Overrun.SKIP):
+        now = time()
+        deadline = Scheduler.timestamp(at) if at is not None else now + (every or 0)
+        task = ScheduledTask(action, deadline, every, Scheduler.timestamp(until), overrun)
+
+        # Repeating tasks that started in the past resume on their grid without counting as overruns
+        if every is not None and deadline < now:
+            task.deadline = deadline + np.ceil((now - deadline) / every) * every
+        if task.stop is not None and task.deadline > task.stop:
+            return task
+        self.__push(task)
+        return task
+
+    # __push:Void
+    # param task:ScheduledTask => Task to queue at its deadline, starting the scheduler thread if it is not running.
+    def __push(self, task):
+        with self.__condition:
+            heapq.heappush(self.__heap, (task.deadline, next(self.__counter), task))
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name=self.name)
+                self.__thread.start()
+            self.__condition.notify()
+
+    # __run:Void
+    # NOTE: Runs due tasks in deadline order. Exits once no tasks remain, so an idle scheduler holds no thread.
+    def __run(self):
+        while True:
+            with self.__condition:
+                while True:
+                    if len(self.__heap) == 0:
+                        self.__thread = None
+                        return
+                    deadline, _, task = self.__heap[0]
+                    if task.cancelled:
+                        heapq.heappop(self.__heap)
+                        continue
+                    wait = deadline - time()
+                    if wait <= 0:
+                        heapq.heappop(self.__heap)
+                        break
+                    self.__condition.wait(min(wait, MAX_WAIT))
+            self.__execute(task)
+
+    # __execute:Void
+    # param task:ScheduledTask => Due task to run and re-arm.
+    def __execute(self, task):
+        try:
+            task.runs += 1
+            task.action()
+        except Exception:
+            traceback.print_exc()
+        deadline = task.next_deadline(time())
+        if deadline is not None:
+            task.deadline = deadline
+            self.__push(task)
@@ -0,0 +1,226 @@
+# Anthony Krivonos
+# src/sessions.py
+
+# Imports
+import sys
+import os
+import datetime
+import threading
+
+# NumPy
+import numpy as np
+
+# Abstract: Market session calendar stored as sorted NumPy datetime64 (UTC) open and close arrays.
+#           Each year is computed once with pandas_market_calendars, persisted to disk, and then loaded from there,
+#           so lookups are binary searches over in-memory arrays.
+
+# Default directory for cached session calendars
+SESSIONS_DIR = os.path.join('.cache', 'sessions')
+
+class Sessions:
+
+    # Calendars shared by the whole process, by market (see shared)
+    __shared = {}
+    __shared_lock = threading.Lock()
+
+    # __init__:Void
+    # param market:String => Name of the market calendar, like "NYSE".
+    # param directory:String? => Directory to persist computed years in. If None, only keeps them in memory.
+    def __init__(self, market = 'NYSE', directory = SESSIONS_DIR):
+        self.market = market
+        self.directory = directory
+        self.opens = np.zeros(0, dtype='datetime64[s]')
+        self.closes = np.zeros(0, dtype='datetime64[s]')
+        self.early = np.zeros(0, dtype=bool)
+        self.__years = set()
+        self.__lock = threading.Lock()
+
+    # NOTE: Pickles only the configuration, so worker processes load years from disk.
+    def __getstate__(self):
+        return { 'market': self.market, 'directory': self.directory }
+
+    def __setstate__(self, state):
+        self.__init__(state['market'], state['directory'])
+
+    def __len__(self):
+        return len(self.opens)
+
+    # shared:Sessions (static)
+    # param market:String => Name of the market calendar.
+    # returns The process-wide calendar for the market, created on first use.
+    @staticmethod
+    def shared(market = 'NYSE'):
+        with Sessions.__shared_lock:
+            if market not in Sessions.__shared:
+                Sessions.__shared[market] = Sessions(market)
+            return Sessions.__shared[market]
+
+    # to_dt64:datetime64 (static)
+    # param moment:datetime|date|datetime64|Float|None => A moment in time. Naive datetimes are local time. If None, now.
+    # returns The moment as a UTC datetime64 in seconds.
+    @staticmethod
+    def to_dt64(moment = None):
+        if moment is None:
+            moment = datetime.datetime.now()
+        if isinstance(moment, np.datetime64):
+            return moment.astype('datetime64[s]')
+        if isinstance(moment, datetime.datetime):
+            moment = moment.timestamp()
+        elif isinstance(moment, datetime.date):
+            moment = datetime.datetime(moment.year, moment.month, moment.day).timestamp()
+        return np.datetime64(int(moment), 's')
+
+    # to_datetime:datetime (static)
+    # param dt64:datetime64 => A UTC datetime64.
+    # returns The moment as a naive local datetime.
+    @staticmethod
+    def to_datetime(dt64):
+        return datetime.datetime.fromtimestamp(int(dt64.astype('datetime64[s]').astype(np.int64)))
+
+    ##
+    #
+    #   MARK: - LOOKUPS
+    #
+    ##
+
+    # next_session:(datetime64, datetime64)
+    # param moment:datetime|datetime64|Float|None => A moment in time. If None, now.
+    # returns The (open, close) of the first session opening strictly after the moment.
+    def next_session(self, moment = None):
+        t = Sessions.to_dt64(moment)
+        i = self.__index(t, lambda: np.searchsorted(self.opens, t, side='right'))
+        return (self.opens[i], self.closes[i])
+
+    # next_open:datetime64
+    # param moment:datetime|datetime64|Float|None => A moment in time. If None, now.
+    # returns The first session open strictly after the moment.
+    def next_open(self, moment = None):
+        return self.next_session(moment)[0]
+
+    # session_index:Integer
+    # param moment:datetime|datetime64|Float|None => A moment in time. If None, now.
+    # returns The index of the session open at the moment, or -1 if the market is closed.
+    def session_index(self, moment = None):
+        t = Sessions.to_dt64(moment)
+        i = self.__index(t, lambda: np.searchsorted(self.opens, t, side='right') - 1)
+        return i if i >= 0 and t < self.closes[i] else -1
+
+    # is_open:Boolean
+    # param moment:datetime|datetime64|Float|None => A moment in time. If None, now.
+    # returns True if the market is open at the moment.
+    def is_open(self, moment = None):
+        return self.session_index(moment) >= 0
+
+    # is_early_close:Boolean
+    # param moment:datetime|datetime64|Float|None => A moment during a session. If None, now.
+    # returns True if the market is open at the moment and closes early that day.
+    def is_early_close(self, moment = None):
+        i = self.session_index(moment)
+        return i >= 0 and bool(self.early[i])
+
+    # sessions_between:(np.array, np.array, np.array)
+    # param start:datetime|datetime64|Float => Start of the range.
+    # param stop:datetime|datetime64|Float => End of the range.
+    # returns (opens, closes, early) arrays of the sessions overlapping [start, stop].
+    def sessions_between(self, start, stop):
+        a = Sessions.to_dt64(start)
+        b = Sessions.to_dt64(stop)
+        self.load_years(range(Sessions.year_of(a), Sessions.year_of(b) + 1))
+        i = np.searchsorted(self.closes, a, side='right')
+        j = np.searchsorted(self.opens, b, side='right')
+        return (self.opens[i:j], self.closes[i:j], self.early[i:j])
+
+    # session_ids:np.array
+    # param times:[Float] => Timestamps (seconds since epoch), ascending.
+    # returns The index of the session containing or following each timestamp, for grouping bars by trading day.
+    def session_ids(self, times):
+        times = np.asarray(times, dtype=np.int64).astype('datetime64[s]')
+        if len(times) > 0:
+            self.load_years(range(Sessions.year_of(times[0]), Sessions.year_of(times[-1]) + 2))
+        return np.searchsorted(self.closes, times, side='left')
+
+    # opened_session_ids:np.array
+    # param times:[Float] => Timestamps (seconds since epoch), ascending.
+    # returns The index of the latest session opened at or before each timestamp, so bars after a close stay with their
+    #         session and bars before the first open are -1.
+    def opened_session_ids(self, times):
+        times = np.asarray(times, dtype=np.int64).astype('datetime64[s]')
+        if len(times) > 0:
+            self.load_years(range(Sessions.year_of(times[0]) - 1, Sessions.year_of(times[-1]) + 1))
+        return np.searchsorted(self.opens, times, side='right') - 1
+
+    # __index:Integer
+    # param t:datetime64 => The moment being looked up.
+    # param search:Function() => Binary search returning an index into the loaded arrays.
+    # returns The search result, after loading the years around the moment.
+    def __index(self, t, search):
+        year = Sessions.year_of(t)
+        if year not in self.__years or year + 1 not in self.__years:
+            self.load_years([ year - 1, year, year + 1 ])
+        return search()
+
+    # year_of:Integer (static)
+    # param t:datetime64 => A moment in time.
+    # returns The UTC year of the moment.
+    @staticmethod
+    def year_of(t):
+        return int(t.astype('datetime64[Y]').astype(np.int64)) + 1970
+
+    ##
+    #
+    #   MARK: - LOADING
+    #
+    ##
+
+    # load_years:Void
+    # param years:[Integer] => Years to load, from disk if persisted, otherwise computed and persisted.
+    def load_years(self, years):
+        with self.__lock:
+            missing = [ year for year in years if year not in self.__years ]
+            if len(missing) == 0:
+                return
+            opens, closes, early = [ self.opens ], [ self.closes ], [ self.early ]
+            for year in missing:
+                year_opens, year_closes, year_early = self.__load_year(year)
+                opens.append(year_opens)
+                closes.append(year_closes)
+                early.append(year_early)
+                self.__years.add(year)
+            opens = np.concatenate(opens)
+            order = np.argsort(opens, kind='stable')
+            self.opens = opens[order]
+            self.closes = np.concatenate(closes)[order]
+            self.early = np.concatenate(early)[order]
+
+    # __load_year:(np.array, np.array, np.array)
+    # param year:Integer => Year to load.
+    # returns (opens, closes, early) arrays for the year.
+    def __load_year(self, year):
+        path = os.path.join(self.directory, self.market + '-' + str(year) + '.npz') if self.directory is not None else None
+        if path is not None and os.path.isfile(path):
+            with np.load(path) as data:
+                return (data['opens'], data['closes'], data['early'])
+        sessions = Sessions.compute_year(self.market, year)
+        if path is not None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = path + '.' + str(threading.get_ident()) + '.tmp.npz'
+                np.savez(temp_path, opens=sessions[0], closes=sessions[1], early=sessions[2])
+                os.replace(temp_path, path)
+            except Exception as e:
+                sys.stderr.write("Could not save sessions for " + str(year) + ": " + str(e) + "\n")
+        return sessions
+
+    # compute_year:(np.array, np.array, np.array) (static)
+    # param market:String => Name of the market calendar.
+    # param year:Integer => Year to compute.
+    # returns (opens, closes, early) arrays for the year, computed with pandas_market_calendars.
+    @staticmethod
+    def compute_year(market, year):
+        import pandas_market_calendars as mcal
+        calendar = mcal.get_calendar(market)
+        schedule = calendar.schedule(str(year) + '-01-01', str(year) + '-12-31')
+        opens = schedule['market_open'].values.astype('datetime64[s]')
+        closes = schedule['market_close'].values.astype('datetime64[s]')
+        early = np.isin(schedule.index.values, calendar.early_closes(schedule).index.values)
+        return (opens, closes, early)
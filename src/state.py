@@ -0,0 +1,248 @@
+# Anthony Krivonos
+# src/state.py
+
+# Imports
+import sys
+import os
+import json
+import sqlite3
+import threading
+
+# Utility
+from utility import *
+
+# Abstract: Crash-safe key-value store for algorithm state that must survive restarts, like position ages.
+#           Values are kept as JSON in a SQLite database in write-ahead-log mode, so each point update is one indexed
+#           upsert and every write or batch of writes commits atomically: a crash never leaves a half-written state.
+
+# Default database file
+STATE_FILE = os.path.join('.cache', 'state.db')
+
+# Namespace recording which legacy files were imported
+IMPORTS_NAMESPACE = '__imports__'
+
+class StateStore:
+
+    # Stores shared by the whole process, by path (see shared)
+    __shared = {}
+    __shared_lock = threading.Lock()
+
+    # __init__:Void
+    # param path:String? => Database file, created if missing. If None, the store is kept in memory, e.g. for backtests.
+    # param durable:Boolean => If True, every commit is synced to disk before returning, surviving power loss as well
+    #                          as crashes. Otherwise commits survive crashes of the process. (default: False)
+    def __init__(self, path = STATE_FILE, durable = False):
+        self.path = path
+        self.durable = durable
+        self.__lock = threading.RLock()
+        if path is not None and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__connection = sqlite3.connect(path if path is not None else ':memory:', isolation_level=None, check_same_thread=False)
+        if path is not None:
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=' + ('FULL' if durable else 'NORMAL'))
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+
+    # NOTE: Pickles only the configuration, so worker processes open their own connection.
+    def __getstate__(self):
+        return { 'path': self.path, 'durable': self.durable }
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['durable'])
+
+    # shared:StateStore (static)
+    # param path:String => Database file.
+    # returns The process-wide store of the file, opened on first use.
+    @staticmethod
+    def shared(path = STATE_FILE):
+        with StateStore.__shared_lock:
+            if path not in StateStore.__shared:
+                StateStore.__shared[path] = StateStore(path)
+            return StateStore.__shared[path]
+
+    # close:Void
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    ##
+    #
+    #   MARK: - READING
+    #
+    ##
+
+    # get:Any
+    # param namespace:String => Namespace of the key, like 'no_day_trades/age/Portfolio'.
+    # param key:String => Key within the namespace.
+    # param default:Any => Value returned if the key is missing.
+    # param type:Type? => Type the value is converted to, like int. Values that cannot be converted return default.
+    # returns The stored value, with its JSON type, or default.
+    def get(self, namespace, key, default = None, type = None):
+        with self.__lock:
+            row = self.__connection.execute('SELECT value FROM state WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        if row is None:
+            return default
+        return StateStore.__convert(json.loads(row[0]), type, default)
+
+    # items:{String:Any}
+    # param namespace:String => Namespace to read.
+    # param type:Type? => Type every value is converted to. Values that cannot be converted are skipped.
+    # returns Map of every key in the namespace to its value.
+    def items(self, namespace, type = None):
+        with self.__lock:
+            rows = self.__connection.execute('SELECT key, value FROM state WHERE namespace = ?', (namespace,)).fetchall()
+        items = {}
+        for key, value in rows:
+            value = StateStore.__convert(json.loads(value), type, None)
+            if value is not None:
+                items[key] = value
+        return items
+
+    # __contains__:Boolean
+    # param item:(String, String) => Namespace and key.
+    def __contains__(self, item):
+        namespace, key = item
+        with self.__lock:
+            return self.__connection.execute('SELECT 1 FROM state WHERE namespace = ? AND key = ?', (namespace, key)).fetchone() is not None
+
+    # __convert:Any (static)
+    # returns The value converted to the type, or default if it cannot be.
+    @staticmethod
+    def __convert(value, type, default):
+        if type is None or value is None:
+            return value
+        try:
+            return type(value)
+        except (TypeError, ValueError):
+            return default
+
+    ##
+    #
+    #   MARK: - WRITING
+    #
+    ##
+
+    # set:Void
+    # param namespace:String => Namespace of the key.
+    # param key:String => Key within the namespace.
+    # param value:Any => JSON-serializable value.
+    # NOTE: Commits atomically.
+    def set(self, namespace, key, value):
+        with self.transaction() as transaction:
+            transaction.set(namespace, key, value)
+
+    # update:Void
+    # param namespace:String => Namespace of the keys.
+    # param values:{String:Any} => Map of keys to JSON-serializable values to set.
+    # param deleted:[String]? => Keys to delete.
+    # NOTE: Commits every change at once, or none of them.
+    def update(self, namespace, values, deleted = None):
+        with self.transaction() as transaction:
+            for key, value in values.items():
+                transaction.set(namespace, key, value)
+            for key in (deleted or []):
+                transaction.delete(namespace, key)
+
+    # replace:Void
+    # param namespace:String => Namespace to replace.
+    # param values:{String:Any} => Map of keys to JSON-serializable values the namespace holds afterwards.
+    # NOTE: Commits atomically.
+    def replace(self, namespace, values):
+        with self.transaction() as transaction:
+            transaction.clear(namespace)
+            for key, value in values.items():
+                transaction.set(namespace, key, value)
+
+    # delete:Void
+    # param namespace:String => Namespace of the key.
+    # param key:String => Key to delete, if it exists.
+    def delete(self, namespace, key):
+        with self.transaction() as transaction:
+            transaction.delete(namespace, key)
+
+    # transaction:StateTransaction
+    # NOTE: Use as `with store.transaction() as transaction: ...`. Changes made through the transaction are committed
+    #       together when the block exits, or rolled back if it raises. Other threads wait for the block to finish.
+    # returns A context manager for one atomic commit.
+    def transaction(self):
+        return StateTransaction(self.__connection, self.__lock)
+
+    ##
+    #
+    #   MARK: - IMPORTING
+    #
+    ##
+
+    # import_file:Boolean
+    # param namespace:String => Namespace the file's keys are imported into.
+    # param file_name:String => Legacy file of 'key=value' lines, as written by Utility.set_file_from_dict.
+    # param type:Type? => Type every value is converted to, like int. Values that cannot be converted are skipped.
+    # NOTE: Imports each file once per namespace, in one commit, without overwriting keys already in the store. The file
+    #       is left as is.
+    # returns True if the file was imported now.
+    def import_file(self, namespace, file_name, type = None):
+        marker = os.path.abspath(file_name)
+        if not os.path.isfile(file_name) or self.get(IMPORTS_NAMESPACE, marker) == namespace:
+            return False
+        values = {}
+        for key, value in Utility.get_file_as_dict(file_name).items():
+            value = StateStore.__convert(value, type, None)
+            if value is not None:
+                values[key] = value
+        with self.transaction() as transaction:
+            for key, value in values.items():
+                if transaction.get(namespace, key) is None:
+                    transaction.set(namespace, key, value)
+            transaction.set(IMPORTS_NAMESPACE, marker, namespace)
+        return True
+
+class StateTransaction:
+
+    # __init__:Void
+    # param connection:sqlite3.Connection => Connection of the store, in autocommit mode.
+    # param lock:RLock => Lock of the store.
+    def __init__(self, connection, lock):
+        self.__connection = connection
+        self.__lock = lock
+
+    def __enter__(self):
+        self.__lock.acquire()
+        try:
+            self.__connection.execute('BEGIN IMMEDIATE')
+        except:
+            self.__lock.release()
+            raise
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        try:
+            self.__connection.execute('COMMIT' if error_type is None else 'ROLLBACK')
+        finally:
+            self.__lock.release()
+        return False
+
+    # get:Any
+    # param namespace:String => Namespace of the key.
+    # param key:String => Key within the namespace.
+    # returns The value as of this transaction, or None.
+    def get(self, namespace, key):
+        row = self.__connection.execute('SELECT value FROM state WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    # set:Void
+    # param namespace:String => Namespace of the key.
+    # param key:String => Key within the namespace.
+    # param value:Any => JSON-serializable value.
+    def set(self, namespace, key, value):
+        self.__connection.execute('INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at', (namespace, key, json.dumps(value), Utility.now_timestamp()))
+
+    # delete:Void
+    # param namespace:String => Namespace of the key.
+    # param key:String => Key to delete, if it exists.
+    def delete(self, namespace, key):
+        self.__connection.execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+
+    # clear:Void
+    # param namespace:String => Namespace to empty.
+    def clear(self, namespace):
+        self.__connection.execute('DELETE FROM state WHERE namespace = ?', (namespace,))
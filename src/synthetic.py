@@ -0,0 +1,348 @@
+# Anthony Krivonos
+# src/synthetic.py
+
+# Imports
+import sys
+import os
+import json
+
+# NumPy
+import numpy as np
+
+# Enums
+from enums import *
+
+# Utility
+from utility import *
+
+# History Cache
+from cache.history import *
+
+# Abstract: Generator of synthetic, correlated multi-asset OHLC bars for load tests and backtests at universe sizes that
+#           cannot be fetched. Log prices follow geometric Brownian motion with a configurable covariance, plus Poisson
+#           jumps, overnight gaps and optionally missing bars. Bars are generated in chunks of whole sessions, so they can
+#           be streamed (see chunks) or written to memory-mapped files in the BacktestData format (see save).
+#           Acts as a Robinhood client for Query (see its trader parameter).
+
+# Regular session, as seconds after midnight UTC (9:30 to 16:00 ET, ignoring daylight saving time)
+SESSION_OPEN = 14 * 3600 + 30 * 60
+SESSION_SECONDS = int(6.5 * 3600)
+
+# Number of sessions in a year
+SESSIONS_PER_YEAR = 252
+
+# Largest number of values per (bars x symbols) array generated at once
+CHUNK_VALUES = 2 ** 20
+
+class SyntheticMarket:
+
+    # __init__:Void
+    # param symbols:Integer|[String] => Number of symbols, named 'S0000', 'S0001', ..., or their names.
+    # param sessions:Integer => Number of weekday sessions, ending today (or on end). (default: 252)
+    # param interval:Span => Time in between each bar: FIVE_MINUTE, TEN_MINUTE, DAY or WEEK. (default: FIVE_MINUTE)
+    # param seed:Integer => Seed of every random draw, so the same parameters always generate the same bars.
+    # param drift:Float|[Float] => Annualized drift of each symbol. (default: 0.05)
+    # param volatility:Float|[Float] => Annualized volatility of each symbol. Ignored if covariance is given. (default: 0.3)
+    # param correlation:Float|np.array => Correlation between every pair of symbols, drawn from one common market factor,
+    #                                     or a full correlation matrix. (default: 0.3)
+    # param covariance:np.array? => Annualized covariance matrix of the log returns, overriding volatility and correlation.
+    # param jump_rate:Float => Expected number of jumps per symbol per year. (default: 2)
+    # param jump_mean:Float => Mean of the log size of each jump. (default: 0)
+    # param jump_std:Float => Standard deviation of the log size of each jump. (default: 0.05)
+    # param gap_std:Float => Standard deviation of the log return between a session's close and the next open. (default: 0.01)
+    # param missing:Float => Probability of each bar being missing, like during a halt. (default: 0)
+    # param end:np.datetime64? => Date of the last session. Defaults to today.
+    # NOTE: A full matrix costs (symbols x symbols) per bar to correlate, while a scalar correlation costs (symbols).
+    def __init__(self, symbols = 100, sessions = SESSIONS_PER_YEAR, interval = Span.FIVE_MINUTE, seed = 0, drift = 0.05, volatility = 0.3, correlation = 0.3, covariance = None, jump_rate = 2.0, jump_mean = 0.0, jump_std = 0.05, gap_std = 0.01, missing = 0.0, end = None):
+        self.symbols = [ 'S%04d' % i for i in range(symbols) ] if isinstance(symbols, int) else list(symbols)
+        self.index = { symbol: i for i, symbol in enumerate(self.symbols) }
+        self.interval = interval
+        self.seed = seed
+        self.jump_rate = jump_rate
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        self.gap_std = gap_std
+        self.missing = missing
+        self.headers = {}
+        count = len(self.symbols)
+
+        # Per-bar volatility and drift of every symbol, and how its noise is correlated
+        self.__correlation = None
+        self.__factor = 0.0
+        if covariance is not None:
+            covariance = np.asarray(covariance, dtype=np.float64)
+            volatility = np.sqrt(np.diag(covariance))
+            self.__correlation = np.linalg.cholesky(covariance / np.outer(volatility, volatility))
+        elif np.ndim(correlation) == 2:
+            self.__correlation = np.linalg.cholesky(np.asarray(correlation, dtype=np.float64))
+        else:
+            self.__factor = float(correlation)
+        self.__dt = SyntheticMarket.year_fraction(interval)
+        self.__volatility = np.broadcast_to(np.asarray(volatility, dtype=np.float64), (count,)) * np.sqrt(self.__dt)
+        self.__drift = (np.broadcast_to(np.asarray(drift, dtype=np.float64), (count,)) - 0.5 * (self.__volatility ** 2) / self.__dt) * self.__dt
+
+        # Starting prices and typical volumes
+        rng = np.random.default_rng([ seed, 0 ])
+        self.__start = np.exp(rng.uniform(np.log(2.0), np.log(200.0), count))
+        self.__volume = np.exp(rng.uniform(np.log(1e5), np.log(1e7), count)) * self.__dt * SESSIONS_PER_YEAR
+
+        # Time axis
+        self.times = SyntheticMarket.session_times(sessions, interval, end)
+        self.block_bars = SyntheticMarket.bars_per_session(interval)
+        self.bar_count = len(self.times)
+        self.__arrays = None
+        self.__saved = None
+
+    ##
+    #
+    #   MARK: - TIME AXIS
+    #
+    ##
+
+    # bars_per_session:Integer (static)
+    # param interval:Span => Time in between each bar.
+    # returns The number of bars in a regular session, or 1 for daily and weekly bars.
+    @staticmethod
+    def bars_per_session(interval):
+        if interval in [ Span.DAY, Span.WEEK ]:
+            return 1
+        return SESSION_SECONDS // Utility.span_to_seconds(interval)
+
+    # year_fraction:Float (static)
+    # param interval:Span => Time in between each bar.
+    # returns The fraction of a trading year spanned by one bar.
+    @staticmethod
+    def year_fraction(interval):
+        if interval == Span.WEEK:
+            return 5.0 / SESSIONS_PER_YEAR
+        return 1.0 / SESSIONS_PER_YEAR / SyntheticMarket.bars_per_session(interval)
+
+    # session_times:np.array (static)
+    # param sessions:Integer => Number of weekday sessions.
+    # param interval:Span => Time in between each bar.
+    # param end:np.datetime64? => Date of the last session. Defaults to today.
+    # NOTE: Holidays are not skipped. Daily bars begin at midnight UTC and weekly bars on Mondays, like Robinhood's.
+    # returns Timestamps of every bar, in seconds.
+    @staticmethod
+    def session_times(sessions, interval, end = None):
+        end = np.datetime64('today', 'D') if end is None else np.datetime64(end, 'D')
+        dates = np.busday_offset(end, -np.arange(sessions)[::-1], roll='backward').astype('datetime64[s]').astype(np.int64)
+        if interval == Span.DAY:
+            return dates.astype(np.float64)
+        if interval == Span.WEEK:
+            return np.unique((dates - WEEK_OFFSET) // 604800 * 604800 + WEEK_OFFSET).astype(np.float64)
+        return (dates[:, None] + SESSION_OPEN + np.arange(SyntheticMarket.bars_per_session(interval)) * Utility.span_to_seconds(interval)).ravel().astype(np.float64)
+
+    ##
+    #
+    #   MARK: - GENERATING
+    #
+    ##
+
+    # chunks:Generator
+    # param chunk_values:Integer => Largest number of values per (bars x symbols) array, bounding the memory used.
+    # NOTE: Every chunk holds whole sessions, and each session is drawn from its own seed, so the bars do not depend on the
+    #       chunk size. Missing bars are NaN.
+    # returns A generator of columns, mapping 'time' to the chunk's timestamps and 'open', 'close', 'high', 'low' and
+    #         'volume' to arrays of shape (bars, symbols).
+    def chunks(self, chunk_values = CHUNK_VALUES):
+        count = len(self.symbols)
+        sessions_per_chunk = max(1, chunk_values // max(1, count * self.block_bars))
+        block_count = self.bar_count // self.block_bars
+        log_close = np.log(self.__start)
+        for first in range(0, block_count, sessions_per_chunk):
+            blocks = range(first, min(first + sessions_per_chunk, block_count))
+            returns = np.empty((len(blocks) * self.block_bars, count))
+            log_closes = np.empty_like(returns)
+            ranges = np.empty((len(blocks) * self.block_bars, count, 2))
+            noise = np.empty_like(returns)
+            absent = np.zeros(returns.shape, dtype=bool)
+            for i, block in enumerate(blocks):
+                rows = slice(i * self.block_bars, (i + 1) * self.block_bars)
+                rng = np.random.default_rng([ self.seed, 1, block ])
+                returns[rows] = self.__block_returns(rng)
+
+                # Chain the session's closes from the previous one's last close, opening with a gap
+                steps = returns[rows].copy()
+                if block > 0:
+                    steps[0] += rng.normal(0.0, self.gap_std, count)
+                log_closes[rows] = np.cumsum(steps, axis=0) + log_close
+                log_close = log_closes[rows.stop - 1].copy()
+                ranges[rows] = np.abs(rng.standard_normal((self.block_bars, count, 2)))
+                noise[rows] = rng.standard_normal((self.block_bars, count))
+                if self.missing > 0:
+                    absent[rows] = rng.random((self.block_bars, count)) < self.missing
+
+            columns = SyntheticMarket.__bars(np.exp(log_closes - returns), np.exp(log_closes), ranges, noise, returns, self.__volatility, self.__volume)
+            columns['time'] = self.times[first * self.block_bars:(first + len(blocks)) * self.block_bars]
+            if absent.any():
+                for name in [ 'open', 'close', 'high', 'low', 'volume' ]:
+                    columns[name][absent] = np.nan
+            yield columns
+
+    # __block_returns:np.array
+    # param rng:Generator => Generator of the session.
+    # returns Correlated log returns with jumps, of shape (block_bars, symbols).
+    def __block_returns(self, rng):
+        count = len(self.symbols)
+        shape = (self.block_bars, count)
+        if self.__correlation is not None:
+            shocks = rng.standard_normal(shape) @ self.__correlation.T
+        else:
+            shocks = np.sqrt(self.__factor) * rng.standard_normal((self.block_bars, 1)) + np.sqrt(1.0 - self.__factor) * rng.standard_normal(shape)
+        returns = self.__drift + self.__volatility * shocks
+        jumps = rng.poisson(self.jump_rate * self.__dt * returns.size)
+        if jumps > 0:
+            np.add.at(returns.ravel(), rng.integers(0, returns.size, jumps), rng.normal(self.jump_mean, self.jump_std, jumps))
+        return returns
+
+    # __bars:{String:np.array} (static)
+    # returns Columns of bars with the given opens and closes, highs and lows drawn past them by up to half a bar's
+    #         volatility, and volumes growing with the size of each return.
+    @staticmethod
+    def __bars(open, close, ranges, noise, returns, volatility, volume):
+        reach = 0.5 * volatility
+        return {
+            'open': open,
+            'close': close,
+            'high': np.maximum(open, close) * np.exp(ranges[:, :, 0] * reach),
+            'low': np.minimum(open, close) * np.exp(-ranges[:, :, 1] * reach),
+            'volume': np.floor(volume * np.exp(0.5 * noise - 0.125) * (1.0 + np.abs(returns) / volatility)) + 1.0
+        }
+
+    # arrays:{String:np.array}
+    # NOTE: Holds every bar in memory, so only use it for universes that fit. Generated once and then cached.
+    # returns Columns mapping 'time' to every timestamp and each field to an array of shape (bars, symbols).
+    def arrays(self):
+        if self.__arrays is None:
+            chunks = list(self.chunks())
+            self.__arrays = { name: np.concatenate([ chunk[name] for chunk in chunks ]) for name in chunks[0] } if len(chunks) > 0 else { name: np.zeros((0, len(self.symbols))) for name in [ 'open', 'close', 'high', 'low', 'volume' ] }
+            self.__arrays['time'] = self.times
+        return self.__arrays
+
+    ##
+    #
+    #   MARK: - PERSISTENCE
+    #
+    ##
+
+    # save:Void
+    # param directory:String => Directory to write times.npy, bars.npy, volume.npy and symbols.json into.
+    # param chunk_values:Integer => Largest number of values per array generated at once.
+    # NOTE: Streams the bars into memory-mapped files, so memory stays bounded by the chunk size. The result loads with
+    #       BacktestData.load(directory) with missing bars forward-filled, and later calls to columns(...) read from it.
+    def save(self, directory, chunk_values = CHUNK_VALUES):
+        from backtest.data import BacktestData
+        os.makedirs(directory, exist_ok=True)
+        count = len(self.symbols)
+        np.save(os.path.join(directory, 'times.npy'), self.times)
+        bars = np.lib.format.open_memmap(os.path.join(directory, 'bars.npy'), mode='w+', dtype=np.float64, shape=(self.bar_count, count, BacktestData.FIELD_COUNT))
+        volume = np.lib.format.open_memmap(os.path.join(directory, 'volume.npy'), mode='w+', dtype=np.float64, shape=(self.bar_count, count))
+        last = np.full((1, count, BacktestData.FIELD_COUNT), np.nan)
+        row = 0
+        for columns in self.chunks(chunk_values):
+            chunk = np.empty((len(columns['time']) + 1, count, BacktestData.FIELD_COUNT))
+            chunk[0] = last
+            for field, name in [ (BacktestData.OPEN, 'open'), (BacktestData.CLOSE, 'close'), (BacktestData.HIGH, 'high'), (BacktestData.LOW, 'low') ]:
+                chunk[1:, :, field] = columns[name]
+            BacktestData.forward_fill(chunk)
+            bars[row:row + len(chunk) - 1] = chunk[1:]
+            volume[row:row + len(chunk) - 1] = columns['volume']
+            last = chunk[-1:]
+            row += len(chunk) - 1
+        bars.flush()
+        volume.flush()
+        del bars, volume
+        with open(os.path.join(directory, 'symbols.json'), 'w') as file:
+            json.dump(self.symbols, file)
+        self.__saved = directory
+
+    ##
+    #
+    #   MARK: - COLUMNS
+    #
+    ##
+
+    # columns:{String:np.array}
+    # param symbol:String => Symbol of the market.
+    # param interval:Span? => Time in between each bar, resampled from the generated bars. Defaults to the generated interval.
+    # param span:Span? => Range of the bars to return, ending at the last one. Defaults to every bar.
+    # NOTE: Reads from the memory-mapped files once saved, and otherwise from arrays().
+    # returns Map of 'time', 'open', 'close', 'high', 'low' and 'volume' to the symbol's bars, skipping missing ones.
+    def columns(self, symbol, interval = None, span = None):
+        j = self.index[symbol]
+
+        # Only read the rows within the span, plus one coarser interval for the first bar to begin in
+        first = 0
+        if span is not None and self.bar_count > 0:
+            first = np.searchsorted(self.times, self.times[-1] - Utility.span_to_seconds(span) - Utility.span_to_seconds(interval or self.interval), side='right')
+        times = self.times[first:]
+
+        if self.__saved is not None:
+            from backtest.data import BacktestData
+            bars = np.load(os.path.join(self.__saved, 'bars.npy'), mmap_mode='r')[first:, j, :]
+            volume = np.load(os.path.join(self.__saved, 'volume.npy'), mmap_mode='r')[first:, j]
+            valid = ~np.isnan(volume)
+            columns = { 'time': times[valid], 'open': bars[valid, BacktestData.OPEN], 'close': bars[valid, BacktestData.CLOSE], 'high': bars[valid, BacktestData.HIGH], 'low': bars[valid, BacktestData.LOW], 'volume': volume[valid] }
+        else:
+            arrays = self.arrays()
+            valid = ~np.isnan(arrays['close'][first:, j])
+            columns = { name: values[first:, j][valid] for name, values in arrays.items() if name != 'time' }
+            columns['time'] = times[valid]
+        if interval is not None and interval != self.interval:
+            columns = HistoryCache.resample(columns, interval)
+        if span is not None and len(columns['time']) > 0:
+            keep = columns['time'] > columns['time'][-1] - Utility.span_to_seconds(span)
+            columns = { name: values[keep] for name, values in columns.items() }
+        return columns
+
+    # historicals:Dict
+    # param symbol:String => Symbol of the market.
+    # param interval:Span? => Time in between each bar. Defaults to the generated interval.
+    # param span:Span? => Range of the bars to return. Defaults to every bar.
+    # returns A dictionary shaped like the response of Robinhood.get_historical_quotes.
+    def historicals(self, symbol, interval = None, span = None):
+        historicals = HistoryCache.historicals_from_columns(symbol, self.columns(symbol, interval, span))
+        historicals['interval'] = (interval or self.interval).value
+        historicals['span'] = span.value if span is not None else None
+        return historicals
+
+    ##
+    #
+    #   MARK: - TRADER
+    #
+    ##
+
+    def login(self, username = None, password = None, *args, **kwargs):
+        return True
+
+    def logout(self, *args, **kwargs):
+        pass
+
+    def get_historical_quotes(self, symbol, interval, span, bounds = Bounds.REGULAR):
+        return self.historicals(symbol, Span(interval), Span(span))
+
+    def quote_data(self, symbol):
+        return { 'symbol': symbol, 'last_trade_price': str(self.columns(symbol)['close'][-1]) }
+
+    def quotes_data(self, symbols):
+        return [ self.quote_data(symbol) for symbol in symbols ]
+
+    def get_fundamentals(self, symbol):
+        columns = self.columns(symbol, span=Span.DAY)
+        return { 'low': str(columns['low'].min()), 'high': str(columns['high'].max()), 'volume': str(columns['volume'].sum()) }
+
+    def get_tickers_by_tag(self, tag):
+        return list(self.symbols)
+
+    def instruments_all(self):
+        return [ { 'symbol': symbol } for symbol in self.symbols ]
+
+    def order_history(self, order_id = None):
+        return { 'results': [], 'next': None }
+
+    def positions(self):
+        return { 'results': [] }
+
+    def get_account(self):
+        return { 'buying_power': '100000.00' }
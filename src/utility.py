@@ -4,28 +4,27 @@
 
 # Imports
 import sys
+import os
 import re, datetime
 from time import sleep, time
 import threading
 from termcolor import colored
 import random
 
-# Matplotlib
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import mpl_finance as mpf
-
-# Pandas
-import pandas as pd
-import pandas_market_calendars as mcal
-
 # NumPy
 import numpy as np
 
 # Enums
 from enums import *
 
+# Scheduler
+from scheduler import *
+
+# Sessions
+from sessions import *
+
 # Abstract: Utility methods for Quantico.
+#           Plotting and calendar dependencies are imported on first use to keep startup fast.
 
 class Utility:
 
@@ -115,11 +114,11 @@ class Utility:
     def next_month_date_string():
         today = datetime.date.today()
         try:
-            return today.replace(month=today.month+1)
-        except ValueError:
             if today.month == 12:
-                return today.replace(year=today.year+1, month=1)
-        return Utility.get_date_string(today + datetime.timedelta(days=30))
+                return Utility.get_date_string(today.replace(year=today.year+1, month=1))
+            return Utility.get_date_string(today.replace(month=today.month+1))
+        except ValueError:
+            return Utility.get_date_string(today + datetime.timedelta(days=30))
 
 
     # iso_to_datetime:datetime
@@ -141,12 +140,42 @@ class Utility:
     def float_to_datetime(date_float):
         return datetime.datetime.fromtimestamp(date_float)
 
+    # iso_to_timestamps:np.array(int64)
+    # param date_strings:[String] => List of ISO-formatted UTC date strings, like "2018-11-09T14:30:00Z".
+    # returns An array of integer timestamps (seconds since epoch), parsed in a single vectorized pass.
+    @staticmethod
+    def iso_to_timestamps(date_strings):
+        if len(date_strings) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.array(date_strings, dtype='U19').astype('datetime64[s]').astype(np.int64)
+
+    # timestamps_to_iso:[String]
+    # param timestamps:np.array(int64) => Array of integer timestamps (seconds since epoch).
+    # returns A list of ISO-formatted UTC date strings, the inverse of iso_to_timestamps.
+    @staticmethod
+    def timestamps_to_iso(timestamps):
+        return [ iso + 'Z' for iso in np.datetime_as_string(np.asarray(timestamps, dtype=np.int64).astype('datetime64[s]'), unit='s') ]
+
+    # span_to_seconds:Integer
+    # param span:Span => A span of time.
+    # returns The number of seconds in the given span.
+    @staticmethod
+    def span_to_seconds(span):
+        return {
+            Span.FIVE_MINUTE: 300,
+            Span.TEN_MINUTE: 600,
+            Span.DAY: 86400,
+            Span.WEEK: 604800,
+            Span.YEAR: 31536000
+        }[span]
+
     # get_quote_quintuple:(time, open, close, high, low) (static)
     # param quoteDict:String => A single quote dictionary returned from get_history(...)['historicals'] in Query.
     # returns A quintuple containing (time, open, close, high, low).
     @staticmethod
     def get_quote_quintuple(quoteDict):
-        return (mpl.dates.date2num(Utility.iso_to_datetime(quoteDict['begins_at'])), float(quoteDict['open_price']), float(quoteDict['close_price']), float(quoteDict['high_price']), float(quoteDict['low_price']))
+        import matplotlib.dates as mdates
+        return (mdates.date2num(Utility.iso_to_datetime(quoteDict['begins_at'])), float(quoteDict['open_price']), float(quoteDict['close_price']), float(quoteDict['high_price']), float(quoteDict['low_price']))
 
     # get_quintuples_from_historicals:(time, open, close, high, low) (static)
     # param historicals:[String:Any] => A historicals dict from the Query class.
@@ -160,80 +189,51 @@ class Utility:
     # returns A datetime object.
     @staticmethod
     def dt64_to_datetime(dt64):
-        return datetime.datetime.fromtimestamp(dt64.astype('O')/1e9)
+        return Sessions.to_datetime(dt64)
 
-    # sleep_then_execute:Void
-    # param time:String|datetime => If string, must look like "hh:mm". Otherwise, a datetime to wait until.
+    # sleep_then_execute:ScheduledTask
+    # param time:datetime => The datetime to wait until.
     # param action:lambda Function => The function to execute once the waiting period is over.
-    # param sec:Integer => The number of seconds until the sleep condition is checked again.
-    # returns The executed function.
+    # param sec:Integer => Unused; the action is scheduled for the exact datetime instead of polled for.
+    # returns The scheduled task, which can be cancelled.
     @staticmethod
     def sleep_then_execute(time, action, sec = 60):
-        Utility.set_interval(sec, lambda: action(), time, None)
+        return Scheduler.shared().schedule(action, at=time)
 
-    # execute_between_times:Void
+    # execute_between_times:ScheduledTask
     # param action:lambda Function => The function to execute on the secInterval before the time is reached.
-    # param start_time:datetime|None => The datetime for the execution to begin.
+    # param start_time:datetime|None => The datetime for the execution to begin. First executes sec seconds after it.
     # param stop_time:datetime|None => The datetime for the execution to end.
-    # param sec:Integer => The number of seconds until the sleep condition is checked again.
+    # param sec:Integer => The number of seconds between executions, measured from start_time so ticks never drift.
+    # param overrun:Overrun => What to do with executions missed while a slow action ran. (default: SKIP)
+    # returns The scheduled task, which can be cancelled.
     @staticmethod
-    def execute_between_times(action, start_time = None, stop_time = None, sec = 60):
-        Utility.set_interval(sec, lambda: action(), start_time, stop_time)
+    def execute_between_times(action, start_time = None, stop_time = None, sec = 60, overrun = Overrun.SKIP):
+        return Scheduler.shared().schedule(action, at=start_time + datetime.timedelta(seconds=sec) if start_time is not None else None, every=sec, until=stop_time, overrun=overrun)
 
-    # set_interval:Timer
+    # set_interval:ScheduledTask
     # param sec:Integer => Number of seconds between each execution of action.
     # param action:lambda Function => The function to execute on the secInterval before the time is reached.
     # param start_time:datetime|None => The datetime for the interval to begin.
     # param stop_time:datetime|None => The datetime for the interval to end.
+    # NOTE: Repeats every sec seconds from start_time until stop_time if stop_time is given. Otherwise, executes once,
+    #       sec seconds from now or at start_time. Every task runs on the shared scheduler thread.
+    # returns The scheduled task, which can be cancelled.
     @staticmethod
     def set_interval(sec, action, start_time = None, stop_time = None):
-        def call_action():
-            now = datetime.datetime.today()
-            if start_time is not None and stop_time is not None:
-                if start_time < now and stop_time >= now:
-                    Utility.set_interval(sec, action, start_time, stop_time)
-                    action()
-                elif start_time > now:
-                    Utility.set_interval(sec, action, start_time, stop_time)
-                elif stop_time < now:
-                    action()
-            elif start_time is None:
-                if stop_time is None:
-                    action()
-                elif stop_time >= now:
-                    Utility.set_interval(sec, action, None, stop_time)
-                    action()
-            else:
-                if start_time > now:
-                    Utility.set_interval(sec, action, start_time, None)
-                else:
-                    action()
-        t = threading.Timer(sec, call_action)
-        t.start()
-        return t
+        if stop_time is not None:
+            return Utility.execute_between_times(action, start_time, stop_time, sec)
+        if start_time is not None:
+            return Utility.sleep_then_execute(start_time, action)
+        return Scheduler.shared().schedule(action, at=datetime.datetime.now() + datetime.timedelta(seconds=sec))
 
     # get_next_market_hours:(datetime?, datetime?)
     # returns Datetime tuple with (next_market_open_datetime, next_market_close_datetime)
+    # NOTE: Looked up in the cached session calendar, so early closes are included.
     @staticmethod
     def get_next_market_hours(market = "NYSE"):
-        calendar = mcal.get_calendar(market)
-
-        # NOTE: Get all market days between today and next month, in case of weekends, breaks, and holidays.
-        schedule = calendar.schedule(Utility.today_date_string(), Utility.next_month_date_string())
-
-        start_times = schedule['market_open'].values
-        end_times = schedule['market_close'].values
-
-        current_date = np.datetime64(datetime.datetime.now())
-
-        if current_date < start_times[0]:
-            start_time = start_times[0]
-            end_time = end_times[0]
-        else:
-            start_time = start_times[1]
-            end_time = end_times[1]
-
-        return (Utility.dt64_to_datetime(start_time), Utility.dt64_to_datetime(end_time))
+        session = Sessions.shared(market).next_session()
+        return (Utility.dt64_to_datetime(session[0]), Utility.dt64_to_datetime(session[1]))
 
     # get_random_hex:String
     # returns Returns a random hexidecimal value with leading pound symbol.
@@ -255,34 +255,26 @@ class Utility:
     # set_file_from_dict:Void
     # param file_name:String => String name of the file to access.
     # param dict:Dict => Dictionary to set into file.
+    # NOTE: Writes a temporary file and atomically replaces the file with it, so a crash never leaves it half-written.
+    #       For state updated often, prefer StateStore (see state.py), which updates single keys without a rewrite.
     @staticmethod
     def set_file_from_dict(file_name, dict):
-        open(file_name, 'w').close()
-        file = open(file_name, "w")
-        for key, value in dict.items():
-            file.write(Utility.get_file_dict_string(key, value) + "\n")
-        file.close()
+        temp_name = file_name + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temp_name, "w") as file:
+            for key, value in dict.items():
+                file.write(Utility.get_file_dict_string(key, value) + "\n")
+        os.replace(temp_name, file_name)
 
     # set_in_file:Void
     # param file_name:String => String name of the file to access.
     # param key:String => Key to set in file.
     # param value:String => Value to set in file.
+    # NOTE: Rewrites the file atomically (see set_file_from_dict).
     @staticmethod
     def set_in_file(file_name, key, value):
-        written = False
-        file = open(file_name, "r")
-        lines = file.readlines()
-        for i, line in enumerate(lines):
-            if line.find(key, 0, line.find("=")) is not -1:
-                lines[i] = Utility.get_file_dict_string(key, value) + "\n"
-                written = True
-        file.close()
-        file = open(file_name, "w")
-        for line in lines:
-            file.write(line)
-        if not written:
-            file.write(Utility.get_file_dict_string(key, value) + "\n")
-        file.close()
+        file_dict = Utility.get_file_as_dict(file_name) if os.path.isfile(file_name) else {}
+        file_dict[key] = value
+        Utility.set_file_from_dict(file_name, file_dict)
 
     # get_from_file:String
     # param file_name:String => String name of the file to access.
@@ -290,29 +282,20 @@ class Utility:
     # returns Returns the found value for the given key or None.
     @staticmethod
     def get_from_file(file_name, key):
-        file = open(file_name, "r")
-        lines = file.readlines()
-        for i, line in enumerate(lines):
-            if line.find(key, 0, line.find("=")) is not -1:
-                file.close()
-                return line[line.find("=") + 1:len(line)]
-        file.close()
-        return None
+        return Utility.get_file_as_dict(file_name).get(key)
 
     # get_file_as_dict:Dict
     # param file_name:String => String name of the file to access.
-    # param key:String => Key to get from file.
-    # returns Returns the found value for the given key or None.
+    # returns Returns a dictionary of every key and value in the file.
     @staticmethod
     def get_file_as_dict(file_name):
-        file = open(file_name, "r")
         file_dict = {}
-        lines = file.readlines()
-        for i, line in enumerate(lines):
-            key = line[0:line.find("=")]
-            value = line[line.find("=") + 1:len(line) - 1]
-            file_dict[key] = value
-        file.close()
+        with open(file_name, "r") as file:
+            for line in file:
+                line = line.rstrip("\n")
+                if "=" in line:
+                    key, value = line.split("=", 1)
+                    file_dict[key] = value
         return file_dict
 
     # get_file_dict_string:String
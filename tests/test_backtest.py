@@ -0,0 +1,194 @@
+# Anthony Krivonos
+# tests/test_backtest.py
+
+# Imports
+import sys
+import os
+import io
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# NumPy
+import numpy as np
+
+# Local Imports
+from query import *
+from enums import *
+from metrics import *
+from models import *
+from algorithms import *
+from backtest import *
+from synthetic import *
+
+# Abstract: Tests of the backtest engine, run offline on hand-made bars.
+
+class HistoryAlgorithm(Algorithm):
+
+    # __init__:Void
+    # NOTE: Records the closes in the symbol's history at every event, by (step, event, field).
+    def __init__(self, query, portfolio, symbol):
+        self.symbol = symbol
+        self.seen = []
+        Algorithm.__init__(self, query, portfolio, name = "History", test = True, cash = 1000.00)
+
+    def universe(self):
+        return [ self.symbol ]
+
+    def while_market_open(self, cash = None, prices = None):
+        Algorithm.while_market_open(self, cash, prices)
+        self.__record('while_market_open')
+
+    def on_market_close(self, cash = None, prices = None):
+        Algorithm.on_market_close(self, cash, prices)
+        self.__record('on_market_close')
+
+    def __record(self, event):
+        closes = Algorithm.history(self, self.symbol, Span.DAY, Span.YEAR).close
+        self.seen.append((self.backtest.step, event, self.backtest.field, list(closes)))
+
+class OrderAlgorithm(Algorithm):
+
+    # __init__:Void
+    # param orders:[(Integer, Float?, Float?, GoodFor)] => Field of the first bar each buy is placed at, with its stop,
+    #                                                     limit and expiration.
+    def __init__(self, query, portfolio, symbol, orders):
+        self.symbol = symbol
+        self.pending = orders
+        Algorithm.__init__(self, query, portfolio, name = "Orders", test = True, cash = 1000.00)
+
+    def universe(self):
+        return [ self.symbol ]
+
+    def on_market_open(self, cash = None, prices = None):
+        Algorithm.on_market_open(self, cash, prices)
+        self.__place()
+
+    def while_market_open(self, cash = None, prices = None):
+        Algorithm.while_market_open(self, cash, prices)
+        self.__place()
+
+    def __place(self):
+        if self.backtest.step != 0:
+            return
+        for field, stop, limit, time in self.pending:
+            if field == self.backtest.field:
+                Algorithm.buy(self, self.symbol, 1, stop, limit, time)
+
+class CountingTrader:
+
+    # __init__:Void
+    # param trader:Any => Trader every call is passed through to.
+    # NOTE: Records the name of every call made while counting is True.
+    def __init__(self, trader):
+        self.trader = trader
+        self.counting = False
+        self.calls = []
+
+    def __getattr__(self, name):
+        value = getattr(self.trader, name)
+        if not callable(value):
+            return value
+        def call(*args, **kwargs):
+            if self.counting:
+                self.calls.append(name)
+            return value(*args, **kwargs)
+        return call
+
+class BacktestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.query = Query(None, None, history_dir=None, instruments_file=None, metrics=Metrics(), trader=SyntheticMarket(1, 1))
+
+    def tearDown(self):
+        Backtest.shared_data = None
+
+    # NOTE: Daily bars fire while_market_open at the low and the high, before the bar closes.
+    def test_daily_history_excludes_current_bar_until_close(self):
+        times = [ 1546439400.0, 1546525800.0, 1546612200.0 ]
+        bars = np.array([ [ [ 9.0, 10.0, 11.0, 8.0 ] ], [ [ 10.0, 20.0, 21.0, 9.0 ] ], [ [ 20.0, 30.0, 31.0, 19.0 ] ] ])
+        Backtest.shared_data = BacktestData(times, [ 'A' ], bars)
+        with redirect_stdout(io.StringIO()):
+            algorithm = HistoryAlgorithm(self.query, Portfolio(self.query, []), 'A')
+        for step, event, field, closes in algorithm.seen:
+            completed = [ 10.0, 20.0, 30.0 ][:step + 1 if field == BacktestData.CLOSE else step]
+            self.assertEqual(closes, completed, (step, event, field))
+        fields = [ field for step, event, field, closes in algorithm.seen if step == 0 ]
+        self.assertEqual(fields, [ BacktestData.LOW, BacktestData.HIGH, BacktestData.CLOSE ])
+
+    # NOTE: Every completed bar is fed into the portfolio's return statistics, never the bar in progress.
+    def test_bars_feed_portfolio_statistics(self):
+        portfolio = Portfolio(self.query, [ Quote('S0000', 1) ])
+        portfolio.get_statistics()
+        loaded = len(portfolio.update_statistics())
+        last = portfolio.update_statistics().times[-1]
+        times = last + 86400.0 * np.arange(1, 4)
+        bars = np.array([ [ [ 9.0, 10.0, 11.0, 8.0 ] ], [ [ 10.0, 20.0, 21.0, 9.0 ] ], [ [ 20.0, 30.0, 31.0, 19.0 ] ] ])
+        Backtest.shared_data = BacktestData(times, [ 'S0000' ], bars)
+        with redirect_stdout(io.StringIO()):
+            algorithm = HistoryAlgorithm(self.query, portfolio, 'S0000')
+        stats = portfolio.update_statistics()
+        self.assertEqual(len(stats), loaded + 3)
+        np.testing.assert_array_equal(stats.times[-3:], times)
+        np.testing.assert_allclose(stats.returns()[-2:, 0], np.log([ 2.0, 1.5 ]))
+
+    # fills:[(Integer, Float)]
+    # param orders:[(Integer, Float?, Float?, GoodFor)] => Buys placed on the first bar (see OrderAlgorithm).
+    # returns The (step, price) of every fill and the number of orders left open, after backtesting the orders.
+    def fills(self, orders):
+        times = [ 1546439400.0, 1546525800.0, 1546612200.0 ]
+        bars = np.array([ [ [ 10.0, 10.0, 11.0, 8.0 ] ], [ [ 9.0, 9.0, 9.5, 6.0 ] ], [ [ 9.0, 9.0, 9.0, 9.0 ] ] ])
+        Backtest.shared_data = BacktestData(times, [ 'A' ], bars)
+        with redirect_stdout(io.StringIO()):
+            algorithm = OrderAlgorithm(self.query, Portfolio(self.query, []), 'A', orders)
+        return ([ (int(fill['step']), float(fill['price'])) for fill in algorithm.backtest.ledger.get_fills() ], len(algorithm.backtest.orders))
+
+    # NOTE: A limit placed at the open fills within the same daily bar once its low trades through it.
+    def test_limit_placed_at_open_fills_within_bar(self):
+        self.assertEqual(self.fills([ (BacktestData.OPEN, None, 9.5, GoodFor.GOOD_FOR_DAY) ]), ([ (0, 9.5) ], 0))
+
+    # NOTE: A stop placed at the open triggers and fills within the same daily bar once its high trades through it.
+    def test_stop_placed_at_open_fills_within_bar(self):
+        self.assertEqual(self.fills([ (BacktestData.OPEN, 10.5, None, GoodFor.GOOD_FOR_DAY) ]), ([ (0, 10.5) ], 0))
+
+    # NOTE: An order placed at the high has only the close left, so it fills there if the close is better than its limit.
+    def test_limit_placed_at_high_fills_at_close(self):
+        self.assertEqual(self.fills([ (BacktestData.HIGH, None, 10.5, GoodFor.GOOD_FOR_DAY) ]), ([ (0, 10.0) ], 0))
+        self.assertEqual(self.fills([ (BacktestData.LOW, None, 7.5, GoodFor.GOOD_FOR_DAY) ]), ([], 0))
+
+    # NOTE: A good-for-day order that does not fill expires at the close, while a good-til-canceled one fills a later bar.
+    def test_good_for_day_expires_and_good_til_canceled_rests(self):
+        self.assertEqual(self.fills([ (BacktestData.OPEN, None, 7.0, GoodFor.GOOD_FOR_DAY) ]), ([], 0))
+        self.assertEqual(self.fills([ (BacktestData.OPEN, None, 7.0, GoodFor.GOOD_TIL_CANCELED) ]), ([ (1, 7.0) ], 0))
+        self.assertEqual(self.fills([ (BacktestData.OPEN, None, 5.0, GoodFor.GOOD_TIL_CANCELED) ]), ([], 1))
+
+    # NOTE: Candidates, top movers and open orders come from the preloaded data and the simulated order book, so once the
+    #       data is loaded a backtest never calls the API.
+    def test_run_makes_no_api_calls(self):
+        for algorithm_class in [ NoDayTradesAlgorithm, ShortIntensiveAlgorithm, TopMoversNoDayTradesAlgorithm ]:
+            trader = CountingTrader(SyntheticMarket(12, 20, Span.FIVE_MINUTE, seed=3))
+            query = Query(None, None, history_dir=None, instruments_file=None, metrics=Metrics(), trader=trader)
+            run = Backtest.run
+            def counted_run(backtest):
+                trader.counting = True
+                try:
+                    return run(backtest)
+                finally:
+                    trader.counting = False
+            with mock.patch.object(Backtest, 'run', counted_run), redirect_stdout(io.StringIO()):
+                algorithm = algorithm_class(query, Portfolio(query, [ Quote('S0000', 2) ]), test=True, cash=10000.00, params={ 'buy_range': (0.00, 1000000.00) })
+            self.assertGreater(len(algorithm.backtest.data.symbols), 1, algorithm_class.__name__)
+            self.assertEqual(trader.calls, [], algorithm_class.__name__)
+
+    # NOTE: Candidates are screened in the parent before the sweep preloads its data, so the workers can trade them.
+    def test_sweep_universe_includes_screened_candidates(self):
+        query = Query(None, None, history_dir=None, instruments_file=None, metrics=Metrics(), trader=SyntheticMarket(12, 20, Span.FIVE_MINUTE, seed=3))
+        with redirect_stdout(io.StringIO()):
+            universe = Sweep(NoDayTradesAlgorithm, query, [ Quote('S0000', 2) ], 1000.00).universe()
+        candidates = [ fund['symbol'] for fund in query.get_fundamentals_by_criteria((6.00, 40.00)) ]
+        self.assertGreater(len(candidates), 0)
+        self.assertEqual(sorted(universe), sorted(set([ 'S0000' ] + candidates)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Anthony Krivonos
+# tests/test_indicators.py
+
+# Imports
+import sys
+import os
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# NumPy
+import numpy as np
+
+# Local Imports
+from indicators import *
+from models import *
+
+# Abstract: Tests that every indicator's vectorized and incremental values are identical.
+
+# Indicators under test, by name
+INDICATORS = {
+    'sma': lambda: SMA(10),
+    'ema': lambda: EMA(10),
+    'rsi': lambda: RSI(14),
+    'std': lambda: RollingStd(10),
+    'bollinger': lambda: Bollinger(20, 2.0),
+    'zscore': lambda: ZScore(10),
+    'vwap': lambda: VWAP(),
+    'atr': lambda: ATR(14),
+    'window_mean': lambda: WindowMean(86400.0)
+}
+
+class IndicatorTest(unittest.TestCase):
+
+    # NOTE: Three sessions of 10-minute bars, the second one a half day.
+    def setUp(self):
+        rand = np.random.default_rng(0)
+        opens = [ 1546439400.0, 1546525800.0, 1546612200.0 ]
+        self.times = np.concatenate([ start + 600.0 * np.arange(count) for start, count in zip(opens, [ 39, 21, 39 ]) ])
+        close = 20.0 * np.exp(np.cumsum(rand.normal(0, 0.01, len(self.times))))
+        spread = close * rand.uniform(0.0, 0.01, len(self.times))
+        self.series = PriceSeries(self.times, close, close, close + spread, close - spread, rand.uniform(0, 1000, len(self.times)))
+
+    # values:np.array
+    # param values:Any => Values of an indicator, as arrays or as tuples of arrays like Bollinger's.
+    # returns The values as one float array, one row per bar.
+    def values(self, values):
+        return np.column_stack(values) if isinstance(values, tuple) else np.asarray(values, dtype=np.float64)
+
+    # NOTE: update(...) after each bar gives exactly the values compute(...) gives for every bar at once.
+    def test_update_matches_compute(self):
+        for name, factory in INDICATORS.items():
+            indicator = factory()
+            updated = [ indicator.update(float(self.series.close[i]), float(self.series.high[i]), float(self.series.low[i]), float(self.series.volume[i]), float(self.times[i])) for i in range(len(self.times)) ]
+            computed = self.values(factory().compute_series(self.series))
+            np.testing.assert_array_equal(self.values(np.array(updated)), computed, name)
+            self.assertEqual(indicator.ready, not np.any(np.isnan(computed[-1])), name)
+
+    # NOTE: Overlapping histories passed to update_series only advance the indicator by the bars it has not seen.
+    def test_update_series_skips_seen_bars(self):
+        for name, factory in INDICATORS.items():
+            indicator = factory()
+            for stop in range(10, len(self.times) + 1, 10):
+                start = max(stop - 30, 0)
+                indicator.update_series(PriceSeries(self.times[start:stop], self.series.open[start:stop], self.series.close[start:stop], self.series.high[start:stop], self.series.low[start:stop], self.series.volume[start:stop]))
+            indicator.update_series(self.series)
+            np.testing.assert_array_equal(np.asarray(indicator.value, dtype=np.float64), self.values(factory().compute_series(self.series))[-1], name)
+
+    # NOTE: The window mean averages however many bars fall within its window, e.g. the bars of a half-day session.
+    def test_window_mean_covers_window(self):
+        values = WindowMean(86400.0).compute_series(self.series)
+        for i in [ 0, 38, 39, 59, 60, 98 ]:
+            recent = self.series.close[:i + 1][self.times[:i + 1] > self.times[i] - 86400.0]
+            self.assertAlmostEqual(values[i], np.mean(recent), places=9)
+
+if __name__ == '__main__':
+    unittest.main()
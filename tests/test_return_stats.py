@@ -0,0 +1,53 @@
+# Anthony Krivonos
+# tests/test_return_stats.py
+
+# Imports
+import sys
+import os
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# NumPy
+import numpy as np
+
+# Local Imports
+from models import *
+
+# Abstract: Tests of the incremental return statistics.
+
+class ReturnStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        rand = np.random.default_rng(0)
+        self.times = np.arange(40) * 86400.0
+        self.closes = { symbol: 20.0 * np.exp(np.cumsum(rand.normal(0, 0.02, len(self.times)))) for symbol in [ 'A', 'B', 'C' ] }
+
+    # series:{String:PriceSeries}
+    # returns Series of every symbol over bars [start, stop).
+    def series(self, start, stop):
+        return { symbol: PriceSeries(self.times[start:stop], close[start:stop], close[start:stop], close[start:stop], close[start:stop]) for symbol, close in self.closes.items() }
+
+    # NOTE: Adding bars one at a time to a windowed ReturnStats rolls the oldest returns off its running sums.
+    def test_windowed_add_bar_matches_recompute(self):
+        window = 10
+        stats = ReturnStats.from_series(self.series(0, 25), window)
+        for i in range(25, 40):
+            stats.add_bar(self.times[i], { symbol: close[i] for symbol, close in self.closes.items() })
+            fresh = ReturnStats.from_series(self.series(i - window, i + 1), window)
+            self.assertEqual(len(stats), window)
+            np.testing.assert_allclose(stats.sums, fresh.sums, atol=1e-12)
+            np.testing.assert_allclose(stats.products, fresh.products, atol=1e-12)
+            np.testing.assert_allclose(stats.covariance(), fresh.covariance(), atol=1e-12)
+            np.testing.assert_allclose(stats.portfolio_statistics([ 0.5, 0.3, 0.2 ]), fresh.portfolio_statistics([ 0.5, 0.3, 0.2 ]), atol=1e-12)
+
+    # NOTE: Without a window, every added bar is kept, as if the whole history had been loaded at once.
+    def test_unbounded_add_bar_matches_recompute(self):
+        stats = ReturnStats.from_series(self.series(0, 5))
+        for i in range(5, 40):
+            stats.add_bar(self.times[i], { symbol: close[i] for symbol, close in self.closes.items() })
+        fresh = ReturnStats.from_series(self.series(0, 40))
+        np.testing.assert_allclose(stats.sums, fresh.sums, atol=1e-12)
+        np.testing.assert_allclose(stats.covariance(), fresh.covariance(), atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Anthony Krivonos
+# tests/test_state.py
+
+# Imports
+import sys
+import os
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# NumPy
+import numpy as np
+
+# Local Imports
+from query import *
+from metrics import *
+from models import *
+from state import *
+from algorithms import *
+from backtest import *
+from synthetic import *
+
+# Abstract: Tests of the state store and the position ages kept in it.
+
+class StateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.query = Query(None, None, history_dir=None, instruments_file=None, metrics=Metrics(), trader=SyntheticMarket(1, 1))
+        self.state = StateStore(None)
+        Backtest.shared_data = BacktestData([], [], np.zeros((0, 0, BacktestData.FIELD_COUNT)))
+
+    def tearDown(self):
+        Backtest.shared_data = None
+        self.state.close()
+
+    # algorithm:NoDayTradesAlgorithm
+    # param name:String => Name of the algorithm's portfolio.
+    # param age_file:String? => Legacy age file of the algorithm.
+    # returns An algorithm keeping its ages in the shared test store, initialized without backtesting.
+    def algorithm(self, name, age_file = None):
+        with redirect_stdout(io.StringIO()):
+            return NoDayTradesAlgorithm(self.query, Portfolio(self.query, [], name), age_file=age_file, test=True, state=self.state)
+
+    # NOTE: Algorithms trading different portfolios keep their ages apart, even in one store.
+    def test_ages_are_scoped_by_portfolio(self):
+        first, second = self.algorithm('First'), self.algorithm('Second')
+        first.set_age('A', 3)
+        second.set_ages({ 'A': 1, 'B': 2 })
+        first.load_ages()
+        second.load_ages()
+        self.assertEqual(first.age, { 'A': 3 })
+        self.assertEqual(second.age, { 'A': 1, 'B': 2 })
+        self.assertEqual(self.algorithm('First').age, { 'A': 3 })
+
+    # NOTE: Algorithms with different age files import and keep their ages apart, even with the same portfolio name.
+    def test_ages_are_scoped_by_age_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = [ os.path.join(directory, 'first.txt'), os.path.join(directory, 'second.txt') ]
+            for file_name, age in zip(files, [ 3, 5 ]):
+                with open(file_name, 'w') as file:
+                    file.write('A=' + str(age) + '\n')
+            first, second = self.algorithm('Portfolio', files[0]), self.algorithm('Portfolio', files[1])
+            self.assertEqual(first.age, { 'A': 3 })
+            self.assertEqual(second.age, { 'A': 5 })
+            self.assertEqual(self.algorithm('Portfolio').age, {})
+
+if __name__ == '__main__':
+    unittest.main()